@@ -14,6 +14,8 @@ import pandas as pd
 import json
 import logging
 import time
+import shutil
+import tempfile
 sys.path.append(os.path.abspath(os.path.join(os.getcwd(), '../..')))
 from genie_core.xml_processing.xml_utils import *
 from genie_core.xslt.xslt_utils import *
@@ -30,6 +32,14 @@ from genie_core.xslt.universal_xslt_analyzer import UniversalXSLTAnalyzer, Unive
 from genie_core.xslt.universal_user_interaction import UniversalUserInteraction, UserIntent
 from genie_core.xslt.universal_chunk_extractor import UniversalChunkExtractor
 from genie_core.xslt.universal_ai_processor import UniversalAIProcessor, pretty_print_xml
+from genie_core.xslt.batch_transformer import BatchTransformer
+from genie_core.xslt.coverage_map import build_coverage_map
+from genie_core.xslt.regression_runner import load_corpus, run_regression
+from genie_core.xslt.schema_validation import SchemaValidator
+from genie_core.xslt.stylesheet_cache import content_hash
+from genie_core.xslt.transform_profiler import profile_transform
+from genie_core.xslt.transform_sandbox import transform_sandbox
+from genie_core.xslt.xslt_updater_config import TestConfig, PerformanceConfig
 
 # Enhanced UI styling with advanced features
 st.markdown("""
@@ -440,6 +450,18 @@ def display_testing():
         
         if xslt:
             st.success(f"✅ Loaded: {xslt.name}")
+        
+        st.markdown("**📐 Output Schema (optional)**")
+        schema_files = st.file_uploader(
+            "Upload XSD schema files",
+            type=["xsd"],
+            accept_multiple_files=True,
+            help="Validate every output against this schema; include the files it imports or includes"
+        )
+        main_schema = None
+        if schema_files:
+            schema_names = [schema_file.name for schema_file in schema_files]
+            main_schema = st.selectbox("Main schema", schema_names) if len(schema_names) > 1 else schema_names[0]
     
     # Process files if both are uploaded
     if in_xml and xslt:
@@ -452,42 +474,118 @@ def display_testing():
         xslt_content = xslt.read().decode('utf-8')
         logs = []
         
-        # Process each XML file
-        for i, xml_file in enumerate(in_xml):
-            xml_content = xml_file.read().decode('utf-8')
-            
-            st.markdown(f"**📄 Result {i+1}: {xml_file.name}**")
-            
+        if len(in_xml) > TestConfig.MAX_BATCH_FILES:
+            st.warning(f"⚠️ Only the first {TestConfig.MAX_BATCH_FILES} files are transformed")
+        batch_files = in_xml[:TestConfig.MAX_BATCH_FILES]
+        
+        validator = None
+        if schema_files:
             try:
-                with st.spinner(f'Transforming {xml_file.name}...'):
-                    formatted_xml, logs = apply_xslt(xslt_content, xml_content, logs, None)
+                # Compiled schemas are cached by content hash, so reruns with the same files skip compilation
+                validator = SchemaValidator({schema_file.name: schema_file.getvalue() for schema_file in schema_files},
+                                            main=main_schema)
+            except Exception as e:
+                st.error(f"❌ The schema could not be compiled, outputs are not validated: {e}")
+        
+        # Large inputs are transformed file-to-file so they never become Python strings
+        streaming_limit = PerformanceConfig.STREAMING_THRESHOLD_MB * 1024 * 1024
+        large_files = [xml_file for xml_file in batch_files if xml_file.size > streaming_limit]
+        for i, xml_file in enumerate(large_files):
+            st.markdown(f"**📄 Large file: {xml_file.name}** ({xml_file.size / (1024 * 1024):.1f} MB)")
+            with tempfile.TemporaryDirectory() as work_dir:
+                source_path = os.path.join(work_dir, "input.xml")
+                output_path = os.path.join(work_dir, "output.xml")
+                with open(source_path, "wb") as source:
+                    shutil.copyfileobj(xml_file, source)
+                
+                with st.spinner(f'Transforming {xml_file.name} file-to-file...'):
+                    outcome = transform_sandbox.transform_file(xslt_content, source_path, output_path)
+                    report = outcome.output
+                    logs.extend(outcome.logs)
                 
-                if formatted_xml:
+                if outcome.success:
                     col1, col2 = st.columns([4, 1])
                     with col1:
                         st.success(f"✅ Transformation successful for {xml_file.name}")
+                        st.caption(f"{'🌊 Eligible for streaming (inferred)' if report['streaming_eligible'] else '📁 Not streamed'}: {report['reason']}")
+                        if validator is not None:
+                            validation = validator.validate(xml_file.name, Path(output_path))
+                            if validation.valid:
+                                st.caption("📐 Output is valid against the schema")
+                            else:
+                                st.warning(f"📐 {validation.error or f'{len(validation.violations)} schema violation(s)'}")
+                    with col2:
+                        with open(output_path, "rb") as output:
+                            st.download_button(
+                                label=f"📥 Download",
+                                data=output,
+                                file_name=f"transformed_{xml_file.name}",
+                                mime="application/xml",
+                                key=f"download_large_{i}"
+                            )
+                else:
+                    st.error(f"❌ Transformation failed for {xml_file.name} ({outcome.failure.reason}): {outcome.failure.detail}")
+        
+        # Transform the remaining XML files in parallel and render each result as it completes
+        inputs = [(xml_file.name, xml_file.getvalue()) for xml_file in batch_files if xml_file.size <= streaming_limit]
+        
+        if inputs:
+            batch = BatchTransformer(xslt_content, sandbox=transform_sandbox, validator=validator)
+            progress = st.progress(0.0, text="Transforming...")
+        
+            for i, result in enumerate(batch.run(inputs)):
+                progress.progress((i + 1) / len(inputs), text=f"Transformed {i + 1} of {len(inputs)} files")
+                logs.extend(result.logs)
+            
+                st.markdown(f"**📄 Result {i+1}: {result.name}**")
+            
+                if result.success:
+                    col1, col2 = st.columns([4, 1])
+                    with col1:
+                        note = f" (same content as {result.duplicate_of})" if result.duplicate_of else ""
+                        st.success(f"✅ Transformation successful for {result.name} in {result.latency_seconds * 1000:.0f} ms{note}")
+                        if result.validation is not None:
+                            if result.validation.valid:
+                                st.caption("📐 Output is valid against the schema")
+                            else:
+                                st.warning(f"📐 {result.validation.error or f'{len(result.validation.violations)} schema violation(s)'}")
                     with col2:
                         st.download_button(
                             label=f"📥 Download",
-                            data=formatted_xml,
-                            file_name=f"transformed_{xml_file.name}",
+                            data=result.output,
+                            file_name=f"transformed_{result.name}",
                             mime="application/xml",
                             key=f"download_{i}"
                         )
-                    
+                
                     # Show transformed XML in expandable section
-                    with st.expander(f"📖 View Transformed XML - {xml_file.name}"):
-                        st.code(formatted_xml, language='xml', line_numbers=True)
+                    with st.expander(f"📖 View Transformed XML - {result.name}"):
+                        st.code(result.output, language='xml', line_numbers=True)
                 else:
-                    st.error(f"❌ Transformation failed for {xml_file.name}")
-                    
-            except Exception as e:
-                st.markdown(f"""
-                <div class="error-card">
-                    <h4>❌ Error processing {xml_file.name}</h4>
-                    <code>{str(e)}</code>
-                </div>
-                """, unsafe_allow_html=True)
+                    st.markdown(f"""
+                    <div class="error-card">
+                        <h4>❌ Error processing {result.name}</h4>
+                        <p>Reason: {result.failure_reason or 'error'}</p>
+                        <code>{result.error}</code>
+                    </div>
+                    """, unsafe_allow_html=True)
+        
+            # Batch throughput and latency summary
+            summary = batch.summary.as_dict()
+            metric_cols = st.columns(4)
+            metric_cols[0].metric("Files/second", summary['files_per_second'])
+            metric_cols[1].metric("p50 latency (ms)", summary['latency_p50_ms'])
+            metric_cols[2].metric("p95 latency (ms)", summary['latency_p95_ms'])
+            metric_cols[3].metric("Failed", summary['failed'])
+            if summary['duplicates']:
+                st.caption(f"{summary['duplicates']} duplicate file(s) reused an earlier result")
+            
+            # Schema violations across the batch, grouped by element path
+            if batch.validation_report is not None:
+                validation = batch.validation_report.as_dict()
+                st.markdown(f"**📐 Schema validation:** {validation['valid']} of {validation['validated']} outputs valid")
+                if validation['violations']:
+                    st.dataframe(pd.DataFrame(batch.validation_report.as_records()), use_container_width=True)
         
         # Show logs if any
         if logs:
@@ -518,6 +616,82 @@ def display_testing():
             </div>
         </div>
         """, unsafe_allow_html=True)
+
+def get_pattern_analyzer(xslt):
+    """Analyzer of the stylesheet with its repeating patterns found, kept across reruns until the stylesheet changes"""
+    analyzer = st.session_state.get('pattern_analyzer')
+    if analyzer is None or analyzer.xslt_content != xslt:
+        analyzer = UniversalXSLTAnalyzer(xslt)
+        analyzer.find_all_repeating_patterns()
+        st.session_state.pattern_analyzer = analyzer
+    return analyzer
+
+def display_regression_check(original_xslt, updated_xslt):
+    """Compare the original and updated XSLT outputs over a corpus of XML inputs"""
+    with st.expander("🧪 Regression Check Against a Corpus"):
+        corpus_dir = st.text_input(
+            "Corpus directory",
+            help="Directory searched recursively for *.xml inputs"
+        )
+        corpus_files = st.file_uploader(
+            "...or upload XML inputs",
+            type=["xml"],
+            accept_multiple_files=True,
+            key="regression_files"
+        )
+        ignore_whitespace = st.checkbox(
+            "Ignore whitespace-only text",
+            value=True,
+            help="Drops text made only of whitespace, such as indentation; other text is compared exactly. "
+                 "Attribute order is always ignored; outputs are compared in canonical XML form"
+        )
+        use_coverage = st.checkbox(
+            "Only rerun inputs affected by the edit",
+            value=True,
+            help="Records which templates and loops each input reaches and skips inputs that never reach an edited one"
+        )
+        
+        if st.button("▶️ Run Regression Check", key="run_regression"):
+            inputs = []
+            if corpus_dir:
+                if os.path.isdir(corpus_dir):
+                    inputs.extend(load_corpus(corpus_dir))
+                else:
+                    st.error(f"❌ Directory not found: {corpus_dir}")
+            inputs.extend((xml_file.name, xml_file.getvalue()) for xml_file in corpus_files or [])
+            
+            if not inputs:
+                st.warning("⚠️ No XML inputs to check")
+                return
+            
+            coverage = None
+            if use_coverage:
+                with st.spinner('Mapping which templates each input reaches...'):
+                    coverage = build_coverage_map(original_xslt, inputs)
+            
+            with st.spinner(f'Running {len(inputs)} inputs through both stylesheets...'):
+                report = run_regression(original_xslt, updated_xslt, inputs, ignore_whitespace=ignore_whitespace,
+                                        coverage=coverage)
+            
+            summary = report.as_dict()
+            metric_cols = st.columns(5)
+            metric_cols[0].metric("Rerun", summary['total'])
+            metric_cols[1].metric("Skipped (not affected)", summary['skipped_by_coverage'])
+            metric_cols[2].metric("Changed", summary['changed'])
+            metric_cols[3].metric("Failed", summary['failed'])
+            metric_cols[4].metric("Cached baselines", summary['baseline_cache_hits'])
+            
+            if not report.changed_cases:
+                st.success("✅ No output changed for any rerun input")
+            for case in report.changed_cases:
+                if case.failed:
+                    if case.baseline_error:
+                        st.error(f"❌ {case.name} failed with the original XSLT: {case.baseline_error}")
+                    if case.updated_error:
+                        st.error(f"❌ {case.name} failed with the updated XSLT: {case.updated_error}")
+                else:
+                    st.markdown(f"**📄 {case.name}** — {len(case.differences)} difference(s)")
+                    st.code("\n".join(case.differences), language='text')
             
 # Application header with improved styling
 st.markdown("""
@@ -648,7 +822,20 @@ with update_tab:
         
         if debug_mode:
             st.info("Debug mode enabled - detailed information will be shown during processing")
-        
+            st.markdown("**🗄️ Stylesheet Cache**")
+            st.json(get_xslt_cache_stats())
+            st.markdown("**⚙️ Saxon Processor Pool**")
+            st.json(get_saxon_pool_health())
+            st.markdown("**🔀 Transform Engines**")
+            st.json(get_transform_engine_stats())
+            st.markdown("**🔎 Regular Expressions**")
+            st.json(get_regex_stats())
+            st.markdown("**🧩 Pattern Analysis**")
+            if st.session_state.get('pattern_analyzer') is not None:
+                analyzer = st.session_state.pattern_analyzer
+                st.write(f"Current stylesheet: {analyzer.analysis_seconds * 1000:.1f} ms ({analyzer.analysis_source})")
+            st.json(get_analysis_stats())
+
         # Processing Statistics
         if hasattr(st.session_state, 'patterns_found') and st.session_state.patterns_found:
             st.markdown("**📊 Analysis Stats**")
@@ -753,8 +940,7 @@ with update_tab:
             if st.session_state.get('current_requirement') and not st.session_state.get('patterns_analyzed'):
                 with st.spinner('🔍 Analyzing XSLT patterns...'):
                     try:
-                        analyzer = UniversalXSLTAnalyzer(st.session_state.xslt)
-                        all_patterns = analyzer.find_all_repeating_patterns()
+                        all_patterns = get_pattern_analyzer(st.session_state.xslt).patterns
                         st.session_state.patterns_found = all_patterns
                         st.session_state.patterns_analyzed = True
                     except Exception as e:
@@ -851,9 +1037,9 @@ with update_tab:
             
             with st.spinner('Processing with Genie...'):
                 try:
-                    # Find the pattern for the selected node
-                    analyzer = UniversalXSLTAnalyzer(st.session_state.xslt)
-                    all_patterns = analyzer.find_all_repeating_patterns()
+                    # Find the pattern for the selected node, reusing the analysis made when the requirement was entered
+                    analyzer = get_pattern_analyzer(st.session_state.xslt)
+                    all_patterns = analyzer.patterns
                     
                     # Find matching pattern
                     pattern = None
@@ -1031,6 +1217,9 @@ with update_tab:
             """, unsafe_allow_html=True)
         
         st.markdown("</div>", unsafe_allow_html=True)  # Close collapsible section
+        
+        if st.session_state.get('xslt'):
+            display_regression_check(st.session_state.xslt, updated_xslt)
     
     # Enhanced specifications output section - only show if content exists
     generated_specs = st.session_state.get('updated_specs')
@@ -1078,8 +1267,8 @@ with optimize_tab:
     if updated_xslt and source_xml:
         try:
             with st.spinner('🔄 Applying XSLT transformation...'):
-                logs = []
-                formatted_xml, logs = apply_xslt(updated_xslt, source_xml, logs, None)
+                outcome = transform_sandbox.transform_memoized(updated_xslt, source_xml)
+                formatted_xml, logs = outcome.output, outcome.logs
                 
             if formatted_xml:
                 st.session_state.llm_target_xml = formatted_xml
@@ -1106,8 +1295,33 @@ with optimize_tab:
                     with st.expander("📋 Transformation Logs"):
                         for log in logs:
                             st.text(log)
+                
+                # Per-template and per-for-each execution profile
+                profile_key = content_hash(updated_xslt, source_xml)
+                if st.button("⏱️ Profile Transformation", key="profile_transformation"):
+                    with st.spinner('⏱️ Profiling XSLT transformation...'):
+                        st.session_state.transform_profile = (profile_key, profile_transform(updated_xslt, source_xml))
+                
+                saved_profile = st.session_state.get('transform_profile')
+                if saved_profile and saved_profile[0] == profile_key:
+                    profile = saved_profile[1]
+                    st.markdown(f"**🔥 Hot Spots** — profiled run took {profile.elapsed_ms:.0f} ms")
+                    if profile.timing_source is None:
+                        st.caption("Call counts come from Saxon; per-template times need lxml and an XSLT 1.0 stylesheet")
+                    else:
+                        st.caption("Times are per template from a libxslt run; for-each regions show call counts only")
+                    st.dataframe(pd.DataFrame(profile.as_records()), use_container_width=True, hide_index=True)
+                    st.download_button(
+                        label="📥 Download Profile JSON",
+                        data=profile.to_json(),
+                        file_name="xslt_profile.json",
+                        mime="application/json",
+                        key="download_profile"
+                    )
+                    for log in profile.logs:
+                        st.warning(log)
             else:
-                st.error("❌ XSLT transformation failed - no output generated")
+                st.error(f"❌ XSLT transformation failed ({outcome.failure.reason}): {outcome.failure.detail}")
                 
         except Exception as e:
             st.markdown(f"""
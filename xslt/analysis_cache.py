@@ -0,0 +1,165 @@
+import gzip
+import json
+import os
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Union
+from .stylesheet_cache import ExpiringLRUCache, cache_directory, content_hash, private_directory
+from .xslt_updater_config import PathConfig, PerformanceConfig
+
+# Modules whose code decides what an analysis record holds
+ANALYZER_SOURCES = ('universal_xslt_analyzer.py', 'document_index.py', 'analysis_cache.py',
+                    'regex_registry.py', 'xslt_updater_config.py')
+
+
+def analyzer_version() -> str:
+    """Hash of the analyzer's source files, so records stored by other analyzer code are never read back"""
+    directory = Path(__file__).parent
+    sources = []
+    for name in ANALYZER_SOURCES:
+        try:
+            sources.append((directory / name).read_bytes())
+        except OSError:
+            sources.append(name)
+    return content_hash(*sources)[:16]
+
+
+ANALYZER_VERSION = analyzer_version()
+
+MEMORY = 'memory'
+DISK = 'disk'
+ANALYZED = 'analyzed'
+
+
+@dataclass
+class AnalysisStats:
+    """Where analyses came from and how long they took"""
+    memory_hits: int = 0
+    disk_hits: int = 0
+    analyses: int = 0
+    analysis_seconds: float = 0.0
+    lookup_seconds: float = 0.0
+    last_source: Optional[str] = None
+    last_seconds: float = 0.0
+
+    def as_dict(self) -> Dict[str, object]:
+        return {
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'analyses': self.analyses,
+            'analysis_ms': round(self.analysis_seconds * 1000, 3),
+            'cached_lookup_ms': round(self.lookup_seconds * 1000, 3),
+            'last_source': self.last_source,
+            'last_ms': round(self.last_seconds * 1000, 3)
+        }
+
+
+class AnalysisCache:
+    """
+    Pattern analyses of stylesheets keyed by content hash.
+
+    An analysis is kept as a compact record of pattern names and instance line
+    numbers; the sample content is cut from the stylesheet again when it is read.
+    Recent records stay in memory, shared by every session of the process, and
+    all are written to disk as gzipped JSON so known stylesheets are not analyzed
+    again after a restart. The least recently used files are removed once the
+    directory holds more than max_disk_mb.
+    """
+
+    def __init__(self, directory: Optional[Union[str, Path]] = None,
+                 max_entries: int = PerformanceConfig.MAX_CACHED_ANALYSES,
+                 max_disk_mb: float = PerformanceConfig.MAX_ANALYSIS_CACHE_MB):
+        self.directory = cache_directory(directory or PathConfig.ANALYSIS_CACHE_DIR, "analysis_cache")
+        self.memory = ExpiringLRUCache(max_entries=max_entries)
+        self.max_disk_mb = max_disk_mb
+        self.stats = AnalysisStats()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(stylesheet_hash: str) -> str:
+        return f"{ANALYZER_VERSION}-{stylesheet_hash}"
+
+    def _path(self, key: str) -> Path:
+        return private_directory(self.directory) / f"{key}.json.gz"
+
+    def get(self, key: str) -> Tuple[Optional[Dict[str, object]], Optional[str]]:
+        """Stored record for a key and whether it came from memory or disk"""
+        record = self.memory.get(key)
+        if record is not None:
+            return record, MEMORY
+        try:
+            path = self._path(key)
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                record = json.load(f)
+            # The modification time orders files for eviction, so a read counts as a use
+            os.utime(path)
+        except (OSError, EOFError, ValueError):
+            # A missing, truncated or corrupt file is analyzed again
+            return None, None
+        self.memory.put(key, record)
+        return record, DISK
+
+    def put(self, key: str, record: Dict[str, object]) -> None:
+        self.memory.put(key, record)
+        try:
+            with tempfile.NamedTemporaryFile(dir=private_directory(self.directory), suffix=".tmp", delete=False) as temp_file:
+                with gzip.open(temp_file, "wt", encoding="utf-8") as f:
+                    json.dump(record, f, separators=(',', ':'))
+            os.replace(temp_file.name, self._path(key))
+            self._evict()
+        except OSError:
+            pass  # The disk copy is an optimization; a read-only disk must not break analysis
+
+    def _evict(self) -> None:
+        """Remove the least recently used files while the directory holds more than max_disk_mb"""
+        files = []
+        for path in self.directory.glob("*.json.gz"):
+            try:
+                status = path.stat()
+            except OSError:
+                continue
+            files.append((status.st_mtime, status.st_size, path))
+        excess = sum(size for _, size, _ in files) - self.max_disk_mb * 1024 * 1024
+        for _, size, path in sorted(files, key=lambda item: item[0]):
+            if excess <= 0:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            excess -= size
+
+    def record_time(self, source: Optional[str], started: float) -> float:
+        """Count an analysis or cache hit that began at started, returning its duration"""
+        seconds = time.perf_counter() - started
+        with self._lock:
+            if source == MEMORY:
+                self.stats.memory_hits += 1
+            elif source == DISK:
+                self.stats.disk_hits += 1
+            if source in (MEMORY, DISK):
+                self.stats.lookup_seconds += seconds
+            else:
+                self.stats.analyses += 1
+                self.stats.analysis_seconds += seconds
+            self.stats.last_source = source or ANALYZED
+            self.stats.last_seconds = seconds
+        return seconds
+
+    def clear(self) -> None:
+        """Drop the records held in memory and reset the counters; records on disk are kept"""
+        self.memory.clear()
+        with self._lock:
+            self.stats = AnalysisStats()
+
+    def as_dict(self) -> Dict[str, object]:
+        stats = self.stats.as_dict()
+        stats['cached_in_memory'] = len(self.memory)
+        stats['memory_cache'] = self.memory.stats.as_dict()
+        return stats
+
+
+analysis_cache = AnalysisCache()
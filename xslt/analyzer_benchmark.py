@@ -0,0 +1,118 @@
+"""Scaling benchmark for the XSLT pattern analyzer.
+
+Usage:
+    python -m genie_core.xslt.analyzer_benchmark [--lines 1000,5000,10000,20000]
+        [--repeat 3] [--output results.json]
+
+Times find_all_repeating_patterns on generated stylesheets of increasing length
+and fits the log-log slope of time against line count; a slope near 1.0 means
+the analyzer scales linearly with the size of the stylesheet.
+"""
+import argparse
+import json
+import math
+import platform
+import statistics
+import sys
+import time
+from typing import Dict, List, Optional
+from .document_index import document_index_cache
+from .universal_xslt_analyzer import UniversalXSLTAnalyzer
+
+DEFAULT_LINE_COUNTS = [1000, 2000, 5000, 10000, 20000]
+
+# Eleven lines per block: a template with a loop, a conditional and repeated literal elements
+BLOCK_TEMPLATE = '''<xsl:template match="section{kind}">
+    <row type="t{kind}">
+        <cell><xsl:value-of select="@id"/></cell>
+        <xsl:for-each select="item{kind}">
+            <entry index="{index}"><xsl:value-of select="."/></entry>
+        </xsl:for-each>
+        <xsl:if test="@flag{kind}">
+            <marker/>
+        </xsl:if>
+    </row>
+</xsl:template>'''
+
+
+def generate_xslt(line_count: int) -> str:
+    """Stylesheet of roughly line_count lines whose templates repeat across a few match patterns"""
+    blocks = []
+    for index in range(max(1, line_count // 11)):
+        blocks.append(BLOCK_TEMPLATE.format(kind=index % 7, index=index))
+    return ('<xsl:stylesheet version="1.0" xmlns:xsl="http://www.w3.org/1999/XSL/Transform">\n'
+            + '\n'.join(blocks) + '\n</xsl:stylesheet>')
+
+
+def scaling_exponent(results: List[Dict[str, object]]) -> Optional[float]:
+    """Least-squares slope of log(time) against log(lines)"""
+    points = [(math.log(result["lines"]), math.log(result["median_ms"]))
+              for result in results if result["median_ms"] > 0]
+    if len(points) < 2:
+        return None
+    mean_x = statistics.mean(x for x, _ in points)
+    mean_y = statistics.mean(y for _, y in points)
+    spread = sum((x - mean_x) ** 2 for x, _ in points)
+    if spread == 0:
+        return None
+    return round(sum((x - mean_x) * (y - mean_y) for x, y in points) / spread, 3)
+
+
+def run_benchmarks(line_counts: List[int], repeat: int) -> Dict[str, object]:
+    """Time a fresh analysis of each generated stylesheet"""
+    results = []
+    for line_count in line_counts:
+        xslt = generate_xslt(line_count)
+        durations = []
+        patterns = []
+        for _ in range(repeat):
+            # Drop the shared index and skip the analysis cache so every run parses the stylesheet
+            document_index_cache.clear()
+            started = time.perf_counter()
+            patterns = UniversalXSLTAnalyzer(xslt).find_all_repeating_patterns(use_cache=False)
+            durations.append((time.perf_counter() - started) * 1000)
+        lines = xslt.count('\n') + 1
+        median_ms = statistics.median(durations)
+        results.append({
+            "lines": lines,
+            "patterns": len(patterns),
+            "runs": len(durations),
+            "median_ms": round(median_ms, 3),
+            "min_ms": round(min(durations), 3),
+            "ms_per_1k_lines": round(median_ms * 1000 / lines, 3)
+        })
+        print(f"{lines} lines: {median_ms:.1f} ms", file=sys.stderr)
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "scaling_exponent": scaling_exponent(results),
+        "results": results
+    }
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Benchmark how the XSLT analyzer scales with stylesheet length")
+    parser.add_argument("--lines", default=",".join(str(count) for count in DEFAULT_LINE_COUNTS),
+                        help="Comma-separated stylesheet lengths in lines")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per stylesheet")
+    parser.add_argument("--output", help="Write the JSON results to this file as well as stdout")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    line_counts = [int(count) for count in args.lines.split(",") if count.strip()]
+
+    report = run_benchmarks(line_counts, max(1, args.repeat))
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+import asyncio
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List, Optional
+from .saxon_pool import saxon_pool
+from .transform_sandbox import TransformSandbox
+from .xslt_updater_config import TestConfig
+from .xslt_utils import apply_xslt
+
+
+class AsyncTransformer:
+    """Runs apply_xslt from asyncio code on a bounded executor with back-pressure and per-call timeouts"""
+
+    def __init__(self, max_concurrency: Optional[int] = None,
+                 timeout: float = TestConfig.DEFAULT_TRANSFORMATION_TIMEOUT,
+                 sandbox: Optional[TransformSandbox] = None):
+        self.max_concurrency = max_concurrency or (sandbox.size if sandbox else saxon_pool.size)
+        self.timeout = timeout
+        self.sandbox = sandbox
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        self._semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = \
+            weakref.WeakKeyDictionary()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                                    thread_name_prefix='async-transform')
+            return self._executor
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+
+    def _transform(self, xslt: str, xml: str, logs: List[str], parameters, timeout: float):
+        if self.sandbox is None:
+            return apply_xslt(xslt, xml, logs, parameters)
+        result = self.sandbox.transform(xslt, xml, parameters, timeout)
+        logs.extend(result.logs)
+        if result.failure and result.failure.reason != result.failure.TRANSFORM_ERROR:
+            logs.append(f"Transformation stopped ({result.failure.reason}): {result.failure.detail}")
+        return [result.output, logs]
+
+    def _start(self, semaphore: asyncio.Semaphore, xslt: str, xml: str, logs: List[str],
+               parameters, timeout: float) -> asyncio.Future:
+        """Submit one transform for a semaphore slot the caller has already acquired"""
+        try:
+            future = asyncio.get_running_loop().run_in_executor(
+                self._get_executor(), self._transform, xslt, xml, logs, parameters, timeout)
+        except BaseException:
+            semaphore.release()
+            raise
+        # Saxon cannot be interrupted from another thread, so the slot stays taken until the
+        # transform really finishes; timed-out calls then never over-subscribe the executor
+        future.add_done_callback(lambda _: semaphore.release())
+        return future
+
+    async def _wait(self, future: asyncio.Future, logs: List[str], timeout: float):
+        # The sandbox enforces the time limit itself and kills the worker, so only wait here without it
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), None if self.sandbox else timeout)
+        except asyncio.TimeoutError:
+            logs.append(f"An error occurred during the XSLT transformation: timed out after {timeout:g} seconds")
+            return [None, logs]
+
+    async def apply_xslt(self, xslt: str, xml: str, logs: Optional[List[str]] = None, parameters=None,
+                         timeout: Optional[float] = None):
+        """
+        Async counterpart of apply_xslt.
+
+        Waits for a free slot while max_concurrency transforms are running.
+        Returns [transformed_xml, logs] or [None, logs] on error or timeout.
+        """
+        logs = [] if logs is None else logs
+        timeout = timeout or self.timeout
+        semaphore = self._get_semaphore()
+        await semaphore.acquire()
+        return await self._wait(self._start(semaphore, xslt, xml, logs, parameters, timeout), logs, timeout)
+
+    async def apply_xslt_many(self, xslt: str, xml_inputs: Iterable[str], parameters=None,
+                              timeout: Optional[float] = None) -> List[list]:
+        """
+        Transform many inputs concurrently, returning [transformed_xml, logs] per input in input order.
+
+        Inputs are only pulled from the iterable when a slot is free, so a generator is
+        consumed at the pace of the executor. Cancelling the call stops pulling inputs;
+        transforms that are already running finish in the background.
+        """
+        timeout = timeout or self.timeout
+        semaphore = self._get_semaphore()
+        tasks = []
+        try:
+            for xml in xml_inputs:
+                await semaphore.acquire()
+                logs: List[str] = []
+                future = self._start(semaphore, xslt, xml, logs, parameters, timeout)
+                tasks.append(asyncio.ensure_future(self._wait(future, logs, timeout)))
+            return list(await asyncio.gather(*tasks))
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+    def shutdown(self) -> None:
+        """Stop the executor without waiting for running transforms"""
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+async_transformer = AsyncTransformer()
+
+
+async def apply_xslt_async(xslt: str, xml: str, logs: Optional[List[str]] = None, parameters=None,
+                           timeout: Optional[float] = None):
+    """Async apply_xslt on the shared bounded executor"""
+    return await async_transformer.apply_xslt(xslt, xml, logs, parameters, timeout)
+
+
+async def apply_xslt_many(xslt: str, xml_inputs: Iterable[str], parameters=None,
+                          timeout: Optional[float] = None) -> List[list]:
+    """Transform many inputs on the shared bounded executor, in input order"""
+    return await async_transformer.apply_xslt_many(xslt, xml_inputs, parameters, timeout)
@@ -0,0 +1,200 @@
+import math
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from dataclasses import dataclass, field, replace
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from .schema_validation import SchemaValidator, ValidationReport, ValidationResult
+from .stylesheet_cache import source_hash
+from .transform_sandbox import TransformSandbox, XmlInput
+from .xslt_updater_config import PerformanceConfig, TestConfig
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of a list of values"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[rank]
+
+
+@dataclass
+class BatchResult:
+    """Outcome of transforming one input of a batch"""
+    name: str
+    output: Optional[Union[str, bytes]]
+    logs: List[str] = field(default_factory=list)
+    latency_seconds: float = 0.0
+    error: Optional[str] = None
+    failure_reason: Optional[str] = None
+    duplicate_of: Optional[str] = None
+    validation: Optional[ValidationResult] = None
+
+    @property
+    def success(self) -> bool:
+        return self.output is not None and self.error is None
+
+    @property
+    def valid(self) -> Optional[bool]:
+        """Whether the output matches the schema, or None if it was not validated"""
+        return self.validation.valid if self.validation is not None else None
+
+
+@dataclass
+class BatchSummary:
+    """Aggregate throughput and latency of a batch run"""
+    total: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    duplicates: int = 0
+    invalid: int = 0
+    elapsed_seconds: float = 0.0
+    latencies: List[float] = field(default_factory=list)
+
+    @property
+    def files_per_second(self) -> float:
+        return self.total / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            'total': self.total,
+            'succeeded': self.succeeded,
+            'failed': self.failed,
+            'duplicates': self.duplicates,
+            'invalid': self.invalid,
+            'elapsed_seconds': round(self.elapsed_seconds, 3),
+            'files_per_second': round(self.files_per_second, 2),
+            'latency_p50_ms': round(percentile(self.latencies, 0.50) * 1000, 1),
+            'latency_p95_ms': round(percentile(self.latencies, 0.95) * 1000, 1),
+            'latency_max_ms': round(max(self.latencies, default=0.0) * 1000, 1)
+        }
+
+
+class BatchTransformer:
+    """
+    Transforms many inputs with one stylesheet across sandboxed worker processes.
+    With a schema validator, each output is validated as soon as its transform completes.
+    """
+
+    def __init__(self, xslt: str, max_workers: Optional[int] = None,
+                 timeout: float = TestConfig.DEFAULT_TRANSFORMATION_TIMEOUT,
+                 parameters: Optional[Dict[str, str]] = None,
+                 sandbox: Optional[TransformSandbox] = None,
+                 output_bytes: bool = False,
+                 validator: Optional[SchemaValidator] = None,
+                 max_file_input_mb: float = PerformanceConfig.MAX_FILE_INPUT_MB):
+        self.xslt = xslt
+        self.max_workers = max_workers or (sandbox.size if sandbox else os.cpu_count()) or 1
+        self.timeout = timeout
+        self.parameters = parameters
+        self.sandbox = sandbox
+        self.output_bytes = output_bytes
+        self.validator = validator
+        self.max_file_input_mb = max_file_input_mb
+        self.summary = BatchSummary()
+        self.validation_report: Optional[ValidationReport] = None
+
+    def run(self, inputs: Iterable[Tuple[str, XmlInput]]) -> Iterator[BatchResult]:
+        """
+        Yield a BatchResult per (name, xml) input as soon as it completes.
+        Inputs given as a Path are read by the workers, not by this process.
+        """
+        inputs = list(inputs)
+        self.summary = BatchSummary()
+        self.validation_report = ValidationReport() if self.validator else None
+        started = time.perf_counter()
+
+        # Inputs with identical content are transformed once and share the result
+        unique: List[Tuple[str, str, XmlInput]] = []
+        duplicates: Dict[str, List[str]] = {}
+        for name, xml in inputs:
+            digest = source_hash(xml)
+            if digest in duplicates:
+                duplicates[digest].append(name)
+            else:
+                duplicates[digest] = []
+                unique.append((name, digest, xml))
+
+        if not unique:
+            return
+
+        # A private sandbox is sized to this batch and shut down afterwards
+        sandbox = self.sandbox or TransformSandbox(size=min(self.max_workers, len(unique)), timeout=self.timeout,
+                                                   max_file_input_mb=self.max_file_input_mb)
+        try:
+            # Start the workers and compile the stylesheet in each before any timeout runs
+            sandbox.warm_up(self.xslt)
+
+            pending = {}
+            validating = {}
+            queue = iter(unique)
+            while True:
+                # Keep at most one task per worker in flight so queued inputs do not pile up
+                while len(pending) < sandbox.size:
+                    item = next(queue, None)
+                    if item is None:
+                        break
+                    name, digest, xml = item
+                    future = sandbox.submit(self.xslt, xml, self.parameters, self.timeout, self.output_bytes)
+                    pending[future] = (name, digest)
+                if not pending and not validating:
+                    break
+
+                done, _ = wait(list(pending) + list(validating), return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in validating:
+                        result, digest = validating.pop(future)
+                        try:
+                            result.validation = future.result()
+                        except Exception as e:
+                            result.validation = ValidationResult(name=result.name, error=f"Output could not be validated: {e}")
+                        yield from self._emit(result, duplicates[digest])
+                        continue
+
+                    name, digest = pending.pop(future)
+                    try:
+                        outcome = future.result()
+                        result = BatchResult(
+                            name=name,
+                            output=outcome.output,
+                            logs=outcome.logs,
+                            latency_seconds=outcome.latency_seconds,
+                            error=outcome.failure.detail if outcome.failure else None,
+                            failure_reason=outcome.failure.reason if outcome.failure else None
+                        )
+                    except Exception as e:
+                        result = BatchResult(name=name, output=None, error=str(e))
+                    if self.validator is not None and result.success:
+                        # Validation runs on its own threads while the workers take the next inputs
+                        validating[self.validator.submit(result.name, result.output)] = (result, digest)
+                    else:
+                        yield from self._emit(result, duplicates[digest])
+        finally:
+            if self.sandbox is None:
+                sandbox.shutdown()
+            self.summary.elapsed_seconds = time.perf_counter() - started
+            if self.validation_report is not None:
+                self.validation_report.elapsed_seconds = self.summary.elapsed_seconds
+
+    def _emit(self, result: BatchResult, duplicate_names: List[str]) -> Iterator[BatchResult]:
+        """Record a result in the summary and yield it together with its duplicates"""
+        self.summary.latencies.append(result.latency_seconds)
+        for current in [result] + [
+            BatchResult(name=name, output=result.output, logs=result.logs, error=result.error,
+                        failure_reason=result.failure_reason, duplicate_of=result.name,
+                        validation=result.validation)
+            for name in duplicate_names
+        ]:
+            self.summary.total += 1
+            if current.duplicate_of:
+                self.summary.duplicates += 1
+            if current.success:
+                self.summary.succeeded += 1
+            else:
+                self.summary.failed += 1
+            if current.validation is not None:
+                self.validation_report.results.append(replace(current.validation, name=current.name))
+                if not current.validation.valid:
+                    self.summary.invalid += 1
+            yield current
@@ -0,0 +1,105 @@
+import difflib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+from .stylesheet_cache import ExpiringLRUCache, content_hash, source_hash
+from .transform_profiler import ProfileRegion, instrument_stylesheet
+from .transform_sandbox import TransformSandbox, transform_sandbox
+from .xslt_updater_config import PerformanceConfig
+
+# Regions reached by each input hash, one dict per stylesheet so a whole corpus is kept or dropped
+# together however large it is; None marks an input whose coverage is unknown
+input_coverage_cache = ExpiringLRUCache(max_entries=PerformanceConfig.MAX_CACHED_COVERAGE)
+
+
+@dataclass
+class CoverageMap:
+    """Which templates and loops of a stylesheet each corpus input exercises"""
+    stylesheet_hash: str
+    regions: List[ProfileRegion]
+    reached: Dict[str, Optional[FrozenSet[int]]] = field(default_factory=dict)
+
+    def inputs_reaching(self, region_ids: Iterable[int]) -> List[str]:
+        """Inputs that ran any of the given regions, plus inputs whose coverage is unknown"""
+        region_ids = set(region_ids)
+        return [name for name, reached in self.reached.items() if reached is None or reached & region_ids]
+
+    def affected_inputs(self, original_xslt: str, updated_xslt: str) -> List[str]:
+        """Inputs whose output the edit from original to updated stylesheet can change"""
+        touched = touched_regions(original_xslt, updated_xslt, self.regions)
+        if touched is None:
+            return list(self.reached)
+        return self.inputs_reaching(touched)
+
+
+def _changed_lines(original_xslt: str, updated_xslt: str) -> Tuple[Set[int], Set[int]]:
+    """
+    1-based lines of the original stylesheet that an edit replaced or removed, and the
+    gaps lines were inserted into (gap n lies between original lines n and n + 1)
+    """
+    matcher = difflib.SequenceMatcher(a=original_xslt.splitlines(), b=updated_xslt.splitlines(), autojunk=False)
+    lines, gaps = set(), set()
+    for opcode, i1, i2, _, _ in matcher.get_opcodes():
+        if opcode in ('replace', 'delete'):
+            lines.update(range(i1 + 1, i2 + 1))
+        elif opcode == 'insert':
+            gaps.add(i1)
+    return lines, gaps
+
+
+def _innermost(regions: List[ProfileRegion]) -> int:
+    return max(regions, key=lambda region: region.line).region_id
+
+
+def touched_regions(original_xslt: str, updated_xslt: str, regions: List[ProfileRegion]) -> Optional[Set[int]]:
+    """
+    Regions of the original stylesheet whose behaviour an edit can change, or None if
+    the edit can affect every input (top-level declarations, match patterns, new templates)
+    """
+    lines, gaps = _changed_lines(original_xslt, updated_xslt)
+    touched = set()
+    for line in lines:
+        # The innermost region whose body holds the line; a nested loop's own start tag is part of its parent's body
+        enclosing = [region for region in regions if region.line < line <= region.end_line]
+        if enclosing:
+            touched.add(_innermost(enclosing))
+            continue
+        start_of = [region for region in regions if region.line == line]
+        if start_of and all(region.kind == 'template' and 'match' not in region.attributes for region in start_of):
+            # Only named templates start here; renaming one breaks its callers at compile time anyway
+            touched.update(region.region_id for region in start_of)
+            continue
+        return None
+    for gap in gaps:
+        # Inserted lines are inside a region only if both neighbouring lines are
+        enclosing = [region for region in regions if region.line <= gap < region.end_line]
+        if not enclosing:
+            return None
+        touched.add(_innermost(enclosing))
+    return touched
+
+
+def build_coverage_map(xslt: str, inputs: List[Tuple[str, object]], max_workers: Optional[int] = None,
+                       sandbox: Optional[TransformSandbox] = None) -> CoverageMap:
+    """Record which regions each input reaches in sandboxed workers, reusing coverage of inputs seen before"""
+    sandbox = sandbox or transform_sandbox
+    instrumented, regions = instrument_stylesheet(xslt)
+    stylesheet_hash = content_hash(xslt)
+    known = input_coverage_cache.get_or_create(stylesheet_hash, dict)
+
+    def input_coverage(xml) -> Optional[FrozenSet[int]]:
+        input_hash = source_hash(xml)
+        if input_hash in known:
+            return known[input_hash]
+        result = sandbox.run_instrumented(instrumented, xml)
+        # A failed run may have stopped before reaching later regions, so its coverage is unknown
+        output, counts, _ = result.output if result.success else (None, None, None)
+        reached = frozenset(counts) if output is not None else None
+        known[input_hash] = reached
+        return reached
+
+    with ThreadPoolExecutor(max_workers=max_workers or sandbox.size) as executor:
+        coverage = list(executor.map(input_coverage, [xml for _, xml in inputs]))
+
+    return CoverageMap(stylesheet_hash=stylesheet_hash, regions=regions,
+                       reached={name: reached for (name, _), reached in zip(inputs, coverage)})
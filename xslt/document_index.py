@@ -0,0 +1,211 @@
+import re
+import time
+from bisect import bisect_right
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from .regex_registry import regex_registry
+from .stylesheet_cache import ExpiringLRUCache, content_hash
+from .xslt_updater_config import PerformanceConfig
+
+TEMPLATE = 'template'
+LOOP = 'loop'
+CONDITIONAL = 'conditional'
+
+# XSLT elements that open a block, with the attribute that identifies the block
+BLOCK_ELEMENTS = {
+    'xsl:template': (TEMPLATE, 'match'),
+    'xsl:for-each': (LOOP, 'select'),
+    'xsl:if': (CONDITIONAL, 'test'),
+    'xsl:when': (CONDITIONAL, 'test')
+}
+
+# Comments, CDATA sections, processing instructions and declarations are skipped whole, so
+# markup inside them is not read as elements. Quoted attribute values may contain '>'.
+TOKEN_PATTERN = regex_registry.compile(
+    r'<!--.*?-->|<!\[CDATA\[.*?\]\]>|<\?.*?\?>|<![^>]*>'
+    r'|<(/?)([^\s/>!?<]+)((?:[^<>"\']|"[^"]*"|\'[^\']*\')*?)(/?)>', re.DOTALL)
+ATTRIBUTE_PATTERN = regex_registry.compile(r'([^\s=]+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\')')
+LINE_BREAK_PATTERN = regex_registry.compile('\n')
+
+# Document indexes keyed by the content hash of the stylesheet text
+document_index_cache = ExpiringLRUCache(max_entries=PerformanceConfig.MAX_CACHED_INDEXES)
+
+
+@dataclass
+class ElementSpan:
+    """Position of one element: character offsets, end exclusive, and 0-based lines"""
+    name: str
+    start: int
+    end: int
+    content_start: int
+    content_end: int
+    start_line: int
+    end_line: int
+    parent: Optional[int] = None  # position of the parent element in DocumentIndex.spans
+    block: Optional[str] = None  # TEMPLATE, LOOP or CONDITIONAL for XSLT blocks
+    key: Optional[str] = None  # match, select or test attribute of a block
+    closed: bool = True
+
+    @property
+    def self_closing(self) -> bool:
+        return self.content_start == self.end
+
+    def contains(self, offset: int) -> bool:
+        return self.start <= offset < self.end
+
+
+class DocumentIndex:
+    """
+    Every element of a stylesheet with its character and line span and parent.
+
+    Built by one pass of a tag tokenizer that tolerates unbalanced markup: an end
+    tag closes the nearest open element of its name, and elements it skips over
+    are left unclosed and excluded from instance lists. Instances of a name are
+    numbered in document order, so nested elements of one name count separately.
+    """
+
+    def __init__(self, text: str):
+        started = time.perf_counter()
+        self.text = text
+        self.spans: List[ElementSpan] = []
+        self._line_starts = [0] + [match.end() for match in LINE_BREAK_PATTERN.regex.finditer(text)]
+        self._starts: List[int] = []
+        self._by_name: Dict[str, List[int]] = {}
+        self._by_template_match: Dict[str, List[int]] = {}
+        self._by_block: Dict[str, List[int]] = {}
+        self._build()
+        regex_registry.record('document index', started)
+
+    def _build(self) -> None:
+        text = self.text
+        open_elements: List[int] = []
+        line = 0
+        position = 0
+        for match in TOKEN_PATTERN.regex.finditer(text):
+            name = match.group(2)
+            if name is None:
+                continue
+            line += text.count('\n', position, match.start())
+            position = match.start()
+            end_line = line + text.count('\n', match.start(), match.end())
+
+            if match.group(1):
+                # End tag: close the nearest open element of this name, if there is one
+                for depth in range(len(open_elements) - 1, -1, -1):
+                    span = self.spans[open_elements[depth]]
+                    if span.name == name:
+                        for skipped in open_elements[depth + 1:]:
+                            self.spans[skipped].closed = False
+                        span.end, span.content_end, span.end_line = match.end(), match.start(), end_line
+                        span.closed = True
+                        del open_elements[depth:]
+                        break
+                continue
+
+            self_closing = bool(match.group(4))
+            span = ElementSpan(name=name, start=match.start(), end=match.end(), content_start=match.end(),
+                               content_end=match.end(), start_line=line, end_line=end_line,
+                               parent=open_elements[-1] if open_elements else None, closed=self_closing)
+            if name in BLOCK_ELEMENTS:
+                span.block, attribute = BLOCK_ELEMENTS[name]
+                span.key = self._attribute(match.group(3), attribute)
+            number = len(self.spans)
+            self.spans.append(span)
+            self._starts.append(span.start)
+            if not self_closing:
+                open_elements.append(number)
+        for number in open_elements:
+            self.spans[number].closed = False
+
+        for number, span in enumerate(self.spans):
+            if not span.closed:
+                continue
+            self._by_name.setdefault(span.name, []).append(number)
+            if span.block:
+                self._by_block.setdefault(span.block, []).append(number)
+            if span.block == TEMPLATE and span.key is not None:
+                self._by_template_match.setdefault(span.key, []).append(number)
+
+    @staticmethod
+    def _attribute(attributes: str, name: str) -> Optional[str]:
+        for match in ATTRIBUTE_PATTERN.regex.finditer(attributes):
+            if match.group(1) == name:
+                return match.group(2) if match.group(2) is not None else match.group(3)
+        return None
+
+    def element_names(self) -> List[str]:
+        """Names of all closed elements, in order of first appearance"""
+        return list(self._by_name)
+
+    def instances(self, name: str) -> List[ElementSpan]:
+        """Closed instances of an element name in document order"""
+        return [self.spans[number] for number in self._by_name.get(name, [])]
+
+    def count(self, name: str) -> int:
+        return len(self._by_name.get(name, []))
+
+    def nth(self, name: str, instance_num: int) -> Optional[ElementSpan]:
+        """The instance_num-th (1-based) instance of an element name"""
+        numbers = self._by_name.get(name, [])
+        return self.spans[numbers[instance_num - 1]] if 0 < instance_num <= len(numbers) else None
+
+    def templates(self, match: str) -> List[ElementSpan]:
+        """Templates with this match attribute in document order"""
+        return [self.spans[number] for number in self._by_template_match.get(match, [])]
+
+    def template_matches(self) -> List[str]:
+        """Match attributes of all templates, in order of first appearance"""
+        return list(self._by_template_match)
+
+    def blocks(self, block: str) -> List[ElementSpan]:
+        """Template, loop or conditional blocks in document order"""
+        return [self.spans[number] for number in self._by_block.get(block, [])]
+
+    def parent(self, span: ElementSpan) -> Optional[ElementSpan]:
+        return self.spans[span.parent] if span.parent is not None else None
+
+    def enclosing(self, offset: int, name: Optional[str] = None,
+                  block: Optional[str] = None) -> Optional[ElementSpan]:
+        """Innermost element containing the offset, optionally of a given name or block type"""
+        number = bisect_right(self._starts, offset) - 1
+        while number >= 0:
+            span = self.spans[number]
+            if span.contains(offset) and (name is None or span.name == name) and (block is None or span.block == block):
+                return span
+            # Every element containing the offset is an ancestor of the last one starting at or before it
+            number = span.parent if span.parent is not None else -1
+        return None
+
+    def _at_line(self, numbers: List[int], line: int) -> Optional[ElementSpan]:
+        # Instance lists are in document order, so their start lines are sorted
+        low, high = 0, len(numbers)
+        while low < high:
+            middle = (low + high) // 2
+            if self.spans[numbers[middle]].start_line < line:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(numbers) and self.spans[numbers[low]].start_line == line:
+            return self.spans[numbers[low]]
+        return None
+
+    def element_at_line(self, name: str, line: int) -> Optional[ElementSpan]:
+        """First instance of an element name that starts on a line"""
+        return self._at_line(self._by_name.get(name, []), line)
+
+    def block_at_line(self, block: str, line: int) -> Optional[ElementSpan]:
+        """First block of a type that starts on a line"""
+        return self._at_line(self._by_block.get(block, []), line)
+
+    def line_offset(self, line: int) -> int:
+        """Character offset where a 0-based line starts; past the last line, one beyond the end of the text"""
+        return self._line_starts[line] if line < len(self._line_starts) else len(self.text) + 1
+
+    def line_of(self, offset: int) -> int:
+        """0-based line of a character offset"""
+        return bisect_right(self._line_starts, offset) - 1
+
+
+def document_index(text: str) -> DocumentIndex:
+    """Shared index of a stylesheet version, built once per distinct content"""
+    return document_index_cache.get_or_create(content_hash(text), lambda: DocumentIndex(text))
@@ -0,0 +1,130 @@
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple, Union
+from urllib.parse import unquote, urlparse
+from .regex_registry import regex_registry
+from .stylesheet_cache import content_hash, file_hash
+from .xslt_updater_config import PathConfig
+
+# xsl:include and xsl:import declarations with their href, whatever prefix the stylesheet uses
+MODULE_REFERENCE_PATTERN = regex_registry.compile(
+    r'<[\w.-]+:(include|import)(?![\w.-])(?:[^>"\']|"[^"]*"|\'[^\']*\')*?\bhref\s*=\s*(?:"([^"]*)"|\'([^\']*)\')')
+
+
+def module_references(xslt: str) -> List[str]:
+    """href of every xsl:include and xsl:import in a stylesheet, in document order"""
+    if 'include' not in xslt and 'import' not in xslt:
+        return []
+    text = regex_registry.config('XML_COMMENT_PATTERN', re.DOTALL).sub('', xslt)
+    return [match.group(2) if match.group(2) is not None else match.group(3)
+            for match in MODULE_REFERENCE_PATTERN.finditer(text)]
+
+
+@dataclass
+class StylesheetModule:
+    """A module file as last read from disk"""
+    path: Path
+    mtime_ns: int
+    size: int
+    hash: str
+    references: List[Path] = field(default_factory=list)
+    external: List[str] = field(default_factory=list)
+
+
+class ModuleResolver:
+    """
+    Resolves the modules a stylesheet includes or imports from a root directory.
+
+    Modules are parsed once and re-read only when their modification time or size
+    changes. The hash of a stylesheet bundle covers the entry stylesheet and every
+    module it reaches, so editing a shared module changes the cache key of exactly
+    the stylesheets that depend on it.
+    """
+
+    def __init__(self, root: Optional[Union[str, Path]] = None):
+        self.root = Path(root or PathConfig.XSLT_MODULE_ROOT or os.getcwd()).resolve()
+        self._modules: Dict[Path, StylesheetModule] = {}
+        # Module path -> content hashes of the entry stylesheets that reach it
+        self._dependents: Dict[Path, Set[str]] = {}
+        self._lock = threading.RLock()
+
+    def _resolve(self, href: str, base_directory: Path) -> Optional[Path]:
+        """Local path an href refers to, or None for modules outside the file system"""
+        parsed = urlparse(href)
+        if parsed.scheme == 'file':
+            return Path(unquote(parsed.path)).resolve()
+        if parsed.scheme and len(parsed.scheme) > 1:
+            return None
+        return (base_directory / unquote(href)).resolve()
+
+    def _load(self, path: Path) -> Optional[StylesheetModule]:
+        try:
+            status = path.stat()
+        except OSError:
+            self._modules.pop(path, None)
+            return None
+        module = self._modules.get(path)
+        if module is not None and (module.mtime_ns, module.size) == (status.st_mtime_ns, status.st_size):
+            return module
+
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            text = f.read()
+        module = StylesheetModule(path=path, mtime_ns=status.st_mtime_ns, size=status.st_size, hash=file_hash(path))
+        for href in module_references(text):
+            resolved = self._resolve(href, path.parent)
+            if resolved is None:
+                module.external.append(href)
+            else:
+                module.references.append(resolved)
+        self._modules[path] = module
+        return module
+
+    def modules(self, xslt: str) -> List[Tuple[Path, Optional[StylesheetModule]]]:
+        """Every module the stylesheet reaches, directly or through other modules; None marks a missing file"""
+        with self._lock:
+            reached: Dict[Path, Optional[StylesheetModule]] = {}
+            pending = [path for path in (self._resolve(href, self.root) for href in module_references(xslt)) if path]
+            while pending:
+                path = pending.pop(0)
+                if path in reached:
+                    continue
+                module = reached[path] = self._load(path)
+                if module is not None:
+                    pending.extend(module.references)
+
+            entry_hash = content_hash(xslt)
+            for path in reached:
+                self._dependents.setdefault(path, set()).add(entry_hash)
+            return list(reached.items())
+
+    def bundle_hash(self, xslt: str) -> str:
+        """Cache key of a stylesheet together with the current content of all its modules"""
+        if not module_references(xslt):
+            return content_hash(xslt)
+        modules = self.modules(xslt)
+        # Missing modules are part of the key, so the stylesheet recompiles once they appear
+        return content_hash(xslt, self.root, *(f"{path}={module.hash if module else 'missing'}"
+                                               for path, module in sorted(modules, key=lambda item: str(item[0]))))
+
+    def dependents(self, path: Union[str, Path]) -> Set[str]:
+        """Content hashes of the entry stylesheets seen so far that reach a module"""
+        with self._lock:
+            return set(self._dependents.get(Path(path).resolve(), ()))
+
+    def invalidate(self, path: Union[str, Path]) -> Set[str]:
+        """Forget a module so it is re-read, returning the entry stylesheets that depend on it"""
+        path = Path(path).resolve()
+        with self._lock:
+            self._modules.pop(path, None)
+            return set(self._dependents.get(path, ()))
+
+    def compile(self, slot, xslt: str):
+        """Compile an entry stylesheet so its relative includes and imports resolve against the root"""
+        slot.xslt30_processor.set_cwd(str(self.root))
+        return slot.xslt30_processor.compile_stylesheet(stylesheet_text=xslt)
+
+
+module_resolver = ModuleResolver()
@@ -0,0 +1,75 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+from .saxon_pool import saxon_pool
+from .xslt_utils import apply_xslt, parameters_to_dict
+
+ParameterSet = Union[Dict[str, str], Sequence[Sequence[str]]]
+
+
+@dataclass
+class ParameterSweepResult:
+    """Results matrix of a parameter sweep, indexed [parameter set][input]"""
+    parameter_sets: List[Dict[str, str]]
+    input_names: List[str]
+    outputs: List[List[Optional[str]]]
+    errors: List[List[Optional[str]]]
+    elapsed_seconds: float = 0.0
+    logs: List[str] = field(default_factory=list)
+
+    def get(self, set_index: int, input_name: str) -> Optional[str]:
+        """Output for one parameter set and input"""
+        return self.outputs[set_index][self.input_names.index(input_name)]
+
+    def as_records(self) -> List[Dict[str, object]]:
+        """Flatten the matrix into one record per (parameter set, input), e.g. for a DataFrame"""
+        records = []
+        for set_index, parameters in enumerate(self.parameter_sets):
+            for input_index, input_name in enumerate(self.input_names):
+                records.append({
+                    'parameter_set': set_index,
+                    **parameters,
+                    'input': input_name,
+                    'success': self.errors[set_index][input_index] is None,
+                    'output': self.outputs[set_index][input_index],
+                    'error': self.errors[set_index][input_index]
+                })
+        return records
+
+
+def sweep_parameters(xslt: str, inputs: List[Tuple[str, str]], parameter_sets: List[ParameterSet],
+                     max_workers: Optional[int] = None) -> ParameterSweepResult:
+    """Run every parameter set against every input with one compiled stylesheet per pooled processor"""
+    parameter_sets = [parameters_to_dict(xslt, parameters) for parameters in parameter_sets]
+    input_names = [name for name, _ in inputs]
+    outputs = [[None] * len(inputs) for _ in parameter_sets]
+    errors = [[None] * len(inputs) for _ in parameter_sets]
+    all_logs: List[str] = []
+
+    def run_cell(set_index: int, input_index: int) -> None:
+        logs = []
+        output, logs = apply_xslt(xslt, inputs[input_index][1], logs, parameter_sets[set_index])
+        outputs[set_index][input_index] = output
+        if output is None:
+            errors[set_index][input_index] = logs[-1] if logs else 'Transformation failed'
+        all_logs.extend(logs)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers or saxon_pool.size) as executor:
+        futures = [
+            executor.submit(run_cell, set_index, input_index)
+            for set_index in range(len(parameter_sets))
+            for input_index in range(len(inputs))
+        ]
+        for future in futures:
+            future.result()
+
+    return ParameterSweepResult(
+        parameter_sets=parameter_sets,
+        input_names=input_names,
+        outputs=outputs,
+        errors=errors,
+        elapsed_seconds=time.perf_counter() - started,
+        logs=all_logs
+    )
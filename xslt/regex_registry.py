@@ -0,0 +1,158 @@
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+from .stylesheet_cache import ExpiringLRUCache
+from .xslt_updater_config import PatternConfig, PerformanceConfig
+
+
+@dataclass
+class PatternStats:
+    """Compile and match counters of one pattern, or of all patterns built from one element template"""
+    pattern: str
+    compiles: int = 0
+    calls: int = 0
+    match_seconds: float = 0.0
+
+    def as_dict(self) -> Dict[str, object]:
+        return {
+            'pattern': self.pattern,
+            'compiles': self.compiles,
+            'calls': self.calls,
+            'match_ms': round(self.match_seconds * 1000, 3)
+        }
+
+
+class RegisteredPattern:
+    """A compiled pattern whose matching calls are counted and timed"""
+
+    __slots__ = ('regex', 'stats')
+
+    def __init__(self, regex: "re.Pattern", stats: PatternStats):
+        self.regex = regex
+        self.stats = stats
+
+    def _record(self, started: float) -> None:
+        # Counters are updated without a lock; under concurrency they are approximate
+        stats = self.stats
+        stats.match_seconds += time.perf_counter() - started
+        stats.calls += 1
+
+    def search(self, string: str, *args):
+        started = time.perf_counter()
+        result = self.regex.search(string, *args)
+        self._record(started)
+        return result
+
+    def match(self, string: str, *args):
+        started = time.perf_counter()
+        result = self.regex.match(string, *args)
+        self._record(started)
+        return result
+
+    def findall(self, string: str, *args) -> list:
+        started = time.perf_counter()
+        result = self.regex.findall(string, *args)
+        self._record(started)
+        return result
+
+    def finditer(self, string: str, *args) -> list:
+        """All matches as a list, so the time spent matching is measured"""
+        started = time.perf_counter()
+        result = list(self.regex.finditer(string, *args))
+        self._record(started)
+        return result
+
+    def split(self, string: str, maxsplit: int = 0) -> list:
+        started = time.perf_counter()
+        result = self.regex.split(string, maxsplit)
+        self._record(started)
+        return result
+
+    def sub(self, replacement, string: str, count: int = 0) -> str:
+        started = time.perf_counter()
+        result = self.regex.sub(replacement, string, count)
+        self._record(started)
+        return result
+
+
+class RegexRegistry:
+    """
+    Compiles each regular expression once.
+
+    Fixed patterns stay compiled for the life of the process. Patterns built
+    around an element name are kept in an LRU cache, and their counters are
+    aggregated per template, so stylesheets with many distinct element names
+    neither grow the registry without bound nor hide where time is spent.
+    """
+
+    def __init__(self, max_element_patterns: int = PerformanceConfig.MAX_CACHED_PATTERNS):
+        self._patterns: Dict[Tuple[str, int], RegisteredPattern] = {}
+        self._group_stats: Dict[Tuple[str, int], PatternStats] = {}
+        self._element_patterns = ExpiringLRUCache(max_entries=max_element_patterns)
+        self._lock = threading.Lock()
+
+    def compile(self, pattern: str, flags: int = 0) -> RegisteredPattern:
+        """Compiled form of a fixed pattern"""
+        registered = self._patterns.get((pattern, flags))
+        if registered is None:
+            with self._lock:
+                registered = self._patterns.get((pattern, flags))
+                if registered is None:
+                    registered = RegisteredPattern(re.compile(pattern, flags), PatternStats(pattern, compiles=1))
+                    self._patterns[(pattern, flags)] = registered
+        return registered
+
+    def config(self, name: str, flags: int = 0) -> RegisteredPattern:
+        """Compiled form of the PatternConfig pattern with this attribute name"""
+        return self.compile(getattr(PatternConfig, name), flags)
+
+    def element(self, template: str, name: str, flags: int = 0, escape: bool = True) -> RegisteredPattern:
+        """
+        Compiled pattern for one element name, with every {name} in the template replaced by it.
+        With escape=False the name is inserted as a pattern, as older callers expect.
+        """
+        def compile_element_pattern():
+            with self._lock:
+                stats = self._group_stats.setdefault((template, flags), PatternStats(template))
+                stats.compiles += 1
+            pattern = template.replace('{name}', re.escape(name) if escape else name)
+            return RegisteredPattern(re.compile(pattern, flags), stats)
+
+        return self._element_patterns.get_or_create(f"{flags}:{int(escape)}:{template}\x00{name}",
+                                                    compile_element_pattern)
+
+    def record(self, group: str, started: float, calls: int = 1) -> None:
+        """
+        Add match time measured by the caller under a group name, for loops that
+        call the compiled patterns directly because timing every call would cost
+        more than the matching itself
+        """
+        with self._lock:
+            stats = self._group_stats.setdefault((group, 0), PatternStats(group))
+            stats.match_seconds += time.perf_counter() - started
+            stats.calls += calls
+
+    def stats(self) -> List[PatternStats]:
+        """Counters of every fixed pattern, element template and recorded group, slowest first"""
+        with self._lock:
+            stats = [registered.stats for registered in self._patterns.values()]
+            stats.extend(self._group_stats.values())
+        return sorted(stats, key=lambda entry: entry.match_seconds, reverse=True)
+
+    def as_dict(self, limit: int = 10) -> Dict[str, object]:
+        stats = self.stats()
+        return {
+            'patterns': len(self._patterns),
+            'groups': len(self._group_stats),
+            'cached_element_patterns': len(self._element_patterns),
+            'compiles': sum(entry.compiles for entry in stats),
+            'calls': sum(entry.calls for entry in stats),
+            'match_ms': round(sum(entry.match_seconds for entry in stats) * 1000, 3),
+            'element_pattern_cache': self._element_patterns.stats.as_dict(),
+            'slowest': [entry.as_dict() for entry in stats[:limit]]
+        }
+
+
+regex_registry = RegexRegistry()
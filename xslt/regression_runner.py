@@ -0,0 +1,338 @@
+import difflib
+import os
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Deque, Dict, Iterable, List, Optional, Tuple, Union
+from .coverage_map import CoverageMap
+from .module_resolver import module_resolver
+from .stylesheet_cache import cache_directory, content_hash, private_directory, source_hash
+from .transform_sandbox import TransformSandbox, XmlInput, transform_sandbox
+from .xslt_updater_config import PathConfig, TestConfig
+
+
+class _WhitespaceTextFilter:
+    """Parser target that drops text nodes made only of whitespace and passes everything else on"""
+
+    def __init__(self, target):
+        self._target = target
+        self._data: List[str] = []
+
+    def _flush(self) -> None:
+        text = ''.join(self._data)
+        self._data = []
+        if text.strip():
+            self._target.data(text)
+
+    def data(self, data: str) -> None:
+        self._data.append(data)
+
+    def start_ns(self, prefix: str, uri: str) -> None:
+        self._flush()
+        self._target.start_ns(prefix, uri)
+
+    def start(self, tag: str, attributes: Dict[str, str]) -> None:
+        self._flush()
+        self._target.start(tag, attributes)
+
+    def end(self, tag: str) -> None:
+        self._flush()
+        self._target.end(tag)
+
+    def comment(self, text: str) -> None:
+        self._flush()
+        self._target.comment(text)
+
+    def pi(self, target: str, data: Optional[str] = None) -> None:
+        self._flush()
+        self._target.pi(target, data)
+
+    def close(self) -> None:
+        self._flush()
+
+
+def canonicalize_xml(xml: str, ignore_whitespace: bool = True, ignore_comments: bool = True) -> str:
+    """
+    Canonical XML (C14N 2.0) form of a document; attributes are always put in a fixed order.
+    With ignore_whitespace, text nodes made only of whitespace are dropped; other text is kept as is.
+    """
+    output: List[str] = []
+    target = ET.C14NWriterTarget(output.append, with_comments=not ignore_comments)
+    parser = ET.XMLParser(target=_WhitespaceTextFilter(target) if ignore_whitespace else target)
+    parser.feed(xml)
+    parser.close()
+    return ''.join(output)
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit('}', 1)[-1] if isinstance(tag, str) else str(tag)
+
+
+def _normalize_text(text: Optional[str], ignore_whitespace: bool) -> str:
+    text = text or ''
+    return '' if ignore_whitespace and not text.strip() else text
+
+
+def _shorten(text: str, limit: int = 60) -> str:
+    return text if len(text) <= limit else text[:limit - 3] + '...'
+
+
+def _child_paths(parent_path: str, children: List[ET.Element]) -> List[str]:
+    """XPath-like step for each child, numbering siblings that share a name"""
+    totals: Dict[str, int] = {}
+    for child in children:
+        totals[child.tag] = totals.get(child.tag, 0) + 1
+    seen: Dict[str, int] = {}
+    paths = []
+    for child in children:
+        seen[child.tag] = seen.get(child.tag, 0) + 1
+        step = _local_name(child.tag)
+        if totals[child.tag] > 1:
+            step += f"[{seen[child.tag]}]"
+        paths.append(f"{parent_path}/{step}")
+    return paths
+
+
+def structural_diff(expected: str, actual: str, ignore_whitespace: bool = True,
+                    max_differences: int = TestConfig.MAX_REGRESSION_DIFFS) -> List[str]:
+    """Compact list of element, attribute and text differences between two XML documents"""
+    differences: List[str] = []
+
+    def report(message: str) -> bool:
+        differences.append(message)
+        return len(differences) < max_differences
+
+    def compare(old: ET.Element, new: ET.Element, path: str) -> bool:
+        if old.tag != new.tag:
+            return report(f"{path}: <{_local_name(old.tag)}> replaced by <{_local_name(new.tag)}>")
+        for name in sorted(set(old.attrib) | set(new.attrib)):
+            if name not in new.attrib:
+                ok = report(f"{path}/@{_local_name(name)}: removed (was '{_shorten(old.attrib[name])}')")
+            elif name not in old.attrib:
+                ok = report(f"{path}/@{_local_name(name)}: added '{_shorten(new.attrib[name])}'")
+            elif old.attrib[name] != new.attrib[name]:
+                ok = report(f"{path}/@{_local_name(name)}: '{_shorten(old.attrib[name])}' -> '{_shorten(new.attrib[name])}'")
+            else:
+                continue
+            if not ok:
+                return False
+        old_text = _normalize_text(old.text, ignore_whitespace)
+        new_text = _normalize_text(new.text, ignore_whitespace)
+        if old_text != new_text and not report(f"{path}/text(): '{_shorten(old_text)}' -> '{_shorten(new_text)}'"):
+            return False
+
+        old_children, new_children = list(old), list(new)
+        old_paths, new_paths = _child_paths(path, old_children), _child_paths(path, new_children)
+        # Align children by name so an inserted element does not show up as every later sibling changing
+        matcher = difflib.SequenceMatcher(a=[c.tag for c in old_children], b=[c.tag for c in new_children],
+                                          autojunk=False)
+        for opcode, i1, i2, j1, j2 in matcher.get_opcodes():
+            paired = min(i2 - i1, j2 - j1) if opcode in ('equal', 'replace') else 0
+            for offset in range(paired):
+                if not compare(old_children[i1 + offset], new_children[j1 + offset], new_paths[j1 + offset]):
+                    return False
+            for index in range(i1 + paired, i2):
+                if not report(f"{old_paths[index]}: element removed"):
+                    return False
+            for index in range(j1 + paired, j2):
+                if not report(f"{new_paths[index]}: element added"):
+                    return False
+            for offset in range(paired):
+                old_tail = _normalize_text(old_children[i1 + offset].tail, ignore_whitespace)
+                new_tail = _normalize_text(new_children[j1 + offset].tail, ignore_whitespace)
+                if old_tail != new_tail and not report(
+                        f"{new_paths[j1 + offset]} (following text): '{_shorten(old_tail)}' -> '{_shorten(new_tail)}'"):
+                    return False
+        return True
+
+    try:
+        old_root, new_root = ET.fromstring(expected), ET.fromstring(actual)
+    except ET.ParseError:
+        # Not well-formed XML (e.g. text output): fall back to a line diff
+        lines = difflib.unified_diff(expected.splitlines(), actual.splitlines(), 'original', 'updated', n=0, lineterm='')
+        return [line for line in lines if not line.startswith(('---', '+++'))][:max_differences]
+
+    compare(old_root, new_root, f"/{_local_name(new_root.tag)}")
+    if len(differences) >= max_differences:
+        differences.append("... further differences omitted")
+    return differences
+
+
+class BaselineStore:
+    """
+    On-disk cache of baseline outputs keyed by stylesheet and input hash.
+    The least recently used outputs are removed once the directory holds more than max_mb.
+    """
+
+    def __init__(self, directory: Optional[Union[str, Path]] = None,
+                 max_mb: float = TestConfig.MAX_BASELINE_STORE_MB):
+        self.directory = cache_directory(directory or PathConfig.REGRESSION_BASELINE_DIR, "regression_baselines")
+        self.max_mb = max_mb
+
+    @staticmethod
+    def key(xslt: str, xml: str) -> str:
+        # The stylesheet part covers included modules, so editing a module retires its baselines
+        return content_hash(module_resolver.bundle_hash(xslt), source_hash(xml))
+
+    def get(self, key: str) -> Optional[str]:
+        try:
+            path = private_directory(self.directory) / f"{key}.xml"
+            with open(path, "r", encoding="utf-8", newline='') as f:
+                output = f.read()
+            # The modification time orders outputs for eviction, so a read counts as a use
+            os.utime(path)
+            return output
+        except OSError:
+            return None
+
+    def put(self, key: str, output: str) -> None:
+        try:
+            with tempfile.NamedTemporaryFile("w", encoding="utf-8", newline='', dir=private_directory(self.directory),
+                                             suffix=".tmp", delete=False) as f:
+                f.write(output)
+            os.replace(f.name, self.directory / f"{key}.xml")
+            self._evict()
+        except OSError:
+            pass  # Stored baselines are an optimization; without them both stylesheets run every time
+
+    def _evict(self) -> None:
+        """Remove the least recently used outputs while the directory holds more than max_mb"""
+        files = []
+        for path in self.directory.glob("*.xml"):
+            try:
+                status = path.stat()
+            except OSError:
+                continue
+            files.append((status.st_mtime, status.st_size, path))
+        excess = sum(size for _, size, _ in files) - self.max_mb * 1024 * 1024
+        for _, size, path in sorted(files, key=lambda item: item[0]):
+            if excess <= 0:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            excess -= size
+
+
+@dataclass
+class RegressionCase:
+    """Comparison of the original and updated stylesheet output for one input"""
+    name: str
+    changed: bool
+    differences: List[str] = field(default_factory=list)
+    baseline_error: Optional[str] = None
+    updated_error: Optional[str] = None
+    baseline_cached: bool = False
+
+    @property
+    def failed(self) -> bool:
+        return self.baseline_error is not None or self.updated_error is not None
+
+
+@dataclass
+class RegressionReport:
+    """Outcome of running a corpus through the original and updated stylesheets"""
+    cases: List[RegressionCase] = field(default_factory=list)
+    skipped: List[str] = field(default_factory=list)
+    elapsed_seconds: float = 0.0
+
+    @property
+    def changed_cases(self) -> List[RegressionCase]:
+        return [case for case in self.cases if case.changed or case.failed]
+
+    def as_dict(self) -> Dict[str, object]:
+        return {
+            'total': len(self.cases),
+            'changed': sum(1 for case in self.cases if case.changed and not case.failed),
+            'failed': sum(1 for case in self.cases if case.failed),
+            'unchanged': sum(1 for case in self.cases if not case.changed and not case.failed),
+            'skipped_by_coverage': len(self.skipped),
+            'baseline_cache_hits': sum(1 for case in self.cases if case.baseline_cached),
+            'elapsed_seconds': round(self.elapsed_seconds, 3)
+        }
+
+
+def load_corpus(directory: Union[str, Path]) -> List[Tuple[str, Path]]:
+    """List every *.xml file below a directory as (relative name, path) pairs; the transforms read the files"""
+    root = Path(directory)
+    return [(str(path.relative_to(root)), path) for path in sorted(root.rglob("*.xml")) if path.is_file()]
+
+
+# A regression job: input name, baseline key, stored baseline, and the baseline and updated transforms
+RegressionJob = Tuple[str, str, Optional[str], Optional[Future], Future]
+
+
+def _compare_job(job: RegressionJob, store: BaselineStore, ignore_whitespace: bool,
+                 ignore_comments: bool) -> RegressionCase:
+    """Wait for one job's transforms and compare the updated output with the baseline"""
+    name, baseline_key, baseline, baseline_future, updated_future = job
+    case = RegressionCase(name=name, changed=False, baseline_cached=baseline is not None)
+    if baseline_future is not None:
+        outcome = baseline_future.result()
+        if outcome.success:
+            baseline = outcome.output
+            store.put(baseline_key, baseline)
+        else:
+            case.baseline_error = f"{outcome.failure.reason}: {outcome.failure.detail}"
+    outcome = updated_future.result()
+    if not outcome.success:
+        case.updated_error = f"{outcome.failure.reason}: {outcome.failure.detail}"
+
+    if not case.failed:
+        try:
+            case.changed = (canonicalize_xml(baseline, ignore_whitespace, ignore_comments)
+                            != canonicalize_xml(outcome.output, ignore_whitespace, ignore_comments))
+        except ET.ParseError:
+            case.changed = baseline != outcome.output
+        if case.changed:
+            case.differences = structural_diff(baseline, outcome.output, ignore_whitespace)
+    return case
+
+
+def run_regression(original_xslt: str, updated_xslt: str, inputs: Iterable[Tuple[str, XmlInput]],
+                   ignore_whitespace: bool = True, ignore_comments: bool = True,
+                   store: Optional[BaselineStore] = None,
+                   sandbox: Optional[TransformSandbox] = None,
+                   coverage: Optional[CoverageMap] = None) -> RegressionReport:
+    """
+    Transform each input with both stylesheets in parallel and report the inputs whose output changed.
+    With a coverage map of the original stylesheet, inputs that never reach an edited region are skipped.
+    """
+    store = store or BaselineStore()
+    sandbox = sandbox or transform_sandbox
+    started = time.perf_counter()
+    report = RegressionReport()
+
+    if coverage is not None:
+        affected = set(coverage.affected_inputs(original_xslt, updated_xslt))
+        selected = []
+        for name, xml in inputs:
+            # Inputs missing from the map have no recorded coverage and always run
+            if name in affected or name not in coverage.reached:
+                selected.append((name, xml))
+            else:
+                report.skipped.append(name)
+        inputs = selected
+
+    # Baselines found in the store are reused, so repeat runs only execute the updated stylesheet.
+    # Only a window of jobs is in flight and each is compared in input order as soon as it is the oldest,
+    # so outputs of a large corpus are not all held at once
+    window = 2 * sandbox.size
+    pending: Deque[RegressionJob] = deque()
+    for name, xml in inputs:
+        baseline_key = store.key(original_xslt, xml)
+        baseline = store.get(baseline_key)
+        baseline_future = sandbox.submit(original_xslt, xml) if baseline is None else None
+        pending.append((name, baseline_key, baseline, baseline_future, sandbox.submit(updated_xslt, xml)))
+        if len(pending) >= window:
+            report.cases.append(_compare_job(pending.popleft(), store, ignore_whitespace, ignore_comments))
+    while pending:
+        report.cases.append(_compare_job(pending.popleft(), store, ignore_whitespace, ignore_comments))
+
+    report.elapsed_seconds = time.perf_counter() - started
+    return report
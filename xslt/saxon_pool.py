@@ -0,0 +1,136 @@
+import atexit
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional
+import saxonche
+from .xslt_updater_config import PerformanceConfig
+
+
+@dataclass
+class SaxonSlot:
+    """A Saxon processor owned by the pool and leased to one thread at a time"""
+    index: int
+    processor: saxonche.PySaxonProcessor
+    xslt30_processor: object
+    generation: int = 0
+    created_at: float = field(default_factory=time.time)
+    transforms: int = 0
+
+    @property
+    def cache_prefix(self) -> str:
+        """Prefix for cache keys of objects that belong to this processor"""
+        return f"{self.index}.{self.generation}"
+
+
+class SaxonProcessorPool:
+    """Process-wide pool of Saxon processors created lazily and kept for the life of the process"""
+
+    HEALTH_CHECK_XML = '<health/>'
+
+    def __init__(self, size: Optional[int] = None):
+        self._size = size
+        self._slots: List[SaxonSlot] = []
+        self._idle: List[SaxonSlot] = []
+        self._condition = threading.Condition()
+        self._closed = False
+
+    @property
+    def size(self) -> int:
+        """Configured size, read on use so a process can set SAXON_POOL_SIZE after this module is imported"""
+        return self._size or PerformanceConfig.SAXON_POOL_SIZE or os.cpu_count() or 1
+
+    def _create_slot(self, index: int, generation: int = 0) -> SaxonSlot:
+        processor = saxonche.PySaxonProcessor(license=False)
+        return SaxonSlot(
+            index=index,
+            processor=processor,
+            xslt30_processor=processor.new_xslt30_processor(),
+            generation=generation
+        )
+
+    def acquire(self, timeout: Optional[float] = None) -> SaxonSlot:
+        """Take an idle slot, creating a new processor while the pool is below its size"""
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Saxon processor pool has been shut down")
+                if self._idle:
+                    return self._idle.pop()
+                if len(self._slots) < self.size:
+                    slot = self._create_slot(len(self._slots))
+                    self._slots.append(slot)
+                    return slot
+                if not self._condition.wait(timeout):
+                    raise TimeoutError("Timed out waiting for a Saxon processor")
+
+    def release(self, slot: SaxonSlot) -> None:
+        """Return a slot to the pool"""
+        with self._condition:
+            if not self._closed:
+                self._idle.append(slot)
+            self._condition.notify()
+
+    @contextmanager
+    def lease(self, timeout: Optional[float] = None) -> Iterator[SaxonSlot]:
+        """Context manager that acquires a slot and always gives it back"""
+        slot = self.acquire(timeout)
+        try:
+            yield slot
+            slot.transforms += 1
+        finally:
+            self.release(slot)
+
+    def _is_healthy(self, slot: SaxonSlot) -> bool:
+        try:
+            slot.processor.parse_xml(xml_text=self.HEALTH_CHECK_XML)
+            return True
+        except Exception:
+            return False
+
+    def health_check(self) -> Dict[str, object]:
+        """Probe idle processors, replacing any that no longer respond"""
+        with self._condition:
+            idle = list(self._idle)
+            self._idle.clear()
+
+        replaced = 0
+        checked = []
+        for slot in idle:
+            if not self._is_healthy(slot):
+                fresh = self._create_slot(slot.index, slot.generation + 1)
+                with self._condition:
+                    self._slots[slot.index] = fresh
+                slot = fresh
+                replaced += 1
+            checked.append(slot)
+
+        with self._condition:
+            if self._closed:
+                checked = []
+            self._idle.extend(checked)
+            self._condition.notify_all()
+            return {
+                'healthy': not self._closed,
+                'size': self.size,
+                'created': len(self._slots),
+                'idle': len(self._idle),
+                'in_use': len(self._slots) - len(self._idle),
+                'checked': len(checked),
+                'replaced': replaced,
+                'transforms': sum(slot.transforms for slot in self._slots)
+            }
+
+    def shutdown(self) -> None:
+        """Drop all processors and refuse further leases"""
+        with self._condition:
+            self._closed = True
+            self._idle.clear()
+            self._slots.clear()
+            self._condition.notify_all()
+
+
+saxon_pool = SaxonProcessorPool()
+atexit.register(saxon_pool.shutdown)
@@ -0,0 +1,209 @@
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+from .regex_registry import regex_registry
+from .stylesheet_cache import ExpiringLRUCache, cache_directory, content_hash, private_directory
+from .xslt_updater_config import PathConfig, TestConfig
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
+
+POSITION_PREDICATE_PATTERN = regex_registry.compile(r'\[\d+\]')
+
+# Compiled schemas keyed by thread and the hash of every schema document they were built from.
+# An XMLSchema object keeps the error log of its last run, so each thread validates with its own copy.
+compiled_schema_cache = ExpiringLRUCache(max_entries=TestConfig.MAX_CACHED_SCHEMAS)
+
+_executor_lock = threading.Lock()
+_validation_executor: Optional[ThreadPoolExecutor] = None
+
+
+def validation_executor() -> ThreadPoolExecutor:
+    """Process-wide validation threads; they live as long as the process so their compiled schemas are reused"""
+    global _validation_executor
+    with _executor_lock:
+        if _validation_executor is None:
+            _validation_executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1,
+                                                      thread_name_prefix="schema-validation")
+        return _validation_executor
+
+
+@dataclass
+class SchemaViolation:
+    """One validation error in one output"""
+    path: str
+    message: str
+    line: int
+    type_name: str = ''
+
+
+@dataclass
+class ValidationResult:
+    """Validation outcome of one transform output"""
+    name: str
+    violations: List[SchemaViolation] = field(default_factory=list)
+    error: Optional[str] = None
+
+    @property
+    def valid(self) -> bool:
+        return self.error is None and not self.violations
+
+
+@dataclass
+class ViolationGroup:
+    """Violations of one kind at one schema location, across all outputs of a batch"""
+    path: str
+    type_name: str
+    example: str
+    count: int = 0
+    inputs: List[str] = field(default_factory=list)
+
+
+@dataclass
+class ValidationReport:
+    """Validation outcome of a batch with violations aggregated by XPath"""
+    results: List[ValidationResult] = field(default_factory=list)
+    elapsed_seconds: float = 0.0
+
+    @property
+    def invalid(self) -> List[ValidationResult]:
+        return [result for result in self.results if not result.valid]
+
+    def groups(self) -> List[ViolationGroup]:
+        """Violations grouped by element path (ignoring positions) and error type, most frequent first"""
+        groups: Dict[Tuple[str, str], ViolationGroup] = {}
+        for result in self.results:
+            for violation in result.violations:
+                path = POSITION_PREDICATE_PATTERN.sub('', violation.path)
+                group = groups.setdefault((path, violation.type_name),
+                                          ViolationGroup(path=path, type_name=violation.type_name,
+                                                         example=violation.message))
+                group.count += 1
+                if result.name not in group.inputs:
+                    group.inputs.append(result.name)
+        return sorted(groups.values(), key=lambda group: group.count, reverse=True)
+
+    def as_records(self) -> List[Dict[str, object]]:
+        return [{
+            'path': group.path,
+            'violations': group.count,
+            'outputs': len(group.inputs),
+            'type': group.type_name,
+            'example': group.example
+        } for group in self.groups()]
+
+    def as_dict(self) -> Dict[str, object]:
+        return {
+            'validated': len(self.results),
+            'valid': sum(1 for result in self.results if result.valid),
+            'invalid': len(self.invalid),
+            'violations': sum(len(result.violations) for result in self.results),
+            'elapsed_seconds': round(self.elapsed_seconds, 3)
+        }
+
+
+def schema_bundle_hash(documents: Dict[str, bytes]) -> str:
+    """Hash of a set of schema documents by file name, independent of their order"""
+    return content_hash(*(f"{name}\x00{content_hash(documents[name])}" for name in sorted(documents)))
+
+
+def _schema_directory(bundle_hash: str) -> Path:
+    root = private_directory(cache_directory(PathConfig.SCHEMA_CACHE_DIR, "schemas"))
+    return private_directory(root / bundle_hash)
+
+
+class SchemaValidator:
+    """
+    Validates transform outputs against an XSD compiled once per distinct schema set.
+
+    Schemas that include or import other schema documents are passed as a dict of
+    relative path to content (e.g. "common/types.xsd"), so relative schemaLocation
+    references resolve between them.
+    """
+
+    def __init__(self, schema: Union[str, Path, Dict[str, bytes]], main: Optional[str] = None):
+        if lxml_etree is None:
+            raise RuntimeError("Schema validation needs lxml, which is not installed")
+        if isinstance(schema, dict):
+            self.schema_hash = schema_bundle_hash(schema)
+            self.schema_path = self._write_documents(schema, main or next(iter(schema)))
+        else:
+            self.schema_path = Path(schema).resolve()
+            status = self.schema_path.stat()
+            self.schema_hash = content_hash(str(self.schema_path), status.st_mtime_ns, status.st_size)
+        # Compile here so a broken schema fails before any output is validated
+        self._schema()
+
+    def _write_documents(self, documents: Dict[str, bytes], main: str) -> Path:
+        # Written once per schema set, so repeat uploads reuse the files; a file that differs is replaced
+        directory = _schema_directory(self.schema_hash)
+        for name, content in documents.items():
+            path = self._document_path(directory, name)
+            if path.is_file() and content_hash(path.read_bytes()) == content_hash(content):
+                continue
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=path.parent, suffix=".tmp", delete=False) as f:
+                f.write(content)
+            os.replace(f.name, path)
+        return self._document_path(directory, main)
+
+    @staticmethod
+    def _document_path(directory: Path, name: str) -> Path:
+        """Where a schema document is written; its directories are kept so relative references between them resolve"""
+        relative = Path(name.replace('\\', '/'))
+        if relative.is_absolute() or '..' in relative.parts:
+            raise ValueError(f"Schema document name must be a path inside the schema set: {name}")
+        return directory / relative
+
+    def _schema(self):
+        return compiled_schema_cache.get_or_create(
+            f"{threading.get_ident()}:{self.schema_hash}",
+            lambda: lxml_etree.XMLSchema(lxml_etree.parse(str(self.schema_path))))
+
+    def validate(self, name: str, output: Union[str, bytes, Path]) -> ValidationResult:
+        """
+        Validate one output, given as text, bytes or the path of an output file.
+        A document that is not well-formed, or any other failure, is reported as an error.
+        """
+        result = ValidationResult(name=name)
+        try:
+            if isinstance(output, os.PathLike):
+                document = lxml_etree.parse(os.fspath(output))
+            elif isinstance(output, str):
+                document = lxml_etree.fromstring(output.encode('utf-8'), lxml_etree.XMLParser(encoding='utf-8'))
+            else:
+                document = lxml_etree.fromstring(bytes(output))
+        except lxml_etree.XMLSyntaxError as e:
+            result.error = f"Output is not well-formed XML: {e}"
+            return result
+        except OSError as e:
+            result.error = f"Output could not be read: {e}"
+            return result
+
+        try:
+            validator = self._schema()
+            if not validator.validate(document):
+                for error in validator.error_log:
+                    result.violations.append(SchemaViolation(path=error.path or '', message=error.message,
+                                                             line=error.line, type_name=error.type_name))
+        except Exception as e:
+            result.error = f"Output could not be validated: {e}"
+        return result
+
+    def submit(self, name: str, output: Union[str, bytes]) -> "Future[ValidationResult]":
+        """Validate an output on the shared validation threads"""
+        return validation_executor().submit(self.validate, name, output)
+
+    def validate_many(self, outputs: Iterable[Tuple[str, Union[str, bytes]]]) -> ValidationReport:
+        """Validate outputs in parallel; libxml2 validates without holding the GIL"""
+        started = time.perf_counter()
+        futures = [self.submit(name, output) for name, output in outputs]
+        return ValidationReport(results=[future.result() for future in futures],
+                                elapsed_seconds=time.perf_counter() - started)
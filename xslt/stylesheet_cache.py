@@ -0,0 +1,189 @@
+import hashlib
+import json
+import mmap
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+from .xslt_updater_config import PerformanceConfig
+
+
+def content_hash(*parts: Any) -> str:
+    """Return a stable SHA-256 hex digest for the given content parts"""
+    digest = hashlib.sha256()
+    for part in parts:
+        if part is None:
+            part = ''
+        if not isinstance(part, (bytes, bytearray, memoryview, mmap.mmap)):
+            part = str(part).encode('utf-8')
+        digest.update(part)
+        digest.update(b'\x00')
+    return digest.hexdigest()
+
+
+def file_hash(path: "os.PathLike") -> str:
+    """content_hash of a file's bytes, read in chunks rather than loaded whole"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    digest.update(b'\x00')
+    return digest.hexdigest()
+
+
+def source_hash(xml: Any) -> str:
+    """Content hash of an XML input given as text, bytes, a buffer or a file path"""
+    if isinstance(xml, os.PathLike):
+        return file_hash(xml)
+    return content_hash(xml)
+
+
+def cache_directory(configured: Optional[Union[str, Path]], name: str) -> Path:
+    """The configured directory, or name under the user's cache directory (XDG_CACHE_HOME or ~/.cache)"""
+    if configured:
+        return Path(configured)
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return Path(base) / 'genie_core_xslt' / name
+
+
+def private_directory(directory: Path) -> Path:
+    """
+    Create a cache directory readable by the current user only, and refuse one
+    owned by another user, whose files could have been planted to be trusted
+    """
+    directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+    if hasattr(os, 'getuid'):
+        uid = os.getuid()
+        if os.lstat(directory).st_uid != uid or directory.stat().st_uid != uid:
+            raise PermissionError(f"Cache directory {directory} is not owned by the current user")
+    return directory
+
+
+@dataclass
+class CacheStats:
+    """Counters describing cache effectiveness"""
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'hit_rate': round(self.hit_rate, 4)
+        }
+
+
+class ExpiringLRUCache:
+    """Thread-safe LRU cache whose entries also expire after a fixed age"""
+
+    def __init__(self, max_entries: int = PerformanceConfig.MAX_CACHE_ENTRIES,
+                 expiry_hours: float = PerformanceConfig.CACHE_EXPIRY_HOURS):
+        self.max_entries = max_entries
+        self.ttl_seconds = expiry_hours * 3600
+        self.stats = CacheStats()
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for key, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats.misses += 1
+                return None
+
+            created_at, value = entry
+            if time.monotonic() - created_at > self.ttl_seconds:
+                del self._entries[key]
+                self.stats.expirations += 1
+                self.stats.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            return value
+
+    def put(self, key: str, value: Any) -> None:
+        """Store value under key, evicting the least recently used entries"""
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats.evictions += 1
+
+    def get_or_create(self, key: str, factory: Callable[[], Any]) -> Any:
+        """Return the cached value for key, building and storing it on a miss"""
+        value = self.get(key)
+        if value is None:
+            value = factory()
+            self.put(key, value)
+        return value
+
+    def discard(self, key: str) -> bool:
+        """Remove key from the cache, returning True if it was present"""
+        with self._lock:
+            return self._entries.pop(key, None) is not None
+
+    def clear(self) -> None:
+        """Drop all entries and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self.stats = CacheStats()
+
+    def values(self) -> List[Any]:
+        """Snapshot of the cached values, including entries that have expired but not been evicted"""
+        with self._lock:
+            return [value for _, value in self._entries.values()]
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+# Compiled XSLT executables keyed by the content hash of the stylesheet text
+compiled_stylesheet_cache = ExpiringLRUCache()
+
+
+def stylesheet_cache_key(stylesheet_text: str) -> str:
+    """Build the cache key for a stylesheet; parameter values are already substituted into the text"""
+    return content_hash(stylesheet_text)
+
+
+# Transform outputs keyed by stylesheet, input and parameter hashes
+transform_result_cache = ExpiringLRUCache()
+
+# Parsed input documents; these can be large, so far fewer are kept
+parsed_document_cache = ExpiringLRUCache(max_entries=PerformanceConfig.MAX_CACHED_DOCUMENTS)
+
+
+def parameters_cache_key(parameters: Any) -> str:
+    """Stable text form of transform parameters given as a dict, pairs or a DataFrame"""
+    if parameters is None:
+        return ''
+    if isinstance(parameters, dict):
+        return json.dumps(parameters, sort_keys=True, default=str)
+    if hasattr(parameters, 'to_json'):
+        return parameters.to_json()
+    return json.dumps([list(pair) for pair in parameters], default=str)
+
+
+def transform_cache_key(stylesheet_key: str, xml: str, parameters: Any = None) -> str:
+    """Build the cache key for a transform output from the stylesheet's cache key"""
+    return content_hash(stylesheet_key, source_hash(xml), parameters_cache_key(parameters))
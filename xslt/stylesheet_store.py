@@ -0,0 +1,193 @@
+import atexit
+import json
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+from .stylesheet_cache import cache_directory, private_directory
+from .xslt_updater_config import PathConfig, PerformanceConfig
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Windows: the index is not locked across processes
+
+
+class StylesheetStore:
+    """
+    On-disk store of stylesheets that compiled successfully, keyed by content hash.
+
+    Saxon-EE exports a compiled SEF file next to the source, which later compiles load
+    instead of the source. Other editions keep the validated source and usage metadata,
+    which the start-up warm-up uses to compile the most used stylesheets ahead of time.
+
+    Use counts are kept in memory and written to the index by a background thread
+    and at exit. The index is only changed under a file lock, since sandbox workers
+    and server processes share it, and the least used stylesheets are evicted once
+    the store holds more than max_entries.
+    """
+
+    INDEX_FILENAME = "index.json"
+    LOCK_FILENAME = "index.lock"
+
+    def __init__(self, directory: Optional[Union[str, Path]] = None,
+                 max_entries: int = PerformanceConfig.MAX_STORED_STYLESHEETS,
+                 flush_interval: float = PerformanceConfig.STORE_FLUSH_SECONDS):
+        self.directory = cache_directory(directory or PathConfig.STYLESHEET_STORE_DIR, "stylesheet_store")
+        self.max_entries = max_entries
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pending_uses: Counter = Counter()
+        self._flush_thread: Optional[threading.Thread] = None
+
+    def _path(self, key: str, suffix: str) -> Path:
+        return self.directory / f"{key}{suffix}"
+
+    def _write_atomic(self, path: Path, data: str) -> None:
+        private_directory(self.directory)
+        temp_path = path.with_suffix(f"{path.suffix}.{os.getpid()}.tmp")
+        with open(temp_path, "w", encoding="utf-8", newline='') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    def load_index(self) -> Dict[str, Dict[str, object]]:
+        try:
+            with open(private_directory(self.directory) / self.INDEX_FILENAME, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    @contextmanager
+    def _index_lock(self) -> Iterator[None]:
+        """Hold the index exclusively against other processes sharing the store"""
+        with open(private_directory(self.directory) / self.LOCK_FILENAME, "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _update_index(self, updates: Dict[str, Dict[str, object]], uses: Counter) -> None:
+        # Several processes share the store, so merge into the current file rather than overwrite it
+        with self._index_lock():
+            index = self.load_index()
+            now = time.time()
+            for key, metadata in updates.items():
+                index.setdefault(key, {'uses': 0, 'last_used': now}).update(metadata)
+            for key, count in uses.items():
+                if key in index:
+                    index[key]['uses'] = index[key].get('uses', 0) + count
+                    index[key]['last_used'] = now
+            evicted = self._evict(index, protected=set(updates))
+            self._write_atomic(self.directory / self.INDEX_FILENAME, json.dumps(index, indent=2, sort_keys=True))
+            for key in evicted:
+                for suffix in (".xsl", ".sef"):
+                    try:
+                        os.remove(self._path(key, suffix))
+                    except OSError:
+                        pass
+
+    def _evict(self, index: Dict[str, Dict[str, object]], protected: set) -> List[str]:
+        """Remove the least used entries beyond max_entries from the index, returning their keys"""
+        if len(index) <= self.max_entries:
+            return []
+        ranked = sorted((key for key in index if key not in protected),
+                        key=lambda key: (index[key].get('uses', 0), index[key].get('last_used', 0)))
+        evicted = ranked[:len(index) - self.max_entries]
+        for key in evicted:
+            del index[key]
+        return evicted
+
+    @staticmethod
+    def sef_supported(slot) -> bool:
+        """SEF export needs Saxon-EE"""
+        return 'EE' in (getattr(slot.processor, 'version', '') or '')
+
+    def compile(self, slot, xslt: str, key: str):
+        """Compile a stylesheet for a pool slot, loading a stored SEF when one matches this Saxon version"""
+        try:
+            private_directory(self.directory)
+        except OSError:
+            # Files in a directory that cannot be trusted are neither loaded nor added to
+            return slot.xslt30_processor.compile_stylesheet(stylesheet_text=xslt)
+        version = getattr(slot.processor, 'version', '')
+        sef_path = self._path(key, ".sef")
+        metadata = self.load_index().get(key, {})
+        if sef_path.exists() and metadata.get('saxon_version') == version:
+            try:
+                return slot.xslt30_processor.compile_stylesheet(stylesheet_file=str(sef_path))
+            except Exception:
+                pass  # Fall back to compiling the source below
+
+        stored = self._path(key, ".xsl").exists()
+        export = not stored and self.sef_supported(slot)
+        started = time.perf_counter()
+        if export:
+            compiled_xslt = slot.xslt30_processor.compile_stylesheet(stylesheet_text=xslt, save=True,
+                                                                     output_file=str(sef_path))
+        else:
+            compiled_xslt = slot.xslt30_processor.compile_stylesheet(stylesheet_text=xslt)
+        if not stored:
+            self.save(key, xslt, {
+                'size': len(xslt),
+                'saxon_version': version,
+                'sef': export and sef_path.exists(),
+                'compile_ms': round((time.perf_counter() - started) * 1000, 3),
+                'stored_at': time.time()
+            })
+        return compiled_xslt
+
+    def save(self, key: str, xslt: str, metadata: Dict[str, object]) -> None:
+        """Keep a stylesheet that compiled successfully"""
+        try:
+            self._write_atomic(self._path(key, ".xsl"), xslt)
+            self._update_index({key: metadata}, Counter())
+        except OSError:
+            pass  # The store is an optimization; a read-only disk must not break transforms
+
+    def note_use(self, key: str) -> None:
+        """Count a use of a stylesheet in memory; the background flush writes it to the index"""
+        with self._lock:
+            self._pending_uses[key] += 1
+            if self._flush_thread is None:
+                self._flush_thread = threading.Thread(target=self._flush_periodically, name="stylesheet-store-flush",
+                                                      daemon=True)
+                self._flush_thread.start()
+
+    def _flush_periodically(self) -> None:
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self) -> None:
+        """Write pending use counts to the index"""
+        with self._lock:
+            uses, self._pending_uses = self._pending_uses, Counter()
+        if uses:
+            try:
+                self._update_index({}, uses)
+            except OSError:
+                pass
+
+    def most_used(self, limit: int) -> List[Tuple[str, str]]:
+        """(key, source) of the most used stored stylesheets"""
+        index = self.load_index()
+        ranked = sorted(index, key=lambda key: (index[key].get('uses', 0), index[key].get('last_used', 0)),
+                        reverse=True)
+        stylesheets = []
+        for key in ranked[:limit]:
+            try:
+                with open(self._path(key, ".xsl"), "r", encoding="utf-8", newline='') as f:
+                    stylesheets.append((key, f.read()))
+            except OSError:
+                continue
+        return stylesheets
+
+
+stylesheet_store = StylesheetStore()
+atexit.register(stylesheet_store.flush)
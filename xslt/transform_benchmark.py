@@ -0,0 +1,221 @@
+"""Benchmark suite for the XSLT transformation path.
+
+Usage:
+    python -m genie_core.xslt.transform_benchmark [--sizes 1KB,1MB] [--templates 1,50]
+        [--repeat 5] [--output results.json] [--baseline baseline.json] [--threshold 1.2]
+
+Times Saxon processor creation, stylesheet compilation, input parsing,
+transformation and serialization separately, plus the cold and warm cost of
+apply_xslt with the shared processor pool and compiled-stylesheet cache.
+Inputs and stylesheets are generated, so the suite runs offline.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+import saxonche
+from .stylesheet_cache import compiled_stylesheet_cache, parsed_document_cache, transform_result_cache
+from .xslt_utils import apply_xslt
+
+SIZE_UNITS = {"KB": 1024, "MB": 1024 * 1024}
+DEFAULT_SIZES = ["1KB", "100KB", "1MB", "10MB", "100MB"]
+DEFAULT_TEMPLATE_COUNTS = [1, 50, 500]
+DEFAULT_THRESHOLD = 1.2  # flag phases more than 20% slower than the baseline
+NOISE_FLOOR_MS = 1.0  # differences below this are timer noise, not regressions
+
+RECORD_TEMPLATE = ('<record id="{index}" type="t{kind}"><name>Record {index}</name>'
+                   '<amount currency="EUR">{index}.50</amount><note>Generated benchmark record</note></record>\n')
+
+
+def parse_size(size: str) -> int:
+    """Convert a size such as 100KB or 10MB to bytes"""
+    size = size.strip().upper()
+    for unit, factor in SIZE_UNITS.items():
+        if size.endswith(unit):
+            return int(float(size[:-len(unit)]) * factor)
+    return int(size)
+
+
+def clear_transform_caches() -> None:
+    """Drop compiled stylesheets, parsed documents and outputs, so the next apply_xslt runs cold"""
+    compiled_stylesheet_cache.clear()
+    parsed_document_cache.clear()
+    transform_result_cache.clear()
+
+
+def generate_xml(target_bytes: int) -> str:
+    """Generate a records document of roughly the requested size"""
+    parts = ["<records>\n"]
+    written = len(parts[0])
+    index = 0
+    while written < target_bytes:
+        record = RECORD_TEMPLATE.format(index=index, kind=index % 10)
+        parts.append(record)
+        written += len(record)
+        index += 1
+    parts.append("</records>\n")
+    return "".join(parts)
+
+
+def generate_xslt(template_count: int) -> str:
+    """Generate a stylesheet with the given number of record templates"""
+    templates = [
+        '<xsl:template match="/"><output><xsl:apply-templates select="records/record"/></output></xsl:template>'
+    ]
+    for index in range(template_count):
+        # Each template matches one record type; extra ones carry predicates that never match
+        predicate = f'[@type = \'t{index}\']' if index < 10 else f'[@type = \'unused{index}\']'
+        templates.append(
+            f'<xsl:template match="record{predicate}">'
+            f'<item key="{{@id}}" rule="{index}"><xsl:value-of select="concat(name, \' \', amount)"/></item>'
+            f'</xsl:template>'
+        )
+    return ('<xsl:stylesheet version="3.0" xmlns:xsl="http://www.w3.org/1999/XSL/Transform">\n'
+            '<xsl:output method="xml" indent="no"/>\n'
+            '<xsl:template match="text()"/>\n'
+            + "\n".join(templates) +
+            '\n</xsl:stylesheet>\n')
+
+
+def time_phase(action: Callable[[], object], repeat: int) -> Tuple[List[float], object]:
+    """Run an action repeatedly and return the durations in ms and the last result"""
+    durations = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = action()
+        durations.append((time.perf_counter() - started) * 1000)
+    return durations, result
+
+
+def summarize(phase: str, input_bytes: int, templates: int, durations: List[float]) -> Dict[str, object]:
+    return {
+        "phase": phase,
+        "input_bytes": input_bytes,
+        "stylesheet_templates": templates,
+        "runs": len(durations),
+        "median_ms": round(statistics.median(durations), 3),
+        "min_ms": round(min(durations), 3),
+        "max_ms": round(max(durations), 3)
+    }
+
+
+def run_benchmarks(sizes: List[int], template_counts: List[int], repeat: int) -> Dict[str, object]:
+    """Time every phase across the input size and stylesheet size matrix"""
+    results = []
+
+    durations, processor = time_phase(lambda: saxonche.PySaxonProcessor(license=False), repeat)
+    results.append(summarize("processor_creation", 0, 0, durations))
+    xslt30_processor = processor.new_xslt30_processor()
+
+    stylesheets = {count: generate_xslt(count) for count in template_counts}
+    executables = {}
+    for count, stylesheet in stylesheets.items():
+        durations, executables[count] = time_phase(
+            lambda: xslt30_processor.compile_stylesheet(stylesheet_text=stylesheet), repeat)
+        results.append(summarize("compilation", 0, count, durations))
+
+    for size in sizes:
+        xml = generate_xml(size)
+        durations, document = time_phase(lambda: processor.parse_xml(xml_text=xml), repeat)
+        results.append(summarize("parsing", len(xml), 0, durations))
+
+        for count, executable in executables.items():
+            durations, value = time_phase(lambda: executable.transform_to_value(xdm_node=document), repeat)
+            results.append(summarize("transformation", len(xml), count, durations))
+            durations, _ = time_phase(lambda: str(value), repeat)
+            results.append(summarize("serialization", len(xml), count, durations))
+
+            # End-to-end through the pool and cache: the first call compiles, later calls should not
+            stylesheet = stylesheets[count]
+            clear_transform_caches()
+            durations, _ = time_phase(lambda: apply_xslt(stylesheet, xml, []), 1)
+            results.append(summarize("apply_xslt_first", len(xml), count, durations))
+            durations, _ = time_phase(lambda: apply_xslt(stylesheet, xml, []), repeat)
+            results.append(summarize("apply_xslt_warm", len(xml), count, durations))
+        del xml, document
+
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "saxon": getattr(processor, "version", "unknown")
+        },
+        "repeat": repeat,
+        "results": results
+    }
+
+
+def result_key(result: Dict[str, object]) -> Tuple[str, int, int]:
+    return result["phase"], result["input_bytes"], result["stylesheet_templates"]
+
+
+def compare_to_baseline(results: List[Dict[str, object]], baseline: List[Dict[str, object]],
+                        threshold: float = DEFAULT_THRESHOLD) -> List[Dict[str, object]]:
+    """List the phases whose median is more than threshold times the baseline median"""
+    baseline_by_key = {result_key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        previous = baseline_by_key.get(result_key(result))
+        if previous is None:
+            continue
+        current_ms, previous_ms = result["median_ms"], previous["median_ms"]
+        if current_ms - previous_ms > NOISE_FLOOR_MS and current_ms > previous_ms * threshold:
+            regressions.append({
+                "phase": result["phase"],
+                "input_bytes": result["input_bytes"],
+                "stylesheet_templates": result["stylesheet_templates"],
+                "baseline_ms": previous_ms,
+                "current_ms": current_ms,
+                "ratio": round(current_ms / previous_ms, 2) if previous_ms else None
+            })
+    return regressions
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Benchmark the XSLT transformation path")
+    parser.add_argument("--sizes", default=",".join(DEFAULT_SIZES),
+                        help="Comma-separated input sizes, e.g. 1KB,1MB,100MB")
+    parser.add_argument("--templates", default=",".join(str(count) for count in DEFAULT_TEMPLATE_COUNTS),
+                        help="Comma-separated stylesheet sizes in templates")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per phase")
+    parser.add_argument("--output", help="Write the JSON results to this file as well as stdout")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Slowdown ratio against the baseline that counts as a regression")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    sizes = [parse_size(size) for size in args.sizes.split(",") if size.strip()]
+    template_counts = [int(count) for count in args.templates.split(",") if count.strip()]
+
+    # apply_xslt logs with print(), so keep stdout for the JSON report only
+    sys.stdout.flush()
+    report_stream = os.fdopen(os.dup(sys.stdout.fileno()), "w")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    report = run_benchmarks(sizes, template_counts, max(1, args.repeat))
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        report["baseline"] = args.baseline
+        report["regressions"] = compare_to_baseline(report["results"], baseline["results"], args.threshold)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    with report_stream:
+        report_stream.write(output + "\n")
+    return 1 if report.get("regressions") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
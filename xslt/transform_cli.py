@@ -0,0 +1,196 @@
+"""Headless batch transform runner.
+
+Usage:
+    python -m genie_core.xslt.transform_cli STYLESHEET INPUT OUTPUT_DIR [options]
+
+INPUT is a directory (searched recursively for *.xml) or a glob pattern.
+A JSON summary with throughput, p50/p95 latency and failures is printed at the end.
+With --schema, every output is also validated and violations are summarized by XPath.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from .batch_transformer import BatchTransformer
+from .schema_validation import SchemaValidator
+from .stylesheet_cache import content_hash, file_hash
+from .xslt_updater_config import PerformanceConfig, TestConfig
+
+MANIFEST_FILENAME = ".transform_manifest.json"
+MANIFEST_SAVE_EVERY = 25  # outputs between manifest writes, so a killed run redoes at most this many
+
+
+def glob_base(pattern: str) -> str:
+    """Leading directories of a glob pattern that hold no wildcard"""
+    parts = []
+    for part in Path(pattern).parent.parts:
+        if any(character in part for character in "*?["):
+            break
+        parts.append(part)
+    return os.path.join(*parts) if parts else "."
+
+
+def collect_inputs(input_spec: str) -> List[Tuple[Path, str]]:
+    """Resolve a directory or glob into (input path, output relative name) pairs"""
+    if os.path.isdir(input_spec):
+        root = Path(input_spec)
+        return [(path, str(path.relative_to(root))) for path in sorted(root.rglob("*.xml")) if path.is_file()]
+    # Names are relative to the fixed part of the pattern, so files of one name in different directories stay apart
+    base = glob_base(input_spec)
+    return [(Path(path), os.path.relpath(path, base)) for path in sorted(glob.glob(input_spec, recursive=True))
+            if os.path.isfile(path)]
+
+
+def load_manifest(output_dir: Path) -> Dict[str, Dict[str, str]]:
+    """Load the record of which input, stylesheet and parameter hashes produced each output"""
+    manifest_path = output_dir / MANIFEST_FILENAME
+    if manifest_path.exists():
+        with open(manifest_path, "r") as f:
+            return json.load(f)
+    return {}
+
+
+def save_manifest(output_dir: Path, manifest: Dict[str, Dict[str, str]]) -> None:
+    """Write the manifest atomically"""
+    manifest_path = output_dir / MANIFEST_FILENAME
+    temp_path = manifest_path.with_suffix(".tmp")
+    with open(temp_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(temp_path, manifest_path)
+
+
+def write_output(output_path: Path, data: bytes) -> None:
+    """Write an output through a temporary file, so a killed run never leaves a truncated one"""
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = output_path.with_name(f".{output_path.name}.{os.getpid()}.tmp")
+    with open(temp_path, "wb") as f:
+        f.write(data)
+    os.replace(temp_path, output_path)
+
+
+def is_up_to_date(resume: str, input_path: Path, output_path: Path, stylesheet_path: Path,
+                  input_hash: Optional[str], stylesheet_hash: str, parameters_hash: str,
+                  manifest_entry: Optional[Dict[str, str]]) -> bool:
+    """Check whether an existing output can be kept"""
+    if resume == "none" or not output_path.exists():
+        return False
+    # Parameters leave no trace in file times, so both modes need the manifest to show they are unchanged
+    if manifest_entry is None or manifest_entry.get("parameters_hash") != parameters_hash:
+        return False
+    if resume == "mtime":
+        output_mtime = output_path.stat().st_mtime
+        return output_mtime >= input_path.stat().st_mtime and output_mtime >= stylesheet_path.stat().st_mtime
+    return (manifest_entry.get("input_hash") == input_hash
+            and manifest_entry.get("stylesheet_hash") == stylesheet_hash)
+
+
+def parse_parameters(values: List[str]) -> Optional[Dict[str, str]]:
+    """Parse repeated name=expression options"""
+    parameters = {}
+    for value in values:
+        name, separator, expression = value.partition("=")
+        if not separator:
+            raise argparse.ArgumentTypeError(f"Parameter must be name=expression: {value}")
+        parameters[name.strip()] = expression
+    return parameters or None
+
+
+def run(args: argparse.Namespace) -> Dict[str, object]:
+    """Transform all inputs and return the JSON summary"""
+    stylesheet_path = Path(args.stylesheet)
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    with open(stylesheet_path, "r", encoding="utf-8") as f:
+        xslt = f.read()
+    parameters = parse_parameters(args.param)
+    stylesheet_hash = content_hash(xslt)
+    parameters_hash = content_hash(json.dumps(parameters, sort_keys=True))
+    manifest = load_manifest(output_dir)
+
+    pending = []
+    skipped = 0
+    for input_path, relative_name in collect_inputs(args.input):
+        output_path = output_dir / relative_name
+        input_hash = file_hash(input_path) if args.resume == "hash" else None
+        if is_up_to_date(args.resume, input_path, output_path, stylesheet_path,
+                         input_hash, stylesheet_hash, parameters_hash, manifest.get(relative_name)):
+            skipped += 1
+            continue
+        pending.append((relative_name, input_path, output_path, input_hash))
+
+    # Workers read the inputs from disk and return encoded output, so no document is decoded here
+    inputs = []
+    targets = {}
+    for relative_name, input_path, output_path, input_hash in pending:
+        inputs.append((relative_name, input_path))
+        targets[relative_name] = (input_path, output_path, input_hash)
+
+    validator = SchemaValidator(args.schema) if args.schema else None
+    batch = BatchTransformer(xslt, max_workers=args.workers, timeout=args.timeout, parameters=parameters,
+                             output_bytes=True, validator=validator, max_file_input_mb=args.max_input_mb)
+    failures = []
+    unsaved = 0
+    # The manifest is saved as outputs arrive, so --resume after an interrupted run keeps the finished ones
+    try:
+        for result in batch.run(inputs):
+            input_path, output_path, input_hash = targets[result.name]
+            if not result.success:
+                failures.append({"input": result.name, "error": result.error})
+                continue
+            write_output(output_path, result.output)
+            manifest[result.name] = {"input_hash": input_hash or file_hash(input_path),
+                                     "stylesheet_hash": stylesheet_hash, "parameters_hash": parameters_hash}
+            unsaved += 1
+            if unsaved >= MANIFEST_SAVE_EVERY:
+                save_manifest(output_dir, manifest)
+                unsaved = 0
+    finally:
+        save_manifest(output_dir, manifest)
+    summary = batch.summary.as_dict()
+    summary["skipped_up_to_date"] = skipped
+    summary["failures"] = failures
+    if batch.validation_report is not None:
+        summary["validation"] = batch.validation_report.as_dict()
+        summary["schema_violations"] = batch.validation_report.as_records()
+    return summary
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Apply an XSLT stylesheet to a directory or glob of XML files")
+    parser.add_argument("stylesheet", help="Path of the XSLT stylesheet")
+    parser.add_argument("input", help="Input directory (searched recursively for *.xml) or glob pattern")
+    parser.add_argument("output_dir", help="Directory the transformed files are written to")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--timeout", type=float, default=TestConfig.DEFAULT_TRANSFORMATION_TIMEOUT,
+                        help="Per-file timeout in seconds")
+    parser.add_argument("--resume", choices=["mtime", "hash", "none"], default="mtime",
+                        help="Skip outputs that are up to date by modification time or content hash")
+    parser.add_argument("-p", "--param", action="append", default=[], metavar="NAME=EXPR",
+                        help="Stylesheet parameter as an XPath expression, e.g. market=\"'DE'\"")
+    parser.add_argument("--schema", default=None, help="XSD that every output is validated against")
+    parser.add_argument("--max-input-mb", type=float, default=PerformanceConfig.MAX_FILE_INPUT_MB,
+                        help="Largest input file in MB; worker memory is limited separately")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+
+    # Worker processes inherit fd 1 and log with print(), so send that to stderr
+    # and keep stdout for the JSON summary only
+    sys.stdout.flush()
+    summary_stream = os.fdopen(os.dup(sys.stdout.fileno()), "w")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    summary = run(args)
+    with summary_stream:
+        summary_stream.write(json.dumps(summary, indent=2) + "\n")
+    return 1 if summary["failures"] or summary["invalid"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+import mmap
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+from .module_resolver import module_references, module_resolver
+from .regex_registry import regex_registry
+from .stylesheet_cache import ExpiringLRUCache
+from .xslt_updater_config import PerformanceConfig
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
+
+SAXON = 'saxon'
+LIBXSLT = 'libxslt'
+TRIAL = 'trial'
+
+STYLESHEET_VERSION_PATTERN = regex_registry.compile(
+    r'<(?:[\w.-]+:)?(?:stylesheet|transform)(?![\w.-])(?:[^>"\']|"[^"]*"|\'[^\']*\')*?'
+    r'\bversion\s*=\s*["\']([^"\']*)["\']')
+
+# Compiled libxslt stylesheets; an XSLT object must not run concurrently, so each thread keeps its own
+_libxslt_caches = threading.local()
+
+
+def stylesheet_version(xslt: str) -> Optional[str]:
+    """Value of the version attribute on xsl:stylesheet or xsl:transform, or None if there is none"""
+    match = STYLESHEET_VERSION_PATTERN.search(xslt)
+    return match.group(1).strip() if match else None
+
+
+def libxslt_stylesheet_cache() -> ExpiringLRUCache:
+    """Compiled libxslt stylesheets of the calling thread, released with the thread"""
+    cache = getattr(_libxslt_caches, 'cache', None)
+    if cache is None:
+        cache = _libxslt_caches.cache = ExpiringLRUCache(max_entries=PerformanceConfig.MAX_CACHED_LIBXSLT_STYLESHEETS)
+    return cache
+
+
+class LibxsltEngine:
+    """XSLT 1.0 transforms through lxml/libxslt, which costs far less per call than Saxon for small inputs"""
+
+    name = LIBXSLT
+
+    @staticmethod
+    def available() -> bool:
+        return lxml_etree is not None
+
+    def compile(self, xslt: str, stylesheet_key: str):
+        def compile_stylesheet():
+            # Relative include/import hrefs resolve against the module root, as they do for Saxon
+            base_url = os.path.join(str(module_resolver.root), 'stylesheet.xsl') if module_references(xslt) else None
+            parser = lxml_etree.XMLParser(encoding='utf-8')
+            return lxml_etree.XSLT(lxml_etree.fromstring(xslt.encode('utf-8'), parser, base_url=base_url))
+
+        return libxslt_stylesheet_cache().get_or_create(stylesheet_key, compile_stylesheet)
+
+    @staticmethod
+    def parse(xml):
+        if isinstance(xml, os.PathLike):
+            return lxml_etree.parse(os.fspath(xml))
+        if isinstance(xml, (bytes, bytearray, memoryview, mmap.mmap)):
+            # Raw bytes carry their own byte order mark or declared encoding
+            return lxml_etree.fromstring(bytes(xml))
+        # Text is already decoded, so its declared encoding no longer applies
+        return lxml_etree.fromstring(xml.encode('utf-8'), lxml_etree.XMLParser(encoding='utf-8'))
+
+    def transform(self, xslt: str, stylesheet_key: str, xml, parameter_values: Dict[str, str]) -> str:
+        """Serialized result; parameter values are XPath expressions, as for Saxon"""
+        transform = self.compile(xslt, stylesheet_key)
+        result = transform(self.parse(xml), **{name: str(value) for name, value in (parameter_values or {}).items()})
+        return str(result)
+
+
+@dataclass
+class EngineDecision:
+    """Trial record and, once decided, the engine for one stylesheet"""
+    engine: Optional[str] = None
+    trials: int = 0
+    runs: int = 0
+    saxon_ms: float = 0.0
+    libxslt_ms: float = 0.0
+    reason: Optional[str] = None
+
+
+class EngineSelector:
+    """
+    Picks the engine for each stylesheet.
+
+    XSLT 1.0 stylesheets that libxslt compiles are first run on both engines for a
+    few transforms. libxslt takes over only if every serialized output was identical
+    and it was at least as fast; any difference or error keeps the stylesheet on
+    Saxon. After that, every recheck_interval-th transform runs on both engines
+    again, so inputs that reach code the trials did not are still compared.
+    """
+
+    def __init__(self, sample_size: int = PerformanceConfig.ENGINE_EQUIVALENCE_SAMPLE,
+                 enabled: bool = PerformanceConfig.LIBXSLT_FAST_PATH,
+                 recheck_interval: int = PerformanceConfig.ENGINE_RECHECK_INTERVAL):
+        self.sample_size = sample_size
+        self.enabled = enabled
+        self.recheck_interval = recheck_interval
+        self.libxslt = LibxsltEngine()
+        self._decisions = ExpiringLRUCache()
+        self._lock = threading.Lock()
+
+    def _decision(self, xslt: str, stylesheet_key: str) -> EngineDecision:
+        decision = self._decisions.get(stylesheet_key)
+        if decision is None:
+            decision = EngineDecision()
+            if not self.enabled or not self.libxslt.available():
+                decision.engine, decision.reason = SAXON, "libxslt fast path unavailable"
+            elif stylesheet_version(xslt) != '1.0':
+                decision.engine, decision.reason = SAXON, f"XSLT version {stylesheet_version(xslt)}"
+            else:
+                try:
+                    self.libxslt.compile(xslt, stylesheet_key)
+                except Exception as e:
+                    decision.engine, decision.reason = SAXON, f"libxslt cannot compile the stylesheet: {e}"
+            self._decisions.put(stylesheet_key, decision)
+        return decision
+
+    def engine_for(self, xslt: str, stylesheet_key: str) -> str:
+        """SAXON, LIBXSLT, or TRIAL while the stylesheet still runs, or is rechecked, on both engines"""
+        decision = self._decision(xslt, stylesheet_key)
+        if decision.engine == LIBXSLT and self.recheck_interval:
+            with self._lock:
+                decision.runs += 1
+                if decision.runs % self.recheck_interval == 0:
+                    return TRIAL
+        return decision.engine or TRIAL
+
+    def reject(self, stylesheet_key: str, reason: str) -> None:
+        """Keep a stylesheet on Saxon from now on"""
+        with self._lock:
+            decision = self._decisions.get(stylesheet_key) or EngineDecision()
+            decision.engine, decision.reason = SAXON, reason
+            self._decisions.put(stylesheet_key, decision)
+
+    def run_trial(self, xslt: str, stylesheet_key: str, xml, parameter_values: Dict[str, str],
+                  saxon_output: str, saxon_ms: float) -> None:
+        """Run libxslt on an input Saxon just transformed and record whether the serialized outputs are identical"""
+        started = time.perf_counter()
+        try:
+            output = self.libxslt.transform(xslt, stylesheet_key, xml, parameter_values)
+        except Exception as e:
+            self.reject(stylesheet_key, f"libxslt failed where Saxon succeeded: {e}")
+            return
+        libxslt_ms = (time.perf_counter() - started) * 1000
+        if output != saxon_output:
+            self.reject(stylesheet_key, "libxslt output differs from Saxon output")
+            return
+
+        with self._lock:
+            decision = self._decision(xslt, stylesheet_key)
+            if decision.engine is not None:
+                return
+            decision.trials += 1
+            decision.saxon_ms += saxon_ms
+            decision.libxslt_ms += libxslt_ms
+            if decision.trials >= self.sample_size:
+                faster = decision.libxslt_ms <= decision.saxon_ms
+                decision.engine = LIBXSLT if faster else SAXON
+                decision.reason = (f"identical output on {decision.trials} inputs; libxslt {decision.libxslt_ms:.2f} ms "
+                                   f"vs Saxon {decision.saxon_ms:.2f} ms")
+
+    def as_dict(self) -> Dict[str, object]:
+        with self._lock:
+            decisions = self._decisions.values()
+        return {
+            'libxslt_available': self.libxslt.available(),
+            'enabled': self.enabled,
+            'libxslt': sum(1 for decision in decisions if decision.engine == LIBXSLT),
+            'saxon': sum(1 for decision in decisions if decision.engine == SAXON),
+            'in_trial': sum(1 for decision in decisions if decision.engine is None)
+        }
+
+
+engine_selector = EngineSelector()
@@ -0,0 +1,255 @@
+import json
+import os
+import re
+import tempfile
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from .regex_registry import RegisteredPattern, regex_registry
+from .saxon_pool import saxon_pool
+from .transform_sandbox import TransformSandbox, transform_sandbox
+from .xslt_utils import bind_parameters, compile_xslt, parse_xml_cached, prepare_parameters
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
+
+PROFILE_MARKER = "__xslt_profile__"
+XSL_NAMESPACE = "http://www.w3.org/1999/XSL/Transform"
+LIBXSLT_PROFILE_TICK_MS = 0.1  # libxslt reports profile times in units of 100 microseconds
+
+# Instructions that must stay first in each profiled region, before the inserted marker
+LEADING_CHILDREN = {
+    'template': ('param', 'context-item'),
+    'for-each': ('sort',),
+    'for-each-group': ('sort',)
+}
+
+XSL_PREFIX_PATTERN = regex_registry.compile(r'xmlns:([\w.-]+)\s*=\s*["\']' + re.escape(XSL_NAMESPACE) + r'["\']')
+# Values are consumed whole, so names inside other values (e.g. match="@name = 'x'") are not picked up
+REGION_ATTRIBUTE_PATTERN = regex_registry.compile(r'([\w:.-]+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\')')
+PROFILE_MARKER_PATTERN = regex_registry.compile(re.escape(PROFILE_MARKER) + r':(\d+)')
+
+
+@dataclass
+class ProfileRegion:
+    """One profiled template or for-each instruction of a stylesheet"""
+    region_id: int
+    kind: str
+    label: str
+    line: int
+    end_line: int = 0
+    calls: int = 0
+    time_ms: Optional[float] = None
+    attributes: Dict[str, str] = field(default_factory=dict, repr=False)
+
+
+@dataclass
+class ProfileReport:
+    """
+    Execution counts and times per region for one profiled transform.
+    Times are per template only, since the libxslt profiler does not time for-each
+    instructions; those regions report call counts.
+    """
+    regions: List[ProfileRegion]
+    elapsed_ms: float
+    output: Optional[str] = None
+    logs: List[str] = field(default_factory=list)
+    timing_source: Optional[str] = None
+
+    def hot_spots(self) -> List[ProfileRegion]:
+        """Regions ordered by time where known, then by number of calls"""
+        return sorted(self.regions, key=lambda region: (region.time_ms or 0.0, region.calls), reverse=True)
+
+    def as_records(self) -> List[Dict[str, object]]:
+        return [{
+            'region_id': region.region_id,
+            'kind': region.kind,
+            'label': region.label,
+            'line': region.line,
+            'calls': region.calls,
+            'time_ms': None if region.time_ms is None else round(region.time_ms, 3)
+        } for region in self.hot_spots()]
+
+    def to_json(self) -> str:
+        return json.dumps({
+            'elapsed_ms': round(self.elapsed_ms, 3),
+            'timing_source': self.timing_source,
+            'regions': self.as_records()
+        }, indent=2)
+
+
+def get_xsl_prefix(xslt: str) -> str:
+    """Namespace prefix the stylesheet binds to the XSLT namespace"""
+    match = XSL_PREFIX_PATTERN.search(xslt)
+    return match.group(1) if match else 'xsl'
+
+
+def _start_tag_pattern(prefix: str, names: Tuple[str, ...]) -> RegisteredPattern:
+    # Attribute values may contain '>' (e.g. select="a > b"), so quoted values are matched as a whole
+    # Longest names first, so for-each-group is not read as for-each
+    names = sorted(names, key=len, reverse=True)
+    return regex_registry.element(r'<{name}:(' + '|'.join(re.escape(name) for name in names) + r')(?![\w.-])'
+                                  r'((?:[^>"\']|"[^"]*"|\'[^\']*\')*?)(/?)>', prefix)
+
+
+def _region_attributes(kind: str, attributes: str) -> Dict[str, str]:
+    values = {}
+    for match in REGION_ATTRIBUTE_PATTERN.finditer(attributes):
+        values[match.group(1)] = match.group(2) if match.group(2) is not None else match.group(3)
+    names = ('match', 'name', 'mode') if kind == 'template' else ('select',)
+    return {name: values[name] for name in names if name in values}
+
+
+def _skip_leading_children(xslt: str, position: int, prefix: str, names: Tuple[str, ...]) -> int:
+    """Position after the whitespace, comments and leading instructions that must precede the marker"""
+    leading = _start_tag_pattern(prefix, names)
+    while True:
+        stripped = len(xslt[position:]) - len(xslt[position:].lstrip())
+        candidate = position + stripped
+        if xslt.startswith('<!--', candidate):
+            position = xslt.index('-->', candidate) + 3
+            continue
+        match = leading.match(xslt, candidate)
+        if not match:
+            return position
+        if match.group(3):
+            position = match.end()
+        else:
+            closing = regex_registry.element(r'</{name}\s*>', f'{prefix}:{match.group(1)}')
+            position = closing.search(xslt, match.end()).end()
+
+
+def _closing_tag_end(xslt: str, position: int, prefix: str, kind: str) -> int:
+    """Offset just past the closing tag that matches an element of this kind opened before position"""
+    tags = regex_registry.element(r'<(/?){name}(?![\w.-])(?:[^>"\']|"[^"]*"|\'[^\']*\')*?(/?)>', f'{prefix}:{kind}')
+    depth = 1
+    for match in tags.regex.finditer(xslt, position):
+        if match.group(1):
+            depth -= 1
+            if depth == 0:
+                return match.end()
+        elif not match.group(2):
+            depth += 1
+    return len(xslt)
+
+
+def instrument_stylesheet(xslt: str) -> Tuple[str, List[ProfileRegion]]:
+    """
+    Copy of the stylesheet that emits an xsl:message marker at the start of every
+    template and for-each body, with the regions the markers identify.
+    Empty templates are expanded so that matching them is counted too.
+    """
+    prefix = get_xsl_prefix(xslt)
+    comments = [(match.start(), match.end()) for match in regex_registry.config('XML_COMMENT_PATTERN', re.DOTALL).finditer(xslt)]
+    regions = []
+    replacements = []
+    for match in _start_tag_pattern(prefix, tuple(LEADING_CHILDREN)).finditer(xslt):
+        if any(start <= match.start() < end for start, end in comments):
+            continue
+        kind = match.group(1)
+        attributes = _region_attributes(kind, match.group(2))
+        line = xslt.count('\n', 0, match.start()) + 1
+        end = match.end() if match.group(3) else _closing_tag_end(xslt, match.end(), prefix, kind)
+        region = ProfileRegion(region_id=len(regions), kind=kind,
+                               label=' '.join(f'{name}="{value}"' for name, value in attributes.items()) or kind,
+                               line=line, end_line=line + xslt.count('\n', match.start(), end), attributes=attributes)
+        regions.append(region)
+        marker = f'<{prefix}:message>{PROFILE_MARKER}:{region.region_id}</{prefix}:message>'
+        if match.group(3):
+            replacements.append((match.end() - 2, match.end(), f'>{marker}</{prefix}:{kind}>'))
+        else:
+            position = _skip_leading_children(xslt, match.end(), prefix, LEADING_CHILDREN[kind])
+            replacements.append((position, position, marker))
+
+    pieces = []
+    previous = 0
+    for start, end, text in replacements:
+        pieces.append(xslt[previous:start])
+        pieces.append(text)
+        previous = end
+    pieces.append(xslt[previous:])
+    return ''.join(pieces), regions
+
+
+def count_markers(messages: str) -> Counter:
+    """Number of times each region marker appears in the captured xsl:message output"""
+    return Counter(int(region_id) for region_id in PROFILE_MARKER_PATTERN.findall(messages))
+
+
+def libxslt_template_times(xslt: str, xml: str) -> Optional[Dict[Tuple[str, str, str], float]]:
+    """Total time per (match, name, mode) template from a libxslt profile run, or None if unavailable"""
+    if lxml_etree is None:
+        return None
+    try:
+        transform = lxml_etree.XSLT(lxml_etree.fromstring(xslt.encode('utf-8')))
+        result = transform(lxml_etree.fromstring(xml.encode('utf-8')), profile_run=True)
+    except Exception:
+        # XSLT 2.0/3.0 stylesheets are beyond libxslt; counts from Saxon are still reported
+        return None
+    times = {}
+    for template in result.xslt_profile.getroot():
+        key = (template.get('match') or '', template.get('name') or '', template.get('mode') or '')
+        times[key] = float(template.get('time') or 0) * LIBXSLT_PROFILE_TICK_MS
+    return times
+
+
+def run_instrumented(instrumented: str, xml: str, parameter_values=None) -> Tuple[Optional[str], Counter, List[str]]:
+    """Run an instrumented stylesheet and count the region markers it emitted"""
+    logs: List[str] = []
+    output = None
+    message_fd, message_file = tempfile.mkstemp(suffix='.xml', prefix='xslt_profile_')
+    os.close(message_fd)
+    try:
+        with saxon_pool.lease() as slot:
+            document = parse_xml_cached(slot, xml)
+            compiled_xslt = compile_xslt(slot, instrumented, store=False)
+            bind_parameters(slot, compiled_xslt, document, parameter_values, instrumented)
+            compiled_xslt.set_save_xsl_message(True, message_file)
+            try:
+                output = compiled_xslt.transform_to_string(xdm_node=document)
+            finally:
+                compiled_xslt.set_save_xsl_message(False)
+                compiled_xslt.clear_parameters()
+    except Exception as e:
+        logs.append(f"An error occurred during the profiled XSLT transformation: {e}")
+
+    try:
+        with open(message_file, 'r', encoding='utf-8', errors='replace') as f:
+            counts = count_markers(f.read())
+    finally:
+        os.remove(message_file)
+    return output, counts, logs
+
+
+def profile_transform(xslt: str, xml: str, parameters=None,
+                      sandbox: Optional[TransformSandbox] = None) -> ProfileReport:
+    """
+    Run an instrumented copy of the stylesheet in a sandboxed worker and report how
+    often each template and for-each ran, with template times where libxslt can run it
+    """
+    sandbox = sandbox or transform_sandbox
+    xslt, parameter_values = prepare_parameters(xslt, parameters)
+    instrumented, regions = instrument_stylesheet(xslt)
+
+    result = sandbox.run_instrumented(instrumented, xml, parameter_values, timed_xslt=xslt)
+    elapsed_ms = result.latency_seconds * 1000
+    output, counts, template_times = result.output if result.success else (None, {}, None)
+    logs = list(result.logs)
+    if result.failure:
+        logs.append(f"The profiled transformation did not finish ({result.failure.reason}): {result.failure.detail}")
+    for region in regions:
+        region.calls = counts.get(region.region_id, 0)
+
+    timing_source = None
+    if template_times:
+        timing_source = 'libxslt'
+        for region in regions:
+            if region.kind == 'template':
+                key = tuple(region.attributes.get(name, '') for name in ('match', 'name', 'mode'))
+                region.time_ms = template_times.get(key)
+
+    return ProfileReport(regions=regions, elapsed_ms=elapsed_ms, output=output, logs=logs,
+                         timing_source=timing_source)
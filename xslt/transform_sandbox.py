@@ -0,0 +1,377 @@
+import atexit
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+from .module_resolver import module_resolver
+from .stylesheet_cache import content_hash, transform_cache_key, transform_result_cache
+from .xslt_updater_config import PerformanceConfig, TestConfig
+
+# Inputs that can be sent to a worker; memory-mapped files cannot be pickled, so pass their Path instead
+XmlInput = Union[str, bytes, Path]
+
+
+def _sandbox_worker_main(connection) -> None:
+    """Worker process loop: run transform requests until told to stop"""
+    # A worker runs one request at a time, so one processor is all it uses. The pool reads its size on
+    # first use, so this holds even when re-importing the parent's main module under spawn imported it
+    PerformanceConfig.SAXON_POOL_SIZE = 1
+    from .saxon_pool import saxon_pool
+    from .transform_profiler import libxslt_template_times, run_instrumented
+    from .xslt_utils import apply_xslt, apply_xslt_to_file, compile_xslt, warm_up_stylesheets
+
+    # Compile the most used stylesheets into the worker's processor before taking requests, so a fresh worker starts warm
+    try:
+        warm_up_stylesheets()
+    except Exception:
+        pass
+
+    while True:
+        try:
+            message = connection.recv()
+        except (EOFError, OSError):
+            break
+        if message is None:
+            break
+
+        kind, payload = message
+        if kind == 'compile':
+            try:
+                with saxon_pool.lease() as slot:
+                    compile_xslt(slot, payload['xslt'], store=payload.get('store', True))
+                connection.send((True, []))
+            except Exception as e:
+                connection.send((None, [f"An error occurred while compiling the XSLT: {e}"]))
+        elif kind == 'transform':
+            connection.send(tuple(apply_xslt(payload['xslt'], payload['xml'], [], payload['parameters'],
+                                             payload.get('output_bytes', False))))
+        elif kind == 'transform_file':
+            connection.send(tuple(apply_xslt_to_file(payload['xslt'], payload['source_file'],
+                                                     payload['output_file'], [], payload['parameters'])))
+        elif kind == 'instrumented':
+            # The marker counts are wanted even when the transform failed part way
+            output, counts, logs = run_instrumented(payload['xslt'], payload['xml'], payload['parameters'])
+            times = libxslt_template_times(payload['timed_xslt'], payload['xml']) if payload.get('timed_xslt') else None
+            connection.send(((output, dict(counts), times), logs))
+
+
+def read_rss_mb(pid: int) -> Optional[float]:
+    """Resident set size of a process in MB, or None where /proc is unavailable"""
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError, IndexError):
+        return None
+    return None
+
+
+@dataclass
+class TransformFailure:
+    """Structured reason a sandboxed transform did not produce output"""
+    reason: str
+    detail: str
+
+    TIMEOUT = 'timeout'
+    MEMORY_LIMIT = 'memory_limit'
+    INPUT_TOO_LARGE = 'input_too_large'
+    WORKER_CRASHED = 'worker_crashed'
+    TRANSFORM_ERROR = 'transform_error'
+
+
+@dataclass
+class SandboxResult:
+    """Outcome of a transform run in a supervised worker process"""
+    output: Optional[object]
+    logs: List[str] = field(default_factory=list)
+    failure: Optional[TransformFailure] = None
+    latency_seconds: float = 0.0
+    peak_rss_mb: Optional[float] = None
+
+    @property
+    def success(self) -> bool:
+        return self.failure is None
+
+
+class _SandboxWorker:
+    """One supervised worker process and its pipe"""
+
+    def __init__(self, context):
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(target=_sandbox_worker_main, args=(child_connection,), daemon=True)
+        self.process.start()
+        child_connection.close()
+        self.compiled = set()
+
+    def kill(self) -> None:
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join(timeout=5)
+        self.connection.close()
+
+    def stop(self) -> None:
+        try:
+            self.connection.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.kill()
+        self.connection.close()
+
+
+class TransformSandbox:
+    """
+    Runs apply_xslt in worker processes with wall-clock, memory and input-size limits.
+    Inputs sent through the pipe are held by this process too, so they have a tighter
+    size limit than files the worker reads itself, which only the memory limit bounds.
+    """
+
+    RSS_POLL_SECONDS = 0.05
+
+    def __init__(self, size: Optional[int] = None,
+                 timeout: float = TestConfig.DEFAULT_TRANSFORMATION_TIMEOUT,
+                 max_rss_mb: float = PerformanceConfig.MAX_WORKER_RSS_MB,
+                 max_input_mb: float = PerformanceConfig.MAX_FILE_SIZE_MB,
+                 max_file_input_mb: float = PerformanceConfig.MAX_FILE_INPUT_MB):
+        self.size = size or os.cpu_count() or 1
+        self.timeout = timeout
+        self.max_rss_mb = max_rss_mb
+        self.max_input_mb = max_input_mb
+        self.max_file_input_mb = max_file_input_mb
+        self.stats: Dict[str, int] = {'transforms': 0, 'recycled': 0}
+        self._context = multiprocessing.get_context('spawn')
+        self._idle: List[_SandboxWorker] = []
+        self._started = 0
+        self._condition = threading.Condition()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._closed = False
+
+    def _acquire(self, block: bool = True) -> Optional[_SandboxWorker]:
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Transform sandbox has been shut down")
+                if self._idle:
+                    return self._idle.pop()
+                if self._started < self.size:
+                    self._started += 1
+                    break
+                if not block:
+                    return None
+                self._condition.wait()
+        try:
+            return _SandboxWorker(self._context)
+        except Exception:
+            with self._condition:
+                self._started -= 1
+                self._condition.notify()
+            raise
+
+    def _release(self, worker: _SandboxWorker, healthy: bool) -> None:
+        if not healthy:
+            worker.kill()
+        with self._condition:
+            if healthy and not self._closed:
+                self._idle.append(worker)
+            else:
+                self._started -= 1
+                if not healthy:
+                    self.stats['recycled'] += 1
+            self._condition.notify()
+        if healthy and self._closed:
+            worker.stop()
+
+    def _record(self, reason: str) -> None:
+        with self._condition:
+            self.stats[reason] = self.stats.get(reason, 0) + 1
+
+    def _supervise(self, worker: _SandboxWorker, message, timeout: float) -> SandboxResult:
+        """Send one request to a worker and wait for it within the time and memory limits"""
+        started = time.monotonic()
+        deadline = started + timeout
+        peak_rss = None
+        worker.connection.send(message)
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return SandboxResult(output=None, latency_seconds=time.monotonic() - started, peak_rss_mb=peak_rss,
+                                     failure=TransformFailure(TransformFailure.TIMEOUT,
+                                                              f"Exceeded the {timeout:g} second time limit"))
+            if worker.connection.poll(min(self.RSS_POLL_SECONDS, remaining)):
+                try:
+                    output, logs = worker.connection.recv()
+                except (EOFError, OSError) as e:
+                    return SandboxResult(output=None, latency_seconds=time.monotonic() - started,
+                                         failure=TransformFailure(TransformFailure.WORKER_CRASHED, str(e)))
+                failure = None
+                if output is None:
+                    failure = TransformFailure(TransformFailure.TRANSFORM_ERROR,
+                                               logs[-1] if logs else "Transformation failed")
+                return SandboxResult(output=output, logs=logs, failure=failure,
+                                     latency_seconds=time.monotonic() - started, peak_rss_mb=peak_rss)
+            if not worker.process.is_alive():
+                return SandboxResult(output=None, latency_seconds=time.monotonic() - started, peak_rss_mb=peak_rss,
+                                     failure=TransformFailure(TransformFailure.WORKER_CRASHED,
+                                                              f"Worker exited with code {worker.process.exitcode}"))
+            rss = read_rss_mb(worker.process.pid)
+            if rss is not None:
+                peak_rss = max(peak_rss or 0.0, rss)
+                if rss > self.max_rss_mb:
+                    return SandboxResult(output=None, latency_seconds=time.monotonic() - started, peak_rss_mb=peak_rss,
+                                         failure=TransformFailure(TransformFailure.MEMORY_LIMIT,
+                                                                  f"Worker used {rss:.0f} MB, limit is {self.max_rss_mb:g} MB"))
+
+    def _run(self, message, timeout: Optional[float], xslt_hash: Optional[str] = None) -> SandboxResult:
+        timeout = min(timeout or self.timeout, PerformanceConfig.MAX_PROCESSING_TIME_SECONDS)
+        worker = self._acquire()
+        healthy = False
+        try:
+            xslt = message[1]['xslt']
+            xslt_hash = xslt_hash or content_hash(xslt)
+            if message[0] != 'compile' and xslt_hash not in worker.compiled:
+                # Compile outside the per-transform time limit; the worker caches the executable
+                compile_message = ('compile', {'xslt': xslt, 'store': message[1].get('store', True)})
+                warm_up = self._supervise(worker, compile_message, PerformanceConfig.MAX_PROCESSING_TIME_SECONDS)
+                if warm_up.failure and warm_up.failure.reason != TransformFailure.TRANSFORM_ERROR:
+                    self._record(warm_up.failure.reason)
+                    return warm_up
+                worker.compiled.add(xslt_hash)
+            result = self._supervise(worker, message, timeout)
+            healthy = result.failure is None or result.failure.reason == TransformFailure.TRANSFORM_ERROR
+            if message[0] == 'compile' and result.success:
+                worker.compiled.add(xslt_hash)
+            self._record('transforms')
+            if result.failure:
+                self._record(result.failure.reason)
+            return result
+        finally:
+            self._release(worker, healthy)
+
+    def _input_too_large(self, size: int, limit_mb: float) -> Optional[SandboxResult]:
+        """Rejection for an input of size bytes over the limit, or None if it may be transformed"""
+        size_mb = size / (1024 * 1024)
+        if size_mb <= limit_mb:
+            return None
+        self._record(TransformFailure.INPUT_TOO_LARGE)
+        return SandboxResult(output=None, failure=TransformFailure(
+            TransformFailure.INPUT_TOO_LARGE,
+            f"Input is {size_mb:.1f} MB, limit is {limit_mb:g} MB"))
+
+    def _rejected_input(self, xml: XmlInput) -> Optional[SandboxResult]:
+        """Rejection for an input over the limit that applies to its kind, or None if it may be transformed"""
+        if isinstance(xml, os.PathLike):
+            return self._input_too_large(os.path.getsize(xml), self.max_file_input_mb)
+        size = len(xml)
+        # A character takes one to four bytes in UTF-8, so text is only encoded when its length cannot decide
+        if isinstance(xml, str) and size <= self.max_input_mb * 1024 * 1024 < 4 * size:
+            size = len(xml.encode('utf-8'))
+        return self._input_too_large(size, self.max_input_mb)
+
+    def compile(self, xslt: str) -> SandboxResult:
+        """Compile a stylesheet in a worker process, to check it before it is used"""
+        return self._run(('compile', {'xslt': xslt}), PerformanceConfig.MAX_PROCESSING_TIME_SECONDS)
+
+    def transform(self, xslt: str, xml: XmlInput, parameters=None, timeout: Optional[float] = None,
+                  output_bytes: bool = False, xslt_hash: Optional[str] = None) -> SandboxResult:
+        """
+        Run apply_xslt in a worker process, enforcing the configured limits.
+        A Path is opened by the worker itself, so the input never passes through the pipe.
+        Callers that serve one stylesheet many times pass its content_hash as xslt_hash.
+        """
+        rejected = self._rejected_input(xml)
+        if rejected:
+            return rejected
+        return self._run(('transform', {'xslt': xslt, 'xml': xml, 'parameters': parameters,
+                                        'output_bytes': output_bytes}), timeout, xslt_hash)
+
+    def transform_memoized(self, xslt: str, xml: XmlInput, parameters=None,
+                           timeout: Optional[float] = None) -> SandboxResult:
+        """Like transform, but reuse the output of an identical earlier transform instead of running it again"""
+        cache_key = transform_cache_key(module_resolver.bundle_hash(xslt), xml, parameters)
+        output = transform_result_cache.get(cache_key)
+        if output is not None:
+            return SandboxResult(output=output)
+        result = self.transform(xslt, xml, parameters, timeout)
+        if result.success:
+            transform_result_cache.put(cache_key, result.output)
+        return result
+
+    def transform_file(self, xslt: str, source_file: str, output_file: str, parameters=None,
+                       timeout: Optional[float] = None) -> SandboxResult:
+        """Run apply_xslt_to_file in a worker process, enforcing the same limits as transform of a Path"""
+        rejected = self._input_too_large(os.path.getsize(source_file), self.max_file_input_mb)
+        if rejected:
+            return rejected
+        return self._run(('transform_file', {'xslt': xslt, 'source_file': str(source_file),
+                                             'output_file': str(output_file), 'parameters': parameters}), timeout)
+
+    def run_instrumented(self, instrumented: str, xml: XmlInput, parameter_values=None,
+                         timeout: Optional[float] = None, timed_xslt: Optional[str] = None) -> SandboxResult:
+        """
+        Run a profiling copy of a stylesheet (see transform_profiler) in a worker process.
+
+        The output is (transformed output or None, marker counts by region id, libxslt
+        template times of timed_xslt or None). The instrumented copy is compiled without
+        entering the persistent stylesheet store.
+        """
+        rejected = self._rejected_input(xml)
+        if rejected:
+            return rejected
+        return self._run(('instrumented', {'xslt': instrumented, 'xml': xml, 'parameters': parameter_values,
+                                           'timed_xslt': timed_xslt, 'store': False}), timeout)
+
+    def submit(self, xslt: str, xml: XmlInput, parameters=None, timeout: Optional[float] = None,
+               output_bytes: bool = False) -> "Future[SandboxResult]":
+        """Schedule a transform and return a future for its SandboxResult"""
+        with self._condition:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix='transform-sandbox')
+            executor = self._executor
+        return executor.submit(self.transform, xslt, xml, parameters, timeout, output_bytes)
+
+    def warm_up(self, xslt: str) -> None:
+        """Start the workers and compile the stylesheet in every worker that is currently free"""
+        xslt_hash = content_hash(xslt)
+        workers = []
+        for _ in range(self.size):
+            worker = self._acquire(block=False)
+            if worker is None:
+                break
+            workers.append(worker)
+        healthy = {id(worker): False for worker in workers}
+        try:
+            for worker in workers:
+                if xslt_hash not in worker.compiled:
+                    result = self._supervise(worker, ('compile', {'xslt': xslt}), PerformanceConfig.MAX_PROCESSING_TIME_SECONDS)
+                    if result.success:
+                        worker.compiled.add(xslt_hash)
+                    elif result.failure.reason != TransformFailure.TRANSFORM_ERROR:
+                        continue
+                healthy[id(worker)] = True
+        finally:
+            for worker in workers:
+                self._release(worker, healthy[id(worker)])
+
+    def shutdown(self) -> None:
+        """Stop all worker processes"""
+        with self._condition:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._started -= len(idle)
+            executor = self._executor
+            self._condition.notify_all()
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        for worker in idle:
+            worker.stop()
+
+
+transform_sandbox = TransformSandbox()
+atexit.register(transform_sandbox.shutdown)
@@ -0,0 +1,410 @@
+"""Local HTTP transform server.
+
+Usage:
+    python -m genie_core.xslt.transform_server STYLESHEET_DIR [options]
+
+Every *.xsl / *.xslt file in STYLESHEET_DIR is served under its file name without
+extension, and edited files are picked up by hash while the server runs. Transforms
+run in sandboxed worker processes, so a runaway stylesheet or input is stopped at
+the time or memory limit instead of blocking the server. Each request is a round
+trip to one of those workers, so a server process completes at most --processors
+transforms at a time; /metrics reports the throughput actually reached.
+
+    POST /transform/<id>?name=expr   XML body in, transformed output out
+    GET  /stylesheets                Loaded stylesheets with their hashes
+    GET  /metrics                    Recent throughput, and latency since start-up
+    GET  /health
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, unquote, urlsplit
+from .stylesheet_cache import content_hash
+from .transform_sandbox import TransformFailure, TransformSandbox
+from .xslt_updater_config import PerformanceConfig, TestConfig
+
+STYLESHEET_SUFFIXES = (".xsl", ".xslt")
+# Upper bounds of the latency histogram buckets in milliseconds; the last bucket is open-ended
+LATENCY_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+REQUESTS, FAILURES, BYTES_IN, BYTES_OUT, LATENCY_TOTAL_MS = range(5)
+# Requests are also counted per second over this many seconds, for the current throughput
+RATE_WINDOW_SECONDS = 60
+
+# HTTP status of each way a sandboxed transform can fail
+FAILURE_STATUS = {
+    TransformFailure.TRANSFORM_ERROR: 422,
+    TransformFailure.INPUT_TOO_LARGE: 413,
+    TransformFailure.TIMEOUT: 504,
+    TransformFailure.MEMORY_LIMIT: 503,
+    TransformFailure.WORKER_CRASHED: 500
+}
+
+
+class ServerMetrics:
+    """Request counters and a latency histogram shared by every server process"""
+
+    def __init__(self, context=None):
+        context = context or multiprocessing.get_context('spawn')
+        self._lock = context.Lock()
+        self._counters = context.RawArray('d', 5)
+        self._buckets = context.RawArray('q', len(LATENCY_BUCKETS_MS) + 1)
+        # Per second of the rate window: the second, its request count and its first and last request times
+        self._seconds = context.RawArray('q', RATE_WINDOW_SECONDS)
+        self._second_counts = context.RawArray('q', RATE_WINDOW_SECONDS)
+        self._second_first = context.RawArray('d', RATE_WINDOW_SECONDS)
+        self._second_last = context.RawArray('d', RATE_WINDOW_SECONDS)
+        self.started = time.time()
+
+    def record(self, latency_ms: float, success: bool, bytes_in: int, bytes_out: int) -> None:
+        bucket = next((index for index, bound in enumerate(LATENCY_BUCKETS_MS) if latency_ms <= bound),
+                      len(LATENCY_BUCKETS_MS))
+        now = time.time()
+        second = int(now)
+        slot = second % RATE_WINDOW_SECONDS
+        with self._lock:
+            if self._seconds[slot] != second:
+                self._seconds[slot], self._second_counts[slot], self._second_first[slot] = second, 0, now
+            self._second_counts[slot] += 1
+            self._second_last[slot] = now
+            self._counters[REQUESTS] += 1
+            self._counters[FAILURES] += 0 if success else 1
+            self._counters[BYTES_IN] += bytes_in
+            self._counters[BYTES_OUT] += bytes_out
+            self._counters[LATENCY_TOTAL_MS] += latency_ms
+            self._buckets[bucket] += 1
+
+    @staticmethod
+    def _percentile(buckets: List[int], total: int, fraction: float) -> Optional[float]:
+        """Upper bound of the bucket holding the given fraction of requests"""
+        if not total:
+            return None
+        rank = fraction * total
+        seen = 0
+        for index, count in enumerate(buckets):
+            seen += count
+            if seen >= rank:
+                return LATENCY_BUCKETS_MS[index] if index < len(LATENCY_BUCKETS_MS) else float('inf')
+        return float('inf')
+
+    @staticmethod
+    def _current_rate(window: List[Tuple[int, int, float, float]]) -> float:
+        """Requests per second between the first and last request of the rate window"""
+        now = int(time.time())
+        busy = [(count, first, last) for second, count, first, last in window
+                if now - RATE_WINDOW_SECONDS < second <= now and count]
+        requests = sum(count for count, _, _ in busy)
+        span = max((last for _, _, last in busy), default=0.0) - min((first for _, first, _ in busy), default=0.0)
+        # n requests finished over a span have n - 1 intervals between them
+        return round((requests - 1) / span, 2) if requests > 1 and span > 0 else 0.0
+
+    def as_dict(self) -> Dict[str, object]:
+        with self._lock:
+            counters = list(self._counters)
+            buckets = list(self._buckets)
+            window = list(zip(self._seconds, self._second_counts, self._second_first, self._second_last))
+        uptime = time.time() - self.started
+        requests = int(counters[REQUESTS])
+        return {
+            'uptime_seconds': round(uptime, 3),
+            'requests': requests,
+            'failures': int(counters[FAILURES]),
+            'requests_per_second': self._current_rate(window),
+            'requests_per_second_since_start': round(requests / uptime, 2) if uptime else 0.0,
+            'bytes_in': int(counters[BYTES_IN]),
+            'bytes_out': int(counters[BYTES_OUT]),
+            'latency_ms': {
+                'mean': round(counters[LATENCY_TOTAL_MS] / requests, 3) if requests else None,
+                'p50': self._percentile(buckets, requests, 0.50),
+                'p95': self._percentile(buckets, requests, 0.95),
+                'p99': self._percentile(buckets, requests, 0.99),
+                'histogram': {f"le_{bound:g}": count for bound, count in zip(LATENCY_BUCKETS_MS, buckets)},
+                'over_max': buckets[-1]
+            }
+        }
+
+
+@dataclass
+class RegisteredStylesheet:
+    """A stylesheet file as currently served"""
+    stylesheet_id: str
+    path: Path
+    xslt: str
+    hash: str
+    mtime_ns: int
+    size: int
+    loaded_at: float
+    checked_at: float
+    content_type: str = "application/xml"
+    reload_error: Optional[str] = None
+
+
+class StylesheetRegistry:
+    """
+    Stylesheets of a directory by id, compiled before they are served.
+
+    Files are checked for changes at most once per reload interval. A changed file
+    is only swapped in once its new content compiles in the sandbox; until then, and
+    whenever the content hash did not actually change, the previous version keeps serving.
+    """
+
+    def __init__(self, directory: Path, sandbox: TransformSandbox,
+                 reload_interval: float = PerformanceConfig.SERVER_RELOAD_INTERVAL_SECONDS):
+        self.directory = Path(directory)
+        self.sandbox = sandbox
+        self.reload_interval = reload_interval
+        self._stylesheets: Dict[str, RegisteredStylesheet] = {}
+        self._lock = threading.Lock()
+
+    def _path(self, stylesheet_id: str) -> Optional[Path]:
+        if not stylesheet_id or '/' in stylesheet_id or '\\' in stylesheet_id or stylesheet_id.startswith('.'):
+            return None
+        for suffix in STYLESHEET_SUFFIXES:
+            path = self.directory / f"{stylesheet_id}{suffix}"
+            if path.is_file():
+                return path
+        return None
+
+    def _compile(self, xslt: str) -> None:
+        result = self.sandbox.compile(xslt)
+        if not result.success:
+            raise RuntimeError(result.failure.detail)
+
+    def _load(self, stylesheet_id: str, path: Path, current: Optional[RegisteredStylesheet]) -> RegisteredStylesheet:
+        status = path.stat()
+        now = time.time()
+        if current is not None and (current.mtime_ns, current.size) == (status.st_mtime_ns, status.st_size):
+            current.checked_at = now
+            return current
+        with open(path, "r", encoding="utf-8") as f:
+            xslt = f.read()
+        stylesheet_hash = content_hash(xslt)
+        if current is not None and current.hash == stylesheet_hash:
+            current.mtime_ns, current.size, current.checked_at = status.st_mtime_ns, status.st_size, now
+            return current
+        try:
+            self._compile(xslt)
+        except Exception as e:
+            if current is None:
+                raise
+            current.reload_error = f"{path.name} does not compile, still serving the previous version: {e}"
+            current.mtime_ns, current.size, current.checked_at = status.st_mtime_ns, status.st_size, now
+            return current
+        from .xslt_utils import output_content_type
+
+        return RegisteredStylesheet(stylesheet_id=stylesheet_id, path=path, xslt=xslt, hash=stylesheet_hash,
+                                    mtime_ns=status.st_mtime_ns, size=status.st_size, loaded_at=now, checked_at=now,
+                                    content_type=output_content_type(xslt))
+
+    def get(self, stylesheet_id: str) -> Optional[RegisteredStylesheet]:
+        """The stylesheet to serve for an id, reloading it if the file changed"""
+        current = self._stylesheets.get(stylesheet_id)
+        if current is not None and time.time() - current.checked_at < self.reload_interval:
+            return current
+        with self._lock:
+            current = self._stylesheets.get(stylesheet_id)
+            if current is not None and time.time() - current.checked_at < self.reload_interval:
+                return current
+            path = self._path(stylesheet_id)
+            if path is None:
+                self._stylesheets.pop(stylesheet_id, None)
+                return None
+            stylesheet = self._load(stylesheet_id, path, current)
+            self._stylesheets[stylesheet_id] = stylesheet
+            return stylesheet
+
+    def load_all(self) -> List[str]:
+        """Compile every stylesheet of the directory, returning the ones that failed"""
+        errors = []
+        for path in sorted(self.directory.iterdir()):
+            if path.suffix in STYLESHEET_SUFFIXES:
+                try:
+                    self.get(path.stem)
+                except Exception as e:
+                    errors.append(f"{path.name}: {e}")
+        return errors
+
+    def as_list(self) -> List[Dict[str, object]]:
+        return [{
+            'id': stylesheet.stylesheet_id,
+            'hash': stylesheet.hash,
+            'loaded_at': stylesheet.loaded_at,
+            'reload_error': stylesheet.reload_error
+        } for stylesheet in sorted(self._stylesheets.values(), key=lambda s: s.stylesheet_id)]
+
+
+class TransformRequestHandler(BaseHTTPRequestHandler):
+    """Serves transforms and status; HTTP/1.1 keeps client connections open between requests"""
+
+    protocol_version = "HTTP/1.1"
+    server_version = "XSLTTransformServer/1.0"
+    # Headers and body go out as separate writes; with Nagle on, each response waits for a delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args) -> None:
+        pass  # Per-request logging would cost more than a small transform
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json") -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: int, value) -> None:
+        self._send(status, json.dumps(value, indent=2).encode("utf-8"))
+
+    def do_GET(self) -> None:
+        path = urlsplit(self.path).path
+        if path == "/metrics":
+            self._send_json(200, self.server.metrics.as_dict())
+        elif path == "/stylesheets":
+            self._send_json(200, self.server.registry.as_list())
+        elif path == "/health":
+            self._send_json(200, {'status': 'ok', 'pid': os.getpid()})
+        else:
+            self._send_json(404, {'error': f"Unknown path {path}"})
+
+    def do_POST(self) -> None:
+        started = time.perf_counter()
+        url = urlsplit(self.path)
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            # The body cannot be delimited, so the connection cannot be reused either
+            self.close_connection = True
+            self._send_json(400, {'error': "Content-Length must be a non-negative integer"})
+            return
+        if length > self.server.max_body_bytes:
+            self.close_connection = True
+            self._send_json(413, {'error': f"Body is {length} bytes, limit is {self.server.max_body_bytes}"})
+            return
+        body = self.rfile.read(length)
+        if not url.path.startswith("/transform/"):
+            self._send_json(404, {'error': f"Unknown path {url.path}"})
+            return
+
+        status, output, content_type = self._transform(unquote(url.path[len("/transform/"):]), body, url.query)
+        self._send(status, output, content_type)
+        self.server.metrics.record((time.perf_counter() - started) * 1000, status == 200, len(body), len(output))
+
+    def _transform(self, stylesheet_id: str, body: bytes, query: str) -> Tuple[int, bytes, str]:
+        try:
+            stylesheet = self.server.registry.get(stylesheet_id)
+        except Exception as e:
+            return 500, json.dumps({'error': f"Stylesheet {stylesheet_id} cannot be loaded: {e}"}).encode("utf-8"), \
+                "application/json"
+        if stylesheet is None:
+            return 404, json.dumps({'error': f"Unknown stylesheet {stylesheet_id}"}).encode("utf-8"), \
+                "application/json"
+
+        parameters = dict(parse_qsl(query, keep_blank_values=True)) or None
+        result = self.server.sandbox.transform(stylesheet.xslt, body, parameters, output_bytes=True,
+                                               xslt_hash=stylesheet.hash)
+        if not result.success:
+            error = {'error': "Transform failed", 'reason': result.failure.reason, 'detail': result.failure.detail,
+                     'logs': result.logs}
+            return FAILURE_STATUS.get(result.failure.reason, 500), json.dumps(error).encode("utf-8"), \
+                "application/json"
+        return 200, result.output, stylesheet.content_type
+
+
+class TransformHTTPServer(ThreadingHTTPServer):
+    """Threaded HTTP server; with reuse_port several processes accept on one port"""
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address: Tuple[str, int], registry: StylesheetRegistry, metrics: ServerMetrics,
+                 reuse_port: bool = False, max_body_mb: float = PerformanceConfig.MAX_FILE_SIZE_MB):
+        self.registry = registry
+        self.sandbox = registry.sandbox
+        self.metrics = metrics
+        self.reuse_port = reuse_port
+        self.max_body_bytes = int(max_body_mb * 1024 * 1024)
+        super().__init__(address, TransformRequestHandler)
+
+    def server_bind(self) -> None:
+        if self.reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+
+def _serve(args: argparse.Namespace, metrics: ServerMetrics, reuse_port: bool) -> None:
+    """Run one server process until interrupted"""
+    sandbox = TransformSandbox(size=args.processors, timeout=args.timeout)
+    try:
+        registry = StylesheetRegistry(Path(args.stylesheet_dir), sandbox, args.reload_interval)
+        for error in registry.load_all():
+            print(f"Skipping stylesheet {error}", file=sys.stderr)
+        server = TransformHTTPServer((args.host, args.port), registry, metrics, reuse_port=reuse_port)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+    finally:
+        sandbox.shutdown()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Serve the stylesheets of a directory over HTTP")
+    parser.add_argument("stylesheet_dir", help="Directory of *.xsl / *.xslt files, served by file name")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on")
+    parser.add_argument("--port", type=int, default=PerformanceConfig.SERVER_PORT, help="Port to listen on")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="Server processes sharing the port (default: CPU count)")
+    parser.add_argument("--processors", type=int, default=PerformanceConfig.SERVER_PROCESSORS_PER_WORKER,
+                        help="Sandboxed transform workers, each with one Saxon processor, per server process")
+    parser.add_argument("--timeout", type=float, default=TestConfig.DEFAULT_TRANSFORMATION_TIMEOUT,
+                        help="Seconds a transform may run before its worker is killed")
+    parser.add_argument("--reload-interval", type=float, default=PerformanceConfig.SERVER_RELOAD_INTERVAL_SECONDS,
+                        help="Seconds between checks of a stylesheet file for changes")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    workers = args.workers or os.cpu_count() or 1
+    if workers > 1 and not hasattr(socket, "SO_REUSEPORT"):
+        print("This platform cannot share a port between processes; serving from one process", file=sys.stderr)
+        workers = 1
+
+    context = multiprocessing.get_context('spawn')
+    metrics = ServerMetrics(context)
+    print(f"Serving {args.stylesheet_dir} on http://{args.host}:{args.port} with {workers} process(es)",
+          file=sys.stderr)
+    if workers == 1:
+        _serve(args, metrics, reuse_port=False)
+        return 0
+
+    # Not daemonic: every server process starts sandbox worker processes of its own
+    processes = [context.Process(target=_serve, args=(args, metrics, True)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+                process.join(timeout=5)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,6 +2,8 @@ import re
 import xml.etree.ElementTree as ET
 from xml.dom import minidom
 from typing import Dict, Optional
+from .document_index import DocumentIndex, document_index
+from .regex_registry import regex_registry
 from .universal_xslt_analyzer import UniversalPattern
 from ..llm.llm_utils import setup_agent
 
@@ -158,25 +160,25 @@ ANTI-DUPLICATION REMINDER:
         """Enhanced cleaning with validation to prevent duplication"""
         
         # Remove code block markers
-        response = re.sub(r'```(?:xml|xsl|xslt)?\n?', '', response)
-        response = re.sub(r'```\n?', '', response)
+        response = regex_registry.compile(r'```(?:xml|xsl|xslt)?\n?').sub('', response)
+        response = regex_registry.compile(r'```\n?').sub('', response)
         
         # Remove explanatory text
-        response = re.sub(r'^Here\'s.*?:\s*', '', response, flags=re.IGNORECASE)
-        response = re.sub(r'^The.*?:\s*', '', response, flags=re.IGNORECASE)
-        response = re.sub(r'^Based on.*?:\s*', '', response, flags=re.IGNORECASE)
+        response = regex_registry.compile(r'^Here\'s.*?:\s*', re.IGNORECASE).sub('', response)
+        response = regex_registry.compile(r'^The.*?:\s*', re.IGNORECASE).sub('', response)
+        response = regex_registry.compile(r'^Based on.*?:\s*', re.IGNORECASE).sub('', response)
         
         # Remove trailing explanations
-        response = re.sub(r'\n\n.*explanation.*$', '', response, flags=re.IGNORECASE | re.DOTALL)
+        response = regex_registry.compile(r'\n\n.*explanation.*$', re.IGNORECASE | re.DOTALL).sub('', response)
         
         # Clean up namespace prefixes
-        response = re.sub(r'\bns\d+:', '', response)
-        response = re.sub(r'xmlns:ns\d+="[^"]*"\s*', '', response)
+        response = regex_registry.compile(r'\bns\d+:').sub('', response)
+        response = regex_registry.compile(r'xmlns:ns\d+="[^"]*"\s*').sub('', response)
         
         # Remove XSLT headers if AI incorrectly included them
-        response = re.sub(r'<\?xml[^>]*\?>\s*', '', response)
-        response = re.sub(r'<xsl:stylesheet[^>]*>\s*', '', response)
-        response = re.sub(r'</xsl:stylesheet>\s*', '', response)
+        response = regex_registry.compile(r'<\?xml[^>]*\?>\s*').sub('', response)
+        response = regex_registry.compile(r'<xsl:stylesheet[^>]*>\s*').sub('', response)
+        response = regex_registry.compile(r'</xsl:stylesheet>\s*').sub('', response)
         
         # For add_after operations, ensure only ONE target element
         if action_type.startswith("add_after_instance_"):
@@ -191,13 +193,12 @@ ANTI-DUPLICATION REMINDER:
         """Ensure only a single target element is generated"""
         
         # Find all occurrences of the target element
-        pattern = rf'<{re.escape(element_name)}[^>]*>.*?</{re.escape(element_name)}>'
-        matches = list(re.finditer(pattern, response, re.DOTALL))
+        matches = DocumentIndex(response).instances(element_name)
         
         if len(matches) > 1:
             # Take only the first match
             first_match = matches[0]
-            return response[first_match.start():first_match.end()]
+            return response[first_match.start:first_match.end]
         elif len(matches) == 1:
             # Perfect - only one element
             return response
@@ -250,17 +251,15 @@ ANTI-DUPLICATION REMINDER:
         """Surgically add a single new element after specific instance"""
         instance_num = int(action_type.split("_")[-1])
         
-        # Find all instances of the pattern
-        pattern_regex = rf'<{re.escape(pattern.pattern_name)}[^>]*>.*?</{re.escape(pattern.pattern_name)}>'
-        matches = list(re.finditer(pattern_regex, original_xslt, re.DOTALL))
+        # Find the instance in the span index shared with the analyzer and chunk extractor
+        target_match = document_index(original_xslt).nth(pattern.pattern_name, instance_num)
         
-        if len(matches) >= instance_num:
-            target_match = matches[instance_num - 1]  # Convert to 0-based index
-            insertion_point = target_match.end()
+        if target_match is not None:
+            insertion_point = target_match.end
             
             # Get proper indentation from the target instance
-            target_line_start = original_xslt.rfind('\n', 0, target_match.start()) + 1
-            target_line = original_xslt[target_line_start:target_match.start()]
+            target_line_start = original_xslt.rfind('\n', 0, target_match.start) + 1
+            target_line = original_xslt[target_line_start:target_match.start]
             indent = self._get_line_indentation(target_line)
             
             # Apply indentation to the new element
@@ -276,23 +275,27 @@ ANTI-DUPLICATION REMINDER:
         """Append content to a specific instance"""
         instance_num = int(action_type.split("_")[-1])
         
-        pattern_regex = rf'(<{re.escape(pattern.pattern_name)}[^>]*>)(.*?)(</{re.escape(pattern.pattern_name)}>)'
-        matches = list(re.finditer(pattern_regex, original_xslt, re.DOTALL))
+        target_match = document_index(original_xslt).nth(pattern.pattern_name, instance_num)
         
-        if len(matches) >= instance_num:
-            target_match = matches[instance_num - 1]
-            opening_tag = target_match.group(1)
-            existing_content = target_match.group(2)
-            closing_tag = target_match.group(3)
+        if target_match is not None:
+            if target_match.self_closing:
+                # Expand <name .../> so content can be appended to it
+                opening_tag = original_xslt[target_match.start:target_match.end - 2].rstrip() + '>'
+                existing_content = ''
+                closing_tag = f'</{target_match.name}>'
+            else:
+                opening_tag = original_xslt[target_match.start:target_match.content_start]
+                existing_content = original_xslt[target_match.content_start:target_match.content_end]
+                closing_tag = original_xslt[target_match.content_end:target_match.end]
             
             # Get proper indentation
-            target_line_start = original_xslt.rfind('\n', 0, target_match.start()) + 1
-            target_line = original_xslt[target_line_start:target_match.start()]
+            target_line_start = original_xslt.rfind('\n', 0, target_match.start) + 1
+            target_line = original_xslt[target_line_start:target_match.start]
             indent = self._get_line_indentation(target_line)
             indented_chunk = self._indent_chunk(modified_chunk, indent + '\t')
             
             new_element_content = opening_tag + existing_content + '\n' + indented_chunk + '\n' + indent + closing_tag
-            updated_xslt = original_xslt[:target_match.start()] + new_element_content + original_xslt[target_match.end():]
+            updated_xslt = original_xslt[:target_match.start] + new_element_content + original_xslt[target_match.end:]
             return updated_xslt
         
         return original_xslt
@@ -301,19 +304,16 @@ ANTI-DUPLICATION REMINDER:
         """Modify a specific instance"""
         instance_num = int(action_type.split("_")[-1])
         
-        pattern_regex = rf'<{re.escape(pattern.pattern_name)}[^>]*>.*?</{re.escape(pattern.pattern_name)}>'
-        matches = list(re.finditer(pattern_regex, original_xslt, re.DOTALL))
+        target_match = document_index(original_xslt).nth(pattern.pattern_name, instance_num)
         
-        if len(matches) >= instance_num:
-            target_match = matches[instance_num - 1]
-            
+        if target_match is not None:
             # Get proper indentation
-            target_line_start = original_xslt.rfind('\n', 0, target_match.start()) + 1
-            target_line = original_xslt[target_line_start:target_match.start()]
+            target_line_start = original_xslt.rfind('\n', 0, target_match.start) + 1
+            target_line = original_xslt[target_line_start:target_match.start]
             indent = self._get_line_indentation(target_line)
             indented_chunk = self._indent_chunk(modified_chunk, indent)
             
-            updated_xslt = original_xslt[:target_match.start()] + indented_chunk + original_xslt[target_match.end():]
+            updated_xslt = original_xslt[:target_match.start] + indented_chunk + original_xslt[target_match.end:]
             return updated_xslt
         
         return original_xslt
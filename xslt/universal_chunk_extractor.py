@@ -1,5 +1,6 @@
 import re
 from typing import List, Dict, Tuple, Optional
+from .document_index import DocumentIndex, document_index
 from .universal_xslt_analyzer import UniversalPattern
 
 class UniversalChunkExtractor:
@@ -8,6 +9,23 @@ class UniversalChunkExtractor:
     def __init__(self, xslt_content: str):
         self.xslt_content = xslt_content
         self.lines = xslt_content.split('\n')
+        self._index = None
+    
+    @property
+    def index(self) -> DocumentIndex:
+        """Element span index shared with the analyzer and the merge, so instances are numbered alike"""
+        if self._index is None:
+            self._index = document_index(self.xslt_content)
+        return self._index
+    
+    def _instance_lines(self, pattern: UniversalPattern, instance_num: int) -> Optional[Tuple[int, int]]:
+        """Line span of the instance_num-th (1-based) instance of a pattern, or None if there is none"""
+        if pattern.pattern_type == 'xml_element':
+            span = self.index.nth(pattern.pattern_name, instance_num)
+            return (span.start_line, span.end_line) if span is not None else None
+        if 0 < instance_num <= len(pattern.instances):
+            return pattern.instances[instance_num - 1]
+        return None
     
     def extract_universal_context(self, pattern: UniversalPattern, requirement: str, action_type: str) -> str:
         """Extract context using surgical strategies to prevent duplication"""
@@ -24,9 +42,10 @@ class UniversalChunkExtractor:
     def _extract_surgical_reference_context(self, pattern: UniversalPattern, action_type: str, requirement: str) -> str:
         """Extract surgical reference context that prevents AI from copying existing elements"""
         instance_num = int(action_type.split("_")[-1])
+        instance = self._instance_lines(pattern, instance_num)
         
-        if instance_num <= len(pattern.instances):
-            target_start, target_end = pattern.instances[instance_num - 1]
+        if instance is not None:
+            target_start, target_end = instance
             
             # Extract just ONE reference element with clear instructions
             reference_element = '\n'.join(self.lines[target_start:target_end + 1])
@@ -49,9 +68,10 @@ REQUIREMENT: {requirement}
     def _extract_instance_for_append(self, pattern: UniversalPattern, action_type: str) -> str:
         """Extract specific instance for appending content to it"""
         instance_num = int(action_type.split("_")[-1])
+        instance = self._instance_lines(pattern, instance_num)
         
-        if instance_num <= len(pattern.instances):
-            start_line, end_line = pattern.instances[instance_num - 1]
+        if instance is not None:
+            start_line, end_line = instance
             instance_lines = self.lines[start_line:end_line + 1]
             return '\n'.join(instance_lines)
         else:
@@ -60,9 +80,10 @@ REQUIREMENT: {requirement}
     def _extract_instance_for_modification(self, pattern: UniversalPattern, action_type: str) -> str:
         """Extract specific instance for modification with minimal context"""
         instance_num = int(action_type.split("_")[-1])
+        instance = self._instance_lines(pattern, instance_num)
         
-        if instance_num <= len(pattern.instances):
-            start_line, end_line = pattern.instances[instance_num - 1]
+        if instance is not None:
+            start_line, end_line = instance
             
             # Include minimal context for modification
             context_start = max(0, start_line - 1)
@@ -75,11 +96,12 @@ REQUIREMENT: {requirement}
     
     def _extract_minimal_context(self, pattern: UniversalPattern, requirement: str) -> str:
         """Extract minimal context for other operations"""
-        if not pattern.instances:
+        instance = self._instance_lines(pattern, 1)
+        if instance is None:
             return self._create_minimal_structure(pattern.pattern_name)
         
         # Extract first instance with minimal context
-        start_line, end_line = pattern.instances[0]
+        start_line, end_line = instance
         context_lines = 2
         
         context_start = max(0, start_line - context_lines)
@@ -99,9 +121,10 @@ REQUIREMENT: {requirement}
 
     def extract_clean_reference_only(self, pattern: UniversalPattern, instance_num: int) -> str:
         """Extract a single clean reference element without encouraging copying"""
+        instance = self._instance_lines(pattern, instance_num)
         
-        if instance_num <= len(pattern.instances):
-            start_line, end_line = pattern.instances[instance_num - 1]
+        if instance is not None:
+            start_line, end_line = instance
             reference_content = '\n'.join(self.lines[start_line:end_line + 1])
             
             # Wrap with clear anti-copying instructions
@@ -113,11 +136,12 @@ REQUIREMENT: {requirement}
     
     def get_parent_context(self, pattern: UniversalPattern, lines_before: int = 3, lines_after: int = 3) -> str:
         """Get parent context around the pattern for understanding placement"""
-        if not pattern.instances:
+        instance = self._instance_lines(pattern, 1)
+        if instance is None:
             return ""
         
         # Use first instance for context
-        start_line, end_line = pattern.instances[0]
+        start_line, end_line = instance
         
         context_start = max(0, start_line - lines_before)
         context_end = min(len(self.lines), end_line + lines_after + 1)
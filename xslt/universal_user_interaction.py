@@ -1,6 +1,8 @@
 import re
 from typing import List, Dict, Tuple, Optional
 from dataclasses import dataclass
+from .document_index import document_index
+from .regex_registry import regex_registry
 
 @dataclass
 class UserIntent:
@@ -26,7 +28,7 @@ class UniversalUserInteraction:
         
         nodes = set()
         for pattern in node_patterns:
-            matches = re.findall(pattern, requirement_text, re.IGNORECASE)
+            matches = regex_registry.compile(pattern, re.IGNORECASE).findall(requirement_text)
             for match in matches:
                 if isinstance(match, tuple):
                     match = match[0] if match[0] else match[1]
@@ -71,9 +73,7 @@ class UniversalUserInteraction:
     @staticmethod
     def check_xpath_matches(xslt_content: str, node_name: str) -> int:
         """Count instances of a node in XSLT content"""
-        pattern = f'<{node_name}(?:\\s[^>]*)?>.*?</{node_name}>|<{node_name}/>'
-        matches = re.findall(pattern, xslt_content, re.DOTALL)
-        return len(matches)
+        return document_index(xslt_content).count(node_name)
     
     @staticmethod
     def generate_placement_options(node_name: str, instance_count: int, intent: UserIntent) -> List[Dict]:
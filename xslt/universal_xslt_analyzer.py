@@ -1,8 +1,13 @@
 import re
+import time
 import xml.etree.ElementTree as ET
 from typing import List, Dict, Tuple, Optional
 from dataclasses import dataclass
 from collections import defaultdict
+from .analysis_cache import ANALYZED, analysis_cache
+from .document_index import CONDITIONAL, LOOP, DocumentIndex, document_index
+from .regex_registry import regex_registry
+from .stylesheet_cache import content_hash
 
 @dataclass
 class UniversalPattern:
@@ -14,6 +19,8 @@ class UniversalPattern:
     sample_content: str
     xpath_pattern: Optional[str] = None
 
+OPENING_TAG_PATTERN = regex_registry.compile(r'<([^/\s!?][^>\s]*?)(?:\s[^>]*)?>')
+
 class UniversalXSLTAnalyzer:
     """Universal XSLT analyzer that detects all types of repeating patterns"""
     
@@ -21,9 +28,37 @@ class UniversalXSLTAnalyzer:
         self.xslt_content = xslt_content
         self.lines = xslt_content.split('\n')
         self.patterns = []
+        self._index = None
+        # Where the last analysis came from (memory, disk or analyzed) and how long it took
+        self.analysis_source = None
+        self.analysis_seconds = 0.0
         
-    def find_all_repeating_patterns(self) -> List[UniversalPattern]:
-        """Find all repeating patterns in the XSLT"""
+    @property
+    def index(self) -> DocumentIndex:
+        """Element span index of this stylesheet version, shared with the rest of the update pipeline"""
+        if self._index is None:
+            self._index = document_index(self.xslt_content)
+        return self._index
+    
+    def find_all_repeating_patterns(self, use_cache: bool = True) -> List[UniversalPattern]:
+        """Find all repeating patterns in the XSLT, reusing the analysis of identical stylesheet content"""
+        started = time.perf_counter()
+        key = analysis_cache.key(content_hash(self.xslt_content)) if use_cache else None
+        record, source = analysis_cache.get(key) if use_cache else (None, None)
+        patterns = self._patterns_from_record(record) if record is not None else None
+        if patterns is not None:
+            self.patterns = patterns
+        else:
+            source = None
+            self._analyze()
+            if use_cache:
+                analysis_cache.put(key, self._record())
+        self.analysis_source = source or ANALYZED
+        self.analysis_seconds = analysis_cache.record_time(source, started)
+        return self.patterns
+    
+    def _analyze(self) -> None:
+        """Find the patterns of every type in the stylesheet"""
         patterns = []
         
         # Find different types of patterns
@@ -34,78 +69,76 @@ class UniversalXSLTAnalyzer:
         
         # Filter patterns with multiple instances
         self.patterns = [p for p in patterns if p.instance_count > 1]
-        return self.patterns
+    
+    def _record(self) -> Dict[str, object]:
+        """Compact form of the patterns for the analysis cache, without their sample content"""
+        return {
+            'patterns': [[p.pattern_name, p.pattern_type, p.xpath_pattern,
+                          [line for instance in p.instances for line in instance]] for p in self.patterns]
+        }
+    
+    def _patterns_from_record(self, record: Dict[str, object]) -> Optional[List[UniversalPattern]]:
+        """Patterns of a cached record, with sample content cut from this stylesheet's lines, or None if it is malformed"""
+        patterns = []
+        try:
+            for pattern_name, pattern_type, xpath_pattern, lines in record['patterns']:
+                if (not lines or len(lines) % 2
+                        or not all(isinstance(line, int) and 0 <= line < len(self.lines) for line in lines)):
+                    return None
+                instances = list(zip(lines[::2], lines[1::2]))
+                patterns.append(UniversalPattern(
+                    pattern_name=str(pattern_name),
+                    pattern_type=str(pattern_type),
+                    instance_count=len(instances),
+                    instances=instances,
+                    sample_content=self._extract_sample_content(instances[0]),
+                    xpath_pattern=str(xpath_pattern)
+                ))
+        except (KeyError, TypeError, ValueError):
+            return None
+        return patterns
     
     def _find_repeating_xml_elements(self) -> List[UniversalPattern]:
         """Find repeating XML elements (non-XSLT elements)"""
         patterns = []
-        element_counts = defaultdict(list)
         
-        # Pattern to match XML elements (excluding XSLT namespace)
-        element_pattern = r'<([^/\s!?][^>\s]*?)(?:\s[^>]*)?>.*?</\1>'
-        
-        for i, line in enumerate(self.lines):
-            # Skip XSLT elements
-            if 'xsl:' in line or '<?xml' in line or '<!--' in line:
+        # Create patterns for literal elements that appear multiple times
+        for element_name in self.index.element_names():
+            if ':' in element_name or element_name in ['xsl', 'xml'] or self.index.count(element_name) < 2:
                 continue
-                
-            # Find opening tags
-            opening_tags = re.findall(r'<([^/\s!?][^>\s]*?)(?:\s[^>]*)?>', line)
-            for tag in opening_tags:
-                if ':' not in tag and tag not in ['xsl', 'xml']:  # Skip namespaced elements
-                    element_counts[tag].append(i)
-        
-        # Create patterns for elements that appear multiple times
-        for element_name, line_numbers in element_counts.items():
-            if len(line_numbers) > 1:
-                instances = self._find_element_instances(element_name)
-                if instances:
-                    sample_content = self._extract_sample_content(instances[0])
-                    pattern = UniversalPattern(
-                        pattern_name=element_name,
-                        pattern_type='xml_element',
-                        instance_count=len(instances),
-                        instances=instances,
-                        sample_content=sample_content,
-                        xpath_pattern=f'//{element_name}'
-                    )
-                    patterns.append(pattern)
+            instances = self._find_element_instances(element_name)
+            sample_content = self._extract_sample_content(instances[0])
+            pattern = UniversalPattern(
+                pattern_name=element_name,
+                pattern_type='xml_element',
+                instance_count=len(instances),
+                instances=instances,
+                sample_content=sample_content,
+                xpath_pattern=f'//{element_name}'
+            )
+            patterns.append(pattern)
         
         return patterns
     
     def _find_repeating_templates(self) -> List[UniversalPattern]:
         """Find repeating XSLT templates"""
         patterns = []
-        template_pattern = r'<xsl:template[^>]*match="([^"]*)"[^>]*>'
-        
-        template_matches = defaultdict(list)
-        
-        for i, line in enumerate(self.lines):
-            match = re.search(template_pattern, line)
-            if match:
-                template_match = match.group(1)
-                template_matches[template_match].append(i)
         
         # Create patterns for templates that appear multiple times
-        for match_pattern, line_numbers in template_matches.items():
-            if len(line_numbers) > 1:
-                instances = []
-                for line_num in line_numbers:
-                    start_line = line_num
-                    end_line = self._find_template_end(start_line)
-                    instances.append((start_line, end_line))
-                
-                if instances:
-                    sample_content = self._extract_sample_content(instances[0])
-                    pattern = UniversalPattern(
-                        pattern_name=f"template_{match_pattern.replace('/', '_')}",
-                        pattern_type='template',
-                        instance_count=len(instances),
-                        instances=instances,
-                        sample_content=sample_content,
-                        xpath_pattern=match_pattern
-                    )
-                    patterns.append(pattern)
+        for match_pattern in self.index.template_matches():
+            templates = self.index.templates(match_pattern)
+            if len(templates) > 1:
+                instances = [(template.start_line, template.end_line) for template in templates]
+                sample_content = self._extract_sample_content(instances[0])
+                pattern = UniversalPattern(
+                    pattern_name=f"template_{match_pattern.replace('/', '_')}",
+                    pattern_type='template',
+                    instance_count=len(instances),
+                    instances=instances,
+                    sample_content=sample_content,
+                    xpath_pattern=match_pattern
+                )
+                patterns.append(pattern)
         
         return patterns
     
@@ -113,31 +146,27 @@ class UniversalXSLTAnalyzer:
         """Find patterns within xsl:for-each loops"""
         patterns = []
         
-        for i, line in enumerate(self.lines):
-            if '<xsl:for-each' in line:
-                # Extract the select attribute
-                select_match = re.search(r'select="([^"]*)"', line)
-                if select_match:
-                    select_path = select_match.group(1)
-                    start_line = i
-                    end_line = self._find_loop_end(start_line)
+        for loop in self.index.blocks(LOOP):
+            if loop.key is None:
+                continue
+            start_line, end_line = loop.start_line, loop.end_line
                     
-                    # Extract content within the loop
-                    loop_content = '\n'.join(self.lines[start_line:end_line + 1])
+            # Extract content within the loop
+            loop_content = '\n'.join(self.lines[start_line:end_line + 1])
                     
-                    # Find elements within this loop
-                    inner_elements = self._extract_loop_elements(loop_content)
+            # Find elements within this loop
+            inner_elements = self._extract_loop_elements(loop_content)
                     
-                    for element in inner_elements:
-                        pattern = UniversalPattern(
-                            pattern_name=f"loop_{element}",
-                            pattern_type='loop',
-                            instance_count=1,  # Each loop is considered one instance
-                            instances=[(start_line, end_line)],
-                            sample_content=loop_content[:200],
-                            xpath_pattern=f"{select_path}/{element}"
-                        )
-                        patterns.append(pattern)
+            for element in inner_elements:
+                pattern = UniversalPattern(
+                    pattern_name=f"loop_{element}",
+                    pattern_type='loop',
+                    instance_count=1,  # Each loop is considered one instance
+                    instances=[(start_line, end_line)],
+                    sample_content=loop_content[:200],
+                    xpath_pattern=f"{loop.key}/{element}"
+                )
+                patterns.append(pattern)
         
         return patterns
     
@@ -145,112 +174,59 @@ class UniversalXSLTAnalyzer:
         """Find patterns within xsl:if or xsl:choose blocks"""
         patterns = []
         
-        for i, line in enumerate(self.lines):
-            if '<xsl:if' in line or '<xsl:when' in line:
-                test_match = re.search(r'test="([^"]*)"', line)
-                if test_match:
-                    test_condition = test_match.group(1)
-                    start_line = i
-                    
-                    if '<xsl:if' in line:
-                        end_line = self._find_if_end(start_line)
-                        pattern_name = f"if_{test_condition.replace('/', '_').replace('@', 'attr_')}"
-                    else:
-                        end_line = self._find_when_end(start_line)
-                        pattern_name = f"when_{test_condition.replace('/', '_').replace('@', 'attr_')}"
-                    
-                    content = '\n'.join(self.lines[start_line:end_line + 1])
+        for conditional in self.index.blocks(CONDITIONAL):
+            test_condition = conditional.key
+            if test_condition is None:
+                continue
+            prefix = 'if' if conditional.name == 'xsl:if' else 'when'
+            pattern_name = f"{prefix}_{test_condition.replace('/', '_').replace('@', 'attr_')}"
                     
-                    pattern = UniversalPattern(
-                        pattern_name=pattern_name[:50],  # Limit name length
-                        pattern_type='conditional',
-                        instance_count=1,
-                        instances=[(start_line, end_line)],
-                        sample_content=content[:200],
-                        xpath_pattern=test_condition
-                    )
-                    patterns.append(pattern)
+            pattern = UniversalPattern(
+                pattern_name=pattern_name[:50],  # Limit name length
+                pattern_type='conditional',
+                instance_count=1,
+                instances=[(conditional.start_line, conditional.end_line)],
+                sample_content=self._extract_leading_content((conditional.start_line, conditional.end_line), 200),
+                xpath_pattern=test_condition
+            )
+            patterns.append(pattern)
         
         return patterns
     
     def _find_element_instances(self, element_name: str) -> List[Tuple[int, int]]:
         """Find all instances of a specific XML element"""
-        instances = []
-        i = 0
-        
-        while i < len(self.lines):
-            line = self.lines[i]
-            
-            # Look for opening tag
-            opening_pattern = f'<{element_name}(?:\\s[^>]*)?>|<{element_name}/>'
-            if re.search(opening_pattern, line):
-                start_line = i
-                
-                # Check if it's a self-closing tag
-                if f'<{element_name}/>' in line:
-                    instances.append((start_line, start_line))
-                else:
-                    # Find the closing tag
-                    end_line = self._find_closing_tag(element_name, start_line)
-                    if end_line is not None:
-                        instances.append((start_line, end_line))
-            i += 1
-        
-        return instances
+        return [(span.start_line, span.end_line) for span in self.index.instances(element_name)]
     
     def _find_closing_tag(self, element_name: str, start_line: int) -> Optional[int]:
         """Find the closing tag for an element starting at start_line"""
-        open_count = 1
-        
-        for i in range(start_line + 1, len(self.lines)):
-            line = self.lines[i]
-            
-            # Count opening tags
-            open_tags = len(re.findall(f'<{element_name}(?:\\s[^>]*)?>(?!</)', line))
-            open_count += open_tags
-            
-            # Count closing tags
-            close_tags = len(re.findall(f'</{element_name}>', line))
-            open_count -= close_tags
-            
-            if open_count == 0:
-                return i
+        span = self.index.element_at_line(element_name, start_line)
+        return span.end_line if span is not None else None
         
-        return None
+    def _find_block_end(self, element_name: str, start_line: int) -> int:
+        """Last line of the block element starting at start_line, or the last line of the stylesheet"""
+        span = self.index.element_at_line(element_name, start_line)
+        return span.end_line if span is not None else len(self.lines) - 1
     
     def _find_template_end(self, start_line: int) -> int:
         """Find the end of an XSLT template"""
-        for i in range(start_line + 1, len(self.lines)):
-            if '</xsl:template>' in self.lines[i]:
-                return i
-        return len(self.lines) - 1
+        return self._find_block_end('xsl:template', start_line)
     
     def _find_loop_end(self, start_line: int) -> int:
         """Find the end of an xsl:for-each loop"""
-        for i in range(start_line + 1, len(self.lines)):
-            if '</xsl:for-each>' in self.lines[i]:
-                return i
-        return len(self.lines) - 1
+        return self._find_block_end('xsl:for-each', start_line)
     
     def _find_if_end(self, start_line: int) -> int:
         """Find the end of an xsl:if block"""
-        for i in range(start_line + 1, len(self.lines)):
-            if '</xsl:if>' in self.lines[i]:
-                return i
-        return len(self.lines) - 1
+        return self._find_block_end('xsl:if', start_line)
     
     def _find_when_end(self, start_line: int) -> int:
         """Find the end of an xsl:when block"""
-        for i in range(start_line + 1, len(self.lines)):
-            if '</xsl:when>' in self.lines[i] or '</xsl:choose>' in self.lines[i]:
-                return i
-        return len(self.lines) - 1
+        return self._find_block_end('xsl:when', start_line)
     
     def _extract_loop_elements(self, loop_content: str) -> List[str]:
         """Extract XML elements from loop content"""
         elements = []
-        element_pattern = r'<([^/\s!?xsl][^>\s]*?)(?:\s[^>]*)?>.*?</\1>'
-        matches = re.findall(r'<([^/\s!?][^>\s]*?)(?:\s[^>]*)?>', loop_content)
+        matches = OPENING_TAG_PATTERN.findall(loop_content)
         
         for match in matches:
             if not match.startswith('xsl:') and match not in elements:
@@ -264,6 +240,13 @@ class UniversalXSLTAnalyzer:
         content_lines = self.lines[start_line:end_line + 1]
         return '\n'.join(content_lines)
     
+    def _extract_leading_content(self, instance: Tuple[int, int], limit: int) -> str:
+        """First characters of an instance's lines, without joining all of them"""
+        start_line, end_line = instance
+        start = self.index.line_offset(start_line)
+        end = self.index.line_offset(end_line + 1) - 1
+        return self.xslt_content[start:min(end, start + limit)]
+    
     def get_pattern_by_name(self, pattern_name: str) -> Optional[UniversalPattern]:
         """Get a pattern by its name"""
         for pattern in self.patterns:
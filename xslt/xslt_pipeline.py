@@ -0,0 +1,159 @@
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+import saxonche
+from .saxon_pool import saxon_pool
+from .xslt_utils import bind_parameters, compile_xslt, parse_xml_cached, prepare_parameters
+
+
+@dataclass
+class PipelineStage:
+    """One stylesheet of a pipeline or fan-out"""
+    name: str
+    xslt: str
+    parameters: Optional[Dict[str, str]] = None
+
+
+@dataclass
+class StageResult:
+    """Timing and outcome of one stage"""
+    name: str
+    compile_ms: float = 0.0
+    transform_ms: float = 0.0
+    error: Optional[str] = None
+
+    @property
+    def success(self) -> bool:
+        return self.error is None
+
+
+@dataclass
+class PipelineResult:
+    """Output of a chained pipeline with per-stage timings"""
+    output: Optional[str]
+    stages: List[StageResult] = field(default_factory=list)
+    parse_ms: float = 0.0
+    total_ms: float = 0.0
+    logs: List[str] = field(default_factory=list)
+
+    @property
+    def success(self) -> bool:
+        return self.output is not None and all(stage.success for stage in self.stages)
+
+
+@dataclass
+class FanOutResult:
+    """Outputs of several stylesheets applied to one parsed input, keyed by stage name"""
+    outputs: Dict[str, Optional[str]] = field(default_factory=dict)
+    stages: List[StageResult] = field(default_factory=list)
+    parse_ms: float = 0.0
+    total_ms: float = 0.0
+    logs: List[str] = field(default_factory=list)
+
+
+StageSpec = Union[PipelineStage, Tuple[str, str]]
+
+
+def _as_stages(stages: Sequence[StageSpec]) -> List[PipelineStage]:
+    return [stage if isinstance(stage, PipelineStage) else PipelineStage(*stage) for stage in stages]
+
+
+def _as_node(value) -> "saxonche.PyXdmNode":
+    """The document node a stage produced, to feed the next stage without serializing it"""
+    if isinstance(value, saxonche.PyXdmNode):
+        return value
+    item = value.head if value is not None else None
+    if isinstance(item, saxonche.PyXdmNode):
+        return item
+    if item is not None and item.is_node:
+        return item.get_node_value()
+    raise ValueError("Stage did not produce a node that the next stage can take as input")
+
+
+def _run_stage(slot, stage: PipelineStage, document, to_string: bool, result: StageResult):
+    """Compile and run one stage, returning its serialized output or its result value"""
+    xslt, parameter_values = prepare_parameters(stage.xslt, stage.parameters)
+    started = time.perf_counter()
+    compiled_xslt = compile_xslt(slot, xslt)
+    compiled = time.perf_counter()
+    result.compile_ms = (compiled - started) * 1000
+    bind_parameters(slot, compiled_xslt, document, parameter_values, xslt)
+    try:
+        if to_string:
+            output = compiled_xslt.transform_to_string(xdm_node=document)
+        else:
+            output = compiled_xslt.transform_to_value(xdm_node=document)
+    finally:
+        compiled_xslt.clear_parameters()
+        result.transform_ms = (time.perf_counter() - compiled) * 1000
+    return output
+
+
+def _record_error(stage_result: StageResult, logs: List[str], error: Exception) -> None:
+    if isinstance(error, saxonche.PySaxonApiError):
+        message = f"An error occurred during the XSLT transformation in stage '{stage_result.name}': {error}"
+    else:
+        message = f"An unexpected error occurred in stage '{stage_result.name}': {error}"
+    stage_result.error = message
+    logs.append(message)
+
+
+def run_pipeline(stages: Sequence[StageSpec], xml) -> PipelineResult:
+    """
+    Apply stylesheets in sequence, passing each result to the next stage as an XDM node.
+    Only the last stage serializes, so its xsl:output settings apply to the final output.
+    """
+    stages = _as_stages(stages)
+    result = PipelineResult(output=None)
+    started = time.perf_counter()
+    # Every stage runs on one processor, which owns the intermediate nodes
+    with saxon_pool.lease() as slot:
+        try:
+            document = parse_xml_cached(slot, xml)
+        except Exception as e:
+            result.logs.append(f"An error occurred while parsing the pipeline input: {e}")
+            return result
+        result.parse_ms = (time.perf_counter() - started) * 1000
+
+        for index, stage in enumerate(stages):
+            stage_result = StageResult(name=stage.name)
+            result.stages.append(stage_result)
+            is_last = index == len(stages) - 1
+            try:
+                output = _run_stage(slot, stage, document, is_last, stage_result)
+                if is_last:
+                    result.output = output
+                else:
+                    document = _as_node(output)
+            except Exception as e:
+                _record_error(stage_result, result.logs, e)
+                break
+
+    result.total_ms = (time.perf_counter() - started) * 1000
+    return result
+
+
+def fan_out(stages: Sequence[StageSpec], xml) -> FanOutResult:
+    """Apply several stylesheets to one parsed input; a failing stylesheet does not stop the others"""
+    stages = _as_stages(stages)
+    result = FanOutResult()
+    started = time.perf_counter()
+    with saxon_pool.lease() as slot:
+        try:
+            document = parse_xml_cached(slot, xml)
+        except Exception as e:
+            result.logs.append(f"An error occurred while parsing the fan-out input: {e}")
+            return result
+        result.parse_ms = (time.perf_counter() - started) * 1000
+
+        for stage in stages:
+            stage_result = StageResult(name=stage.name)
+            result.stages.append(stage_result)
+            try:
+                result.outputs[stage.name] = _run_stage(slot, stage, document, True, stage_result)
+            except Exception as e:
+                result.outputs[stage.name] = None
+                _record_error(stage_result, result.logs, e)
+
+    result.total_ms = (time.perf_counter() - started) * 1000
+    return result
@@ -150,6 +150,13 @@ class PatternConfig:
     STANDALONE_ELEMENT_PATTERN = r'\b[A-Za-z][A-Za-z0-9]*(?=[^A-Za-z0-9]|$)'
     XML_ELEMENT_EXTRACT_PATTERN = r'<([A-Za-z][A-Za-z0-9]*)[^>]*>'
     XML_COMMENT_PATTERN = r'<!--.*?-->'
+    STREAMABLE_MODE_PATTERN = r'<xsl:mode\b[^>]*\bstreamable\s*=\s*["\'](?:yes|true|1)["\']'
+    XML_DECLARED_ENCODING_PATTERN = r'^\s*<\?xml[^>]*\bencoding\s*=\s*["\']([A-Za-z][A-Za-z0-9._-]*)["\']'
+    XSL_OUTPUT_ENCODING_PATTERN = r'<xsl:output\b[^>]*\bencoding\s*=\s*["\']([A-Za-z][A-Za-z0-9._-]*)["\']'
+    XSL_OUTPUT_METHOD_PATTERN = r'<xsl:output\b[^>]*\bmethod\s*=\s*["\']([^"\']*)["\']'
+    XSL_OUTPUT_MEDIA_TYPE_PATTERN = r'<xsl:output\b[^>]*\bmedia-type\s*=\s*["\']([^"\']*)["\']'
+    XSL_STYLESHEET_START_PATTERN = r'<(?:[\w.-]+:)?(?:stylesheet|transform)\b(?:[^>"\']|"[^"]*"|\'[^\']*\')*>'
+    NAMESPACE_DECLARATION_PATTERN = r'\bxmlns:([\w.-]+)\s*=\s*["\']([^"\']*)["\']'
     XSLT_STYLESHEET_HEADER = '<xsl:stylesheet version="1.0" xmlns:xsl="http://www.w3.org/1999/XSL/Transform">'
 
 # Extraction Configuration
@@ -198,6 +205,23 @@ class PathConfig:
     UPDATED_XSLT_FILENAME = "updated_xslt.xslt"
     GENERATED_SPECS_FILENAME = "generated_specs.md"
     TRANSFORMED_XML_PREFIX = "transformed_"
+    
+    # Cache directories below (None uses a private directory under XDG_CACHE_HOME or ~/.cache);
+    # a directory owned by another user is refused
+    # Cached baseline outputs of regression runs
+    REGRESSION_BASELINE_DIR = None
+    
+    # Persistent store of compiled stylesheets
+    STYLESHEET_STORE_DIR = None
+    
+    # Directory that relative xsl:include/xsl:import hrefs resolve against (None uses the working directory)
+    XSLT_MODULE_ROOT = None
+    
+    # Uploaded XSD schema sets, one directory per set
+    SCHEMA_CACHE_DIR = None
+    
+    # Stored pattern analyses of stylesheets
+    ANALYSIS_CACHE_DIR = None
 
 # Debug and Logging Configuration
 class DebugConfig:
@@ -305,6 +329,9 @@ class TestConfig:
     # Testing batch sizes and limits
     MAX_BATCH_FILES = 100
     DEFAULT_TRANSFORMATION_TIMEOUT = 30  # seconds
+    MAX_REGRESSION_DIFFS = 20  # structural differences reported per changed input
+    MAX_BASELINE_STORE_MB = 256  # least recently used baseline outputs are removed beyond this
+    MAX_CACHED_SCHEMAS = 128  # compiled XSD schemas kept in memory, one per schema set and validation thread
     
     # Test file paths (for development/testing)
     DEFAULT_TEST_PATHS = {
@@ -317,11 +344,37 @@ class TestConfig:
 class PerformanceConfig:
     # Processing limits
     MAX_FILE_SIZE_MB = 10
+    STREAMING_THRESHOLD_MB = 5  # larger inputs are transformed file-to-file
     MAX_PROCESSING_TIME_SECONDS = 300
+    MAX_WORKER_RSS_MB = 2048  # sandboxed transform workers above this are killed
+    MAX_FILE_INPUT_MB = 4096  # inputs a worker reads from disk; its memory is bounded by MAX_WORKER_RSS_MB
     
     # Cache settings
     MAX_CACHE_ENTRIES = 1000
     CACHE_EXPIRY_HOURS = 24
+    MAX_CACHED_DOCUMENTS = 16  # parsed input documents kept for re-transformation
+    MAX_CACHED_PATTERNS = 512  # regexes built around an element name, kept compiled
+    MAX_CACHED_INDEXES = 32  # element span indexes of recently analyzed stylesheet versions
+    MAX_CACHED_ANALYSES = 64  # pattern analyses kept in memory; all are also stored on disk
+    MAX_ANALYSIS_CACHE_MB = 64  # least recently used stored analyses are removed beyond this
+    MAX_CACHED_COVERAGE = 16  # stylesheets whose per-input template coverage is kept, each for its whole corpus
+    
+    # Saxon processor pool (None uses one processor per CPU core)
+    SAXON_POOL_SIZE = None
+    WARM_UP_STYLESHEETS = 20  # most used stored stylesheets compiled into every processor at start-up
+    MAX_STORED_STYLESHEETS = 200  # least used stylesheets are evicted from the persistent store beyond this
+    STORE_FLUSH_SECONDS = 30  # how often use counts of stored stylesheets are written to disk
+    
+    # XSLT 1.0 stylesheets move to libxslt once this many transforms matched Saxon's output
+    LIBXSLT_FAST_PATH = True
+    ENGINE_EQUIVALENCE_SAMPLE = 3
+    ENGINE_RECHECK_INTERVAL = 100  # after moving, every this many transforms are compared with Saxon again
+    MAX_CACHED_LIBXSLT_STYLESHEETS = 64  # compiled libxslt stylesheets kept per thread
+    
+    # Local transform server
+    SERVER_PORT = 8765
+    SERVER_PROCESSORS_PER_WORKER = 2  # sandboxed transform workers, one Saxon processor each, per server process
+    SERVER_RELOAD_INTERVAL_SECONDS = 1.0  # how often a served stylesheet file is checked for changes
     
     # Chunking limits
     MAX_CHUNK_SIZE_CHARS = 50000
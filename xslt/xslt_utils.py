@@ -1,34 +1,163 @@
-import re
 import json
+import codecs
 import saxonche
 from difflib import Differ
 from genie_core.llm.llm_utils import setup_agent, show_stats
+from genie_core.xslt.stylesheet_cache import (compiled_stylesheet_cache, content_hash, parsed_document_cache,
+                                             stylesheet_cache_key, transform_cache_key, transform_result_cache)
+from genie_core.xslt.analysis_cache import analysis_cache
+from genie_core.xslt.module_resolver import module_references, module_resolver
+from genie_core.xslt.regex_registry import regex_registry
+from genie_core.xslt.saxon_pool import saxon_pool
+from genie_core.xslt.stylesheet_store import stylesheet_store
+from genie_core.xslt.transform_engines import LIBXSLT, TRIAL, engine_selector
+from genie_core.xslt.xslt_updater_config import PerformanceConfig
 from pathlib import Path
 import os
+import time
 
-def apply_xslt(xslt, xml, logs, parameters=None):
+def apply_xslt(xslt, xml, logs, parameters=None, output_bytes=False):
     """
     Apply XSLT transformation to XML.
     
+    Global xsl:param values are bound on the compiled stylesheet, so every
+    parameter set reuses one cached executable. Values are XPath expressions,
+    exactly as they would appear in the param's select attribute.
+    
+    Inputs given as a Path are parsed by Saxon straight from disk. Bytes and
+    buffers (including mmap objects) are decoded once, using their byte order
+    mark or declared encoding, instead of the caller decoding them first.
+    
+    XSLT 1.0 stylesheets run on libxslt once the engine selector has seen it
+    give byte-identical output to Saxon, faster, on a sample of inputs; a share
+    of later transforms is still run on both and compared.
+    
     Args:
     xslt (str): XSLT stylesheet
-    xml (str): XML content
+    xml (str, bytes, memoryview, mmap.mmap or Path): XML content, or the path of an XML file
     logs (list): List to store log messages
-    parameters (dict, optional): Parameters for XSLT transformation
+    parameters (dict or pandas.DataFrame, optional): Parameters for XSLT transformation
+    output_bytes (bool, optional): Return the output encoded as declared by xsl:output (default UTF-8)
     
     Returns:
     list: [transformed_xml, logs] or [None, logs] if an error occurs
     """
-    if parameters is not None:
-        xslt = replace_parameters(xslt, parameters) 
+    xslt, parameter_values = prepare_parameters(xslt, parameters)
+    stylesheet_key = module_resolver.bundle_hash(xslt)
+    engine = engine_selector.engine_for(xslt, stylesheet_key)
 
     try:
-        processor = saxonche.PySaxonProcessor(license=False)
-        document = processor.parse_xml(xml_text=xml)
-        xslt30_processor = processor.new_xslt30_processor()
-        compiled_xslt = xslt30_processor.compile_stylesheet(stylesheet_text=xslt)
-        transformed_xml = compiled_xslt.transform_to_string(xdm_node=document) # Can pass parameters too
+        transformed_xml = None
+        libxslt_error = None
+        if engine == LIBXSLT:
+            try:
+                transformed_xml = engine_selector.libxslt.transform(xslt, stylesheet_key, xml, parameter_values)
+            except Exception as e:
+                # Saxon decides whether the input is really at fault
+                libxslt_error = e
+        if transformed_xml is None:
+            with saxon_pool.lease() as slot:
+                compiled_xslt = compile_xslt(slot, xslt)
+                started = time.perf_counter()
+                document = parse_xml_cached(slot, xml)
+                bind_parameters(slot, compiled_xslt, document, parameter_values, xslt)
+                try:
+                    transformed_xml = compiled_xslt.transform_to_string(xdm_node=document)
+                finally:
+                    compiled_xslt.clear_parameters()
+                saxon_ms = (time.perf_counter() - started) * 1000
+            if libxslt_error is not None:
+                engine_selector.reject(stylesheet_key, f"libxslt failed where Saxon succeeded: {libxslt_error}")
+            if engine == TRIAL:
+                engine_selector.run_trial(xslt, stylesheet_key, xml, parameter_values, transformed_xml, saxon_ms)
+        if output_bytes:
+            transformed_xml = encode_output(xslt, transformed_xml)
+        return [transformed_xml, logs]
+    except saxonche.PySaxonApiError as e:
+        print(f"An error occurred during the XSLT transformation: {e}")
+        logs.append(f"An error occurred during the XSLT transformation: {e}")
+        return [None, logs]
+    except Exception as e:
+        print(f"An unexpected error occurred: {e}")
+        logs.append(f"An unexpected error occurred: {e}")
+        return [None, logs]
+
+
+def apply_xslt_memoized(xslt, xml, logs, parameters=None):
+    """
+    Apply XSLT transformation to XML, reusing the output of an identical earlier transform.
+    
+    Outputs are keyed by the stylesheet, input and parameter hashes, so a cached
+    output is only reused while all three are unchanged. The stylesheet hash
+    covers included and imported modules. Failed transforms are not cached.
+    
+    Args:
+    xslt (str): XSLT stylesheet
+    xml (str): XML content
+    logs (list): List to store log messages
+    parameters (dict or pandas.DataFrame, optional): Parameters for XSLT transformation
+    
+    Returns:
+    list: [transformed_xml, logs] or [None, logs] if an error occurs
+    """
+    cache_key = transform_cache_key(module_resolver.bundle_hash(xslt), xml, parameters)
+    transformed_xml = transform_result_cache.get(cache_key)
+    if transformed_xml is not None:
         return [transformed_xml, logs]
+
+    transformed_xml, logs = apply_xslt(xslt, xml, logs, parameters)
+    if transformed_xml is not None:
+        transform_result_cache.put(cache_key, transformed_xml)
+    return [transformed_xml, logs]
+
+
+def apply_xslt_to_file(xslt, source_file, output_file, logs, parameters=None):
+    """
+    Apply XSLT transformation from an XML file straight to an output file.
+    
+    Saxon reads the input and writes the result itself, so neither document is
+    held as a Python string. Where the stylesheet declares a streamable mode and
+    the Saxon edition supports streaming (EE), the input is eligible for streaming;
+    Saxon does not report whether it actually streamed, so the report only says
+    that it could have.
+    
+    Args:
+    xslt (str): XSLT stylesheet
+    source_file (str or Path): Path of the XML input
+    output_file (str or Path): Path the transformed XML is written to
+    logs (list): List to store log messages
+    parameters (dict, optional): Parameters for XSLT transformation
+    
+    Returns:
+    list: [report, logs] where report describes the output and whether it was eligible for streaming, or [None, logs] if an error occurs
+    """
+    xslt, parameter_values = prepare_parameters(xslt, parameters)
+
+    streamable_declared = is_streamable_stylesheet(xslt)
+    try:
+        with saxon_pool.lease() as slot:
+            compiled_xslt = compile_xslt(slot, xslt)
+            streaming_supported = 'EE' in (slot.processor.version or '')
+            bind_parameters(slot, compiled_xslt, None, parameter_values, xslt)
+            try:
+                compiled_xslt.transform_to_file(source_file=str(source_file), output_file=str(output_file))
+            finally:
+                compiled_xslt.clear_parameters()
+
+        if not streamable_declared:
+            reason = "Stylesheet does not declare a streamable mode (<xsl:mode streamable=\"yes\"/>)"
+        elif not streaming_supported:
+            reason = "Streaming requires Saxon-EE; the file was transformed without building a Python string"
+        else:
+            reason = "Stylesheet and Saxon edition allow streaming, so Saxon can stream the input"
+        report = {
+            'output_file': str(output_file),
+            'output_size_bytes': os.path.getsize(output_file),
+            'streamable_declared': streamable_declared,
+            'streaming_eligible': streamable_declared and streaming_supported,
+            'reason': reason
+        }
+        return [report, logs]
     except saxonche.PySaxonApiError as e:
         print(f"An error occurred during the XSLT transformation: {e}")
         logs.append(f"An error occurred during the XSLT transformation: {e}")
@@ -39,6 +168,380 @@ def apply_xslt(xslt, xml, logs, parameters=None):
         return [None, logs]
 
 
+def is_streamable_stylesheet(xslt):
+    """
+    Check whether a stylesheet declares a streamable mode.
+    
+    Args:
+    xslt (str): XSLT stylesheet
+    
+    Returns:
+    bool: True if an xsl:mode with streamable="yes" is declared
+    """
+    return regex_registry.config('STREAMABLE_MODE_PATTERN').search(xslt) is not None
+
+
+def prepare_parameters(xslt, parameters):
+    """
+    Decide how parameters are applied to a stylesheet.
+    
+    Parameters that are all global xsl:params are returned for binding on the
+    compiled stylesheet. If any of them is local to a template it cannot be set
+    from outside, and a value that refers to a variable needs the stylesheet's
+    global variables in scope, so in both cases the values are written into the
+    stylesheet text instead.
+    
+    Args:
+    xslt (str): XSLT stylesheet
+    parameters (dict or pandas.DataFrame, optional): Parameter values by name, or the positional DataFrame used by replace_parameters
+    
+    Returns:
+    tuple: (xslt, parameter_values) with the stylesheet to compile and the values to bind
+    """
+    parameter_values = parameters_to_dict(xslt, parameters)
+    if parameter_values and (not set(parameter_values) <= set(get_global_parameter_names(xslt))
+                             or any(regex_registry.config('VARIABLE_PATTERN').search(str(value))
+                                    for value in parameter_values.values())):
+        return rewrite_parameters(xslt, parameter_values), {}
+    return xslt, parameter_values
+
+
+def parameters_to_dict(xslt, parameters):
+    """
+    Normalize parameters to a dict of name to select expression.
+    
+    Args:
+    xslt (str): XSLT stylesheet the parameters belong to
+    parameters (dict, list or pandas.DataFrame, optional): Values by name, [name, value] pairs as returned by get_parameters, or a DataFrame with a "Parameter Value" column ordered like the xsl:param declarations
+    
+    Returns:
+    dict: Parameter values keyed by parameter name
+    """
+    if parameters is None:
+        return {}
+    if isinstance(parameters, (dict, list, tuple)):
+        return dict(parameters)
+
+    names = [name for name, _ in parse_parameter_declarations(xslt)]
+    values = dict(zip(parameters.index, parameters["Parameter Value"]))
+    return {name: values[j] for j, name in enumerate(names) if j in values}
+
+
+def parse_parameter_declarations(xslt):
+    """
+    Extract xsl:param declarations from XSLT text.
+    
+    Args:
+    xslt (str): XSLT stylesheet
+    
+    Returns:
+    list: [name, select] pairs in document order, select is None when absent
+    """
+    declarations = []
+    for line in xslt.split("\n"):
+        if "xsl:param name" in line:
+            quoted = regex_registry.compile(r"\"([^\"]*)\"").findall(line)
+            if quoted:
+                declarations.append([quoted[0], quoted[1] if len(quoted) > 1 else None])
+    return declarations
+
+
+def get_global_parameter_names(xslt):
+    """
+    Get the names of top-level xsl:param declarations.
+    
+    Args:
+    xslt (str): XSLT stylesheet
+    
+    Returns:
+    list: Names of parameters declared outside any template or function
+    """
+    names = []
+    depth = 0
+    for match in regex_registry.compile(r'<(/?)xsl:(template|function|param)\b([^>]*?)(/?)>').finditer(xslt):
+        closing, element, attributes, self_closing = match.groups()
+        if element == 'param':
+            if not closing and depth == 0:
+                name = regex_registry.compile(r'name\s*=\s*["\']([^"\']*)["\']').search(attributes)
+                if name:
+                    names.append(name.group(1))
+        elif closing:
+            depth = max(0, depth - 1)
+        elif not self_closing:
+            depth += 1
+    return names
+
+
+def stylesheet_namespaces(xslt):
+    """
+    Get the namespace prefixes declared on the xsl:stylesheet or xsl:transform element.
+    
+    Args:
+    xslt (str): XSLT stylesheet
+    
+    Returns:
+    dict: Namespace URIs keyed by prefix
+    """
+    start_tag = regex_registry.config('XSL_STYLESHEET_START_PATTERN').search(xslt)
+    if not start_tag:
+        return {}
+    return dict(regex_registry.config('NAMESPACE_DECLARATION_PATTERN').findall(start_tag.group(0)))
+
+
+def bind_parameters(slot, compiled_xslt, document, parameter_values, xslt=None):
+    """
+    Bind parameter values on a compiled stylesheet.
+    
+    Each value is evaluated as an XPath expression, with the input document as
+    context item when available and the stylesheet's namespace prefixes declared,
+    matching how a select attribute is evaluated. Values that refer to variables
+    never get here, see prepare_parameters.
+    
+    Args:
+    slot (SaxonSlot): Leased pool slot that owns the compiled stylesheet
+    compiled_xslt (saxonche.PyXsltExecutable): Compiled stylesheet
+    document (saxonche.PyXdmNode or None): Parsed input document
+    parameter_values (dict): Select expressions keyed by parameter name
+    xslt (str, optional): Stylesheet text, for the namespace prefixes the values may use
+    """
+    if not parameter_values:
+        return
+    xpath_processor = slot.processor.new_xpath_processor()
+    for prefix, uri in stylesheet_namespaces(xslt or '').items():
+        xpath_processor.declare_namespace(prefix, uri)
+    if document is not None:
+        xpath_processor.set_context(xdm_item=document)
+    for name, expression in parameter_values.items():
+        value = xpath_processor.evaluate(str(expression))
+        compiled_xslt.set_parameter(name, value if value is not None else saxonche.PyXdmValue())
+
+
+def compile_xslt(slot, xslt, store=True):
+    """
+    Compile an XSLT stylesheet, reusing a cached executable for identical content.
+    
+    Stylesheets that compile are kept in the persistent stylesheet store, which
+    records their use for the start-up warm-up. Stylesheets with xsl:include or
+    xsl:import are compiled against the module root instead, keyed by the hash of
+    all their modules, so editing a module only recompiles its dependents.
+    
+    Args:
+    slot (SaxonSlot): Leased pool slot whose processor compiles and owns the executable
+    xslt (str): XSLT stylesheet
+    store (bool, optional): Keep the stylesheet in the persistent store; False for transient copies such as instrumented stylesheets
+    
+    Returns:
+    saxonche.PyXsltExecutable: Compiled stylesheet
+    """
+    if module_references(xslt):
+        cache_key = f"{slot.cache_prefix}:{module_resolver.bundle_hash(xslt)}"
+        return compiled_stylesheet_cache.get_or_create(cache_key, lambda: module_resolver.compile(slot, xslt))
+
+    key = stylesheet_cache_key(xslt)
+    if not store:
+        return compiled_stylesheet_cache.get_or_create(
+            f"{slot.cache_prefix}:{key}", lambda: slot.xslt30_processor.compile_stylesheet(stylesheet_text=xslt))
+
+    def compile_stylesheet():
+        return stylesheet_store.compile(slot, xslt, key)
+
+    stylesheet_store.note_use(key)
+    return compiled_stylesheet_cache.get_or_create(f"{slot.cache_prefix}:{key}", compile_stylesheet)
+
+
+def warm_up_stylesheets(limit=PerformanceConfig.WARM_UP_STYLESHEETS, timeout=0.1):
+    """
+    Compile the most used stored stylesheets into every idle processor of the pool.
+    
+    Args:
+    limit (int): Maximum number of stylesheets to compile
+    timeout (float): Seconds to wait for each processor; busy processors are skipped
+    
+    Returns:
+    dict: Number of stylesheets and processors warmed up, and compile failures
+    """
+    stylesheets = stylesheet_store.most_used(limit)
+    slots = []
+    failures = 0
+    try:
+        for _ in range(saxon_pool.size if stylesheets else 0):
+            try:
+                slots.append(saxon_pool.acquire(timeout=timeout))
+            except TimeoutError:
+                break
+        for slot in slots:
+            for key, xslt in stylesheets:
+                try:
+                    compiled_stylesheet_cache.get_or_create(f"{slot.cache_prefix}:{key}",
+                                                            lambda: stylesheet_store.compile(slot, xslt, key))
+                except Exception:
+                    failures += 1
+    finally:
+        for slot in slots:
+            saxon_pool.release(slot)
+    return {'stylesheets': len(stylesheets), 'processors': len(slots), 'failures': failures}
+
+
+def parse_xml_cached(slot, xml):
+    """
+    Parse an XML input, reusing the parsed document for identical content.
+    
+    Files are identified by path, modification time and size, so they are not
+    read by Python at all. Bytes and buffers are hashed in place and only
+    decoded when the document is not cached.
+    
+    Args:
+    slot (SaxonSlot): Leased pool slot whose processor parses and owns the document
+    xml (str, bytes, memoryview, mmap.mmap or Path): XML content, or the path of an XML file
+    
+    Returns:
+    saxonche.PyXdmNode: Parsed document
+    """
+    if isinstance(xml, os.PathLike):
+        path = os.path.abspath(os.fspath(xml))
+        stat = os.stat(path)
+        cache_key = f"{slot.cache_prefix}:file:{path}:{stat.st_mtime_ns}:{stat.st_size}"
+        return parsed_document_cache.get_or_create(cache_key, lambda: slot.processor.parse_xml(xml_file_name=path))
+
+    def parse_document():
+        xml_text = xml if isinstance(xml, str) else decode_xml_bytes(xml)
+        return slot.processor.parse_xml(xml_text=xml_text)
+
+    cache_key = f"{slot.cache_prefix}:{content_hash(xml)}"
+    return parsed_document_cache.get_or_create(cache_key, parse_document)
+
+
+def decode_xml_bytes(data):
+    """
+    Decode an XML input held as bytes, honouring its byte order mark or declared encoding.
+    
+    Args:
+    data (bytes, bytearray, memoryview or mmap.mmap): Encoded XML document
+    
+    Returns:
+    str: XML text without a byte order mark
+    """
+    header = bytes(data[:4])
+    if header.startswith(codecs.BOM_UTF8):
+        encoding = 'utf-8-sig'
+    elif header.startswith((codecs.BOM_UTF32_LE, codecs.BOM_UTF32_BE)):
+        encoding = 'utf-32'
+    elif header.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        encoding = 'utf-16'
+    elif header.startswith(b'<\x00?\x00'):
+        encoding = 'utf-16-le'
+    elif header.startswith(b'\x00<\x00?'):
+        encoding = 'utf-16-be'
+    else:
+        # The declaration itself is ASCII in every ASCII-compatible encoding
+        declaration = regex_registry.config('XML_DECLARED_ENCODING_PATTERN').match(bytes(data[:256]).decode('latin-1'))
+        encoding = declaration.group(1) if declaration else 'utf-8'
+    return str(data, encoding)
+
+
+def encode_output(xslt, transformed_xml):
+    """
+    Encode a transformation result as declared by the stylesheet's xsl:output.
+    
+    Args:
+    xslt (str): XSLT stylesheet
+    transformed_xml (str): Transformation result
+    
+    Returns:
+    bytes: Result in the xsl:output encoding, UTF-8 if none is declared
+    """
+    declaration = regex_registry.config('XSL_OUTPUT_ENCODING_PATTERN').search(xslt)
+    encoding = declaration.group(1) if declaration else 'utf-8'
+    return transformed_xml.encode(encoding, errors='xmlcharrefreplace')
+
+
+# Media types of the xsl:output methods, used when the stylesheet does not declare one
+OUTPUT_MEDIA_TYPES = {
+    'xml': 'application/xml',
+    'html': 'text/html',
+    'xhtml': 'application/xhtml+xml',
+    'text': 'text/plain',
+    'json': 'application/json',
+    'adaptive': 'text/plain'
+}
+
+
+def output_content_type(xslt):
+    """
+    Content type of a transformation result as declared by the stylesheet's xsl:output.
+    
+    Args:
+    xslt (str): XSLT stylesheet
+    
+    Returns:
+    str: The declared media-type, or the one of the output method (default xml), with the output encoding as charset
+    """
+    media_type = regex_registry.config('XSL_OUTPUT_MEDIA_TYPE_PATTERN').search(xslt)
+    method = regex_registry.config('XSL_OUTPUT_METHOD_PATTERN').search(xslt)
+    encoding = regex_registry.config('XSL_OUTPUT_ENCODING_PATTERN').search(xslt)
+    if media_type:
+        content_type = media_type.group(1).strip()
+    else:
+        content_type = OUTPUT_MEDIA_TYPES.get(method.group(1).strip() if method else 'xml', 'application/xml')
+    return f"{content_type}; charset={encoding.group(1) if encoding else 'utf-8'}"
+
+
+def get_xslt_cache_stats():
+    """
+    Get hit/miss/eviction counters of the compiled stylesheet cache.
+    
+    Returns:
+    dict: Cache counters plus the current number of entries, with the transform
+    result and parsed document caches nested under their own keys
+    """
+    stats = compiled_stylesheet_cache.stats.as_dict()
+    stats['entries'] = len(compiled_stylesheet_cache)
+    for name, cache in (('transform_results', transform_result_cache), ('parsed_documents', parsed_document_cache)):
+        stats[name] = cache.stats.as_dict()
+        stats[name]['entries'] = len(cache)
+    return stats
+
+
+def get_transform_engine_stats():
+    """
+    Count the stylesheets running on each transform engine.
+    
+    Returns:
+    dict: Stylesheets decided for libxslt and Saxon, and those still in trial
+    """
+    return engine_selector.as_dict()
+
+
+def get_regex_stats():
+    """
+    Report compile counts and match time of the shared regular expressions.
+    
+    Returns:
+    dict: Totals plus the patterns and element templates with the most match time
+    """
+    return regex_registry.as_dict()
+
+
+def get_analysis_stats():
+    """
+    Report how pattern analyses were served and the time spent on them.
+    
+    Returns:
+    dict: Memory and disk cache hits, analyses run and their total and last durations
+    """
+    return analysis_cache.as_dict()
+
+
+def get_saxon_pool_health():
+    """
+    Run a health check on the shared Saxon processor pool.
+    
+    Returns:
+    dict: Pool size, usage counters and number of processors replaced
+    """
+    return saxon_pool.health_check()
+
+
 def save_generated_xslt(file_name, directory = None):
     """
     Save generated XSLT to a file.
@@ -193,7 +696,7 @@ def get_parameters(uploaded_xslt):
     parameter_lines = []
     for line in generated_xslt:
         if "xsl:param name" in line:
-            split_line = re.split(r"(\"[^\"]*\")",  line)
+            split_line = regex_registry.compile(r"(\"[^\"]*\")").split(line)
             parameter_lines.append(split_line)
             param_names.append([split_line[1].split("\"")[1], split_line[3].split("\"")[1]])
     
@@ -217,7 +720,7 @@ def replace_parameters(generated_xslt, new_parameters):
     for i, line in enumerate(generated_xslt_split):
         if "xsl:param name" in line:
             new_param = new_parameters.loc[new_parameters.index == j, "Parameter Value"].item()
-            split_line = re.split(r"(\"[^\"]*\")",  line)
+            split_line = regex_registry.compile(r"(\"[^\"]*\")").split(line)
             split_line[3] = f"\"{new_param}\""
             print(split_line)
             new_line = "".join(split_line)
@@ -226,6 +729,29 @@ def replace_parameters(generated_xslt, new_parameters):
             
     return "\n".join(generated_xslt_split)
 
+def rewrite_parameters(generated_xslt, parameter_values):
+    """
+    Write parameter values into the select attribute of their xsl:param declarations.
+    
+    Args:
+    generated_xslt (str): XSLT content with parameters
+    parameter_values (dict): New select expressions keyed by parameter name
+    
+    Returns:
+    str: XSLT content with updated parameter values
+    """
+    generated_xslt_split = generated_xslt.split("\n")
+
+    for i, line in enumerate(generated_xslt_split):
+        if "xsl:param name" in line:
+            split_line = regex_registry.compile(r"(\"[^\"]*\")").split(line)
+            name = split_line[1].strip("\"")
+            if name in parameter_values and len(split_line) > 3:
+                split_line[3] = f"\"{parameter_values[name]}\""
+                generated_xslt_split[i] = "".join(split_line)
+
+    return "\n".join(generated_xslt_split)
+
 def read_xslt(xslt):
     """
     Read XSLT content from a file.